@@ -302,12 +302,15 @@ private function parseBinaryFormat(string $data): ?array
      * Payload structure for trigger/heartbeat (0x01, 0x02):
      * - Height: 2 bytes (mm)
      * - GPS selection: 1 byte (0x01 = has GPS, 0x00 = no GPS)
-     * - Longitude: 4 bytes (float, IEEE-754) [if GPS selection = 0x01]
-     * - Latitude: 4 bytes (float, IEEE-754) [if GPS selection = 0x01]
+     * - Longitude: 4 bytes (float, IEEE-754, big-endian) [if GPS selection = 0x01]
+     * - Latitude: 4 bytes (float, IEEE-754, big-endian) [if GPS selection = 0x01]
      * - Temperature: 1 byte (℃)
      * - Status (Full/Fire/Power): 2 bytes
      * - Battery Voltage: 2 bytes (unit: 10mV)
-     * - RSRP: 4 bytes (float, IEEE-754)
+     * - RSRP: 4 bytes (float, IEEE-754, big-endian)
+     *
+     * Like the integers, floats are big-endian: unpack('G'), not the
+     * machine-order unpack('f') (byte-swapped on x86).
      * - Frame Count: 2 bytes
      * - Timestamp: 4 bytes (Unix time)
      * - Device ID: 8 bytes (1 + IMEI)
@@ -344,12 +347,12 @@ private function parsePayload(string $payload, int $reportType): ?array
                 // If GPS is included, parse longitude and latitude
                 if ($gpsSelection === 0x01 && $offset + 8 <= $length) {
                     // Longitude (4 bytes, float)
-                    $longitude = unpack('f', substr($payload, $offset, 4))[1];
+                    $longitude = unpack('G', substr($payload, $offset, 4))[1];
                     $parsed['longitude'] = $longitude;
                     $offset += 4;
 
                     // Latitude (4 bytes, float)
-                    $latitude = unpack('f', substr($payload, $offset, 4))[1];
+                    $latitude = unpack('G', substr($payload, $offset, 4))[1];
                     $parsed['latitude'] = $latitude;
                     $offset += 4;
                 }
@@ -380,7 +383,7 @@ private function parsePayload(string $payload, int $reportType): ?array
 
             // RSRP (4 bytes, float)
             if ($offset + 4 <= $length) {
-                $parsed['rsrp'] = unpack('f', substr($payload, $offset, 4))[1];
+                $parsed['rsrp'] = unpack('G', substr($payload, $offset, 4))[1];
                 $offset += 4;
             }
 
@@ -6,13 +6,25 @@
 use App\Models\Sensor;
 use App\Models\SensorReading;
 use App\Models\Tank;
+use App\Services\DingtekThingsBoardService;
 use App\Services\FirebaseService;
 use Illuminate\Http\Request;
+use Illuminate\Support\Facades\Cache;
 use Illuminate\Support\Facades\Log;
 use Illuminate\Support\Facades\Validator;
 
 class SensorController extends Controller
 {
+    /**
+     * Maximum readings accepted by one bulk request (MAX_BATCH in scripts/df555/forwarder.py)
+     */
+    private const BULK_MAX_READINGS = 200;
+
+    /**
+     * Seconds a bulk reading's report_key is remembered (DEDUP_WINDOW in scripts/df555/dedup.py)
+     */
+    private const REPORT_KEY_TTL = 3600;
+
     /**
      * Receive data from Dingtek DF555 Ultrasonic Level Sensor
      * This endpoint is designed to handle TCP data transmission from GPRS/4G sensors
@@ -85,6 +97,221 @@ public function receiveDingtekData(Request $request)
         }
     }
 
+    /**
+     * Receive a batch of readings from the TCP gateway
+     *
+     * Body: {"readings": [{device_id, distance, temperature, battery, rssi, timestamp, ...}, ...]}
+     * with battery as a percentage; optional fields may be null.
+     *
+     * Each sensor is looked up once per batch and Firebase is only synced
+     * with the latest reading of each tank. A gateway that publishes the tank
+     * state to Firebase itself sends "sync_firebase": false on the readings
+     * it publishes (or on the whole batch) to skip the sync for them.
+     *
+     * Gateway worker processes each drop the duplicates they see themselves,
+     * but the two copies of a dual-server report may reach different workers.
+     * Those send each report's "report_key", and a key already seen (in the
+     * shared cache) marks the reading as a duplicate that is not stored.
+     *
+     * The response lists the id of each stored reading in request order
+     * ("ids", null for rejected and duplicate readings).
+     */
+    public function receiveDingtekBulk(Request $request)
+    {
+        $validator = Validator::make($request->all(), [
+            'readings' => 'required|array|min:1|max:' . self::BULK_MAX_READINGS,
+            'readings.*.device_id' => 'required|string',
+            'readings.*.distance' => 'sometimes|numeric',
+            'readings.*.level' => 'sometimes|numeric',
+            'readings.*.temperature' => 'sometimes|nullable|numeric',
+            'readings.*.battery' => 'sometimes|nullable|numeric',
+            'readings.*.rssi' => 'sometimes|nullable|numeric',
+            'readings.*.timestamp' => 'sometimes|date',
+            'readings.*.sync_firebase' => 'sometimes|boolean',
+            'readings.*.report_key' => 'sometimes|nullable|string|max:100',
+            'sync_firebase' => 'sometimes|boolean',
+        ]);
+
+        if ($validator->fails()) {
+            Log::warning('Dingtek bulk data validation failed', [
+                'errors' => $validator->errors(),
+                'count' => is_array($request->input('readings')) ? count($request->input('readings')) : 0,
+            ]);
+
+            return response()->json([
+                'error' => 'Validation failed',
+                'messages' => $validator->errors()
+            ], 400);
+        }
+
+        $reportKey = null;
+
+        try {
+            $accepted = 0;
+            $rejected = 0;
+            $duplicates = 0;
+            $sensors = [];
+            $latestReadings = [];
+            $ids = [];
+            $syncFirebase = $request->boolean('sync_firebase', true);
+
+            foreach ($request->input('readings') as $payload) {
+                $deviceId = $payload['device_id'];
+
+                if (!array_key_exists($deviceId, $sensors)) {
+                    $sensors[$deviceId] = $this->findOrCreateSensor($deviceId, $request->ip());
+                }
+                $sensor = $sensors[$deviceId];
+                $reading = $this->extractReadingFromArray($payload);
+
+                if (!$sensor || empty($reading)) {
+                    $ids[] = null;
+                    $rejected++;
+                    continue;
+                }
+
+                $reportKey = empty($payload['report_key']) ? null : 'dingtek:report:' . $payload['report_key'];
+                if ($reportKey && !Cache::add($reportKey, true, self::REPORT_KEY_TTL)) {
+                    $reportKey = null;
+                    $ids[] = null;
+                    $duplicates++;
+                    continue;
+                }
+
+                $sensorReading = $this->storeSensorReading($sensor, $reading, false);
+
+                if (!$sensorReading) {
+                    if ($reportKey) {
+                        Cache::forget($reportKey);
+                    }
+                    $reportKey = null;
+                    $ids[] = null;
+                    $rejected++;
+                    continue;
+                }
+                $reportKey = null;
+
+                $ids[] = $sensorReading->id;
+                $accepted++;
+                // A tank whose latest reading the gateway publishes is not synced here
+                $sync = filter_var($payload['sync_firebase'] ?? $syncFirebase, FILTER_VALIDATE_BOOLEAN);
+                $latestReadings[$sensorReading->tank_id] = $sync ? $sensorReading : null;
+            }
+
+            foreach ($sensors as $sensor) {
+                if ($sensor) {
+                    $sensor->update(['last_seen' => now()]);
+                }
+            }
+
+            foreach (array_filter($latestReadings) as $sensorReading) {
+                $this->syncWithFirebase($sensorReading);
+            }
+
+            Log::info('Dingtek bulk data processed', [
+                'accepted' => $accepted,
+                'rejected' => $rejected,
+                'duplicates' => $duplicates,
+                'sensors' => count($sensors),
+            ]);
+
+            return response()->json([
+                'status' => 'success',
+                'accepted' => $accepted,
+                'rejected' => $rejected,
+                'duplicates' => $duplicates,
+                'ids' => $ids,
+                'timestamp' => now()->toISOString()
+            ], 200);
+
+        } catch (\Exception $e) {
+            // The gateway retries the batch; the reading that failed is not a duplicate then
+            if ($reportKey) {
+                Cache::forget($reportKey);
+            }
+
+            Log::error('Error processing Dingtek bulk data', [
+                'error' => $e->getMessage(),
+                'trace' => $e->getTraceAsString(),
+            ]);
+
+            return response()->json([
+                'status' => 'error',
+                'message' => 'Internal server error'
+            ], 500);
+        }
+    }
+
+    /**
+     * Receive latest Dingtek ThingsBoard telemetry fetched by the Python sync worker
+     *
+     * Body: {"devices": [{"device": {"id": {"id": ...}, "name": ..., "type": ...},
+     *                     "telemetry": {key: [{ts, value}], ...}}, ...]}
+     * with device and telemetry exactly as ThingsBoard returned them.
+     *
+     * Each device goes through DingtekThingsBoardService like a device of
+     * `php artisan dingtek:sync`, so sensors are keyed, created and updated
+     * the same way whichever side talks to the cloud.
+     */
+    public function receiveDingtekTelemetry(Request $request, DingtekThingsBoardService $dingtekService)
+    {
+        $validator = Validator::make($request->all(), [
+            'devices' => 'required|array|min:1|max:' . self::BULK_MAX_READINGS,
+            'devices.*.device' => 'required|array',
+            'devices.*.device.id.id' => 'required|string',
+            'devices.*.telemetry' => 'required|array',
+        ]);
+
+        if ($validator->fails()) {
+            Log::warning('Dingtek telemetry validation failed', [
+                'errors' => $validator->errors(),
+                'count' => is_array($request->input('devices')) ? count($request->input('devices')) : 0,
+            ]);
+
+            return response()->json([
+                'error' => 'Validation failed',
+                'messages' => $validator->errors()
+            ], 400);
+        }
+
+        $results = [
+            'synced' => 0,
+            'failed' => 0,
+            'errors' => []
+        ];
+
+        foreach ($request->input('devices') as $entry) {
+            try {
+                $dingtekService->syncTelemetry($entry['device'], $entry['telemetry']);
+                $results['synced']++;
+            } catch (\Exception $e) {
+                $results['failed']++;
+                $results['errors'][] = [
+                    'device_id' => $entry['device']['id']['id'],
+                    'error' => $e->getMessage()
+                ];
+
+                Log::error('Failed to process Dingtek telemetry', [
+                    'device_id' => $entry['device']['id']['id'],
+                    'error' => $e->getMessage()
+                ]);
+            }
+        }
+
+        Log::info('Dingtek telemetry processed', [
+            'synced' => $results['synced'],
+            'failed' => $results['failed'],
+        ]);
+
+        return response()->json([
+            'status' => 'success',
+            'synced' => $results['synced'],
+            'failed' => $results['failed'],
+            'errors' => $results['errors'],
+            'timestamp' => now()->toISOString()
+        ], 200);
+    }
+
     /**
      * Process and store sensor data
      */
@@ -249,27 +476,7 @@ private function extractSensorReadings(Request $request, $jsonData, $rawData)
 
         // Handle JSON format
         if ($jsonData) {
-            $reading = [];
-
-            if (isset($jsonData['level'])) {
-                $reading['level'] = $jsonData['level'];
-            }
-
-            if (isset($jsonData['distance'])) {
-                $reading['distance'] = $jsonData['distance'];
-            }
-
-            if (isset($jsonData['temperature'])) {
-                $reading['temperature'] = $jsonData['temperature'];
-            }
-
-            if (isset($jsonData['battery'])) {
-                $reading['battery_level'] = $jsonData['battery'];
-            }
-
-            if (isset($jsonData['timestamp'])) {
-                $reading['timestamp'] = $jsonData['timestamp'];
-            }
+            $reading = $this->extractReadingFromArray($jsonData);
 
             if (!empty($reading)) {
                 $readings[] = $reading;
@@ -312,10 +519,44 @@ private function extractSensorReadings(Request $request, $jsonData, $rawData)
         return $readings;
     }
 
+    /**
+     * Extract a single reading from a decoded JSON payload
+     */
+    private function extractReadingFromArray(array $data): array
+    {
+        $reading = [];
+
+        if (isset($data['level'])) {
+            $reading['level'] = $data['level'];
+        }
+
+        if (isset($data['distance'])) {
+            $reading['distance'] = $data['distance'];
+        }
+
+        if (isset($data['temperature'])) {
+            $reading['temperature'] = $data['temperature'];
+        }
+
+        if (isset($data['battery'])) {
+            $reading['battery_level'] = $data['battery'];
+        }
+
+        if (isset($data['rssi'])) {
+            $reading['rssi'] = $data['rssi'];
+        }
+
+        if (isset($data['timestamp'])) {
+            $reading['timestamp'] = $data['timestamp'];
+        }
+
+        return $reading;
+    }
+
     /**
      * Store sensor reading in database
      */
-    private function storeSensorReading(Sensor $sensor, array $reading)
+    private function storeSensorReading(Sensor $sensor, array $reading, bool $syncFirebase = true)
     {
         // Get the tank associated with this sensor
         $tank = $sensor->tank;
@@ -367,7 +608,9 @@ private function storeSensorReading(Sensor $sensor, array $reading)
         $sensorReading->save();
 
         // Sync with Firebase Realtime Database
-        $this->syncWithFirebase($sensorReading);
+        if ($syncFirebase) {
+            $this->syncWithFirebase($sensorReading);
+        }
 
         // Broadcast real-time event
         broadcast(new \App\Events\SensorDataReceived($sensor, $sensorReading));
@@ -381,6 +624,8 @@ private function storeSensorReading(Sensor $sensor, array $reading)
             'water_level_percentage' => $sensorReading->water_level_percentage,
             'volume_liters' => $sensorReading->volume_liters,
         ]);
+
+        return $sensorReading;
     }
 
     /**
@@ -463,6 +463,26 @@ private function syncDevice(array $deviceData): void
         $this->processTelemetryData($deviceData, $telemetry);
     }
 
+    /**
+     * Store telemetry fetched outside this service (the Python sync worker)
+     * exactly like syncDevice() stores the telemetry it fetched itself
+     */
+    public function syncTelemetry(array $deviceData, array $telemetry): void
+    {
+        $deviceId = $deviceData['id']['id'] ?? null;
+
+        if (!$deviceId) {
+            throw new \Exception('Device ID not found in device data');
+        }
+
+        if (!$telemetry) {
+            Log::warning('No telemetry data for device', ['device_id' => $deviceId]);
+            return;
+        }
+
+        $this->processTelemetryData($deviceData, $telemetry);
+    }
+
     /**
      * Process telemetry data and store it in the database
      */
@@ -45,6 +45,12 @@
     Route::put('/dingtek/data', [SensorController::class, 'receiveDingtekData']);
     Route::patch('/dingtek/data', [SensorController::class, 'receiveDingtekData']);
 
+    // Batched readings forwarded by the Python TCP gateway
+    Route::post('/dingtek/bulk', [SensorController::class, 'receiveDingtekBulk']);
+
+    // Dingtek cloud telemetry fetched by the Python sync worker (scripts/df555/dingtek_cloud.py)
+    Route::post('/dingtek/telemetry', [SensorController::class, 'receiveDingtekTelemetry']);
+
     // Status endpoint for debugging
     Route::get('/status', [SensorController::class, 'getSensorStatus']);
 });
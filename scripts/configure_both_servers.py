@@ -4,17 +4,36 @@ Configure both Server 1 and Server 2 for Dingtek DF555 sensor
 Sends commands via serial TTL connection
 
 IMPORTANT: Reset sensor with magnet before running!
+
+Fleet mode (--fleet) configures every attached USB-TTL adapter at once:
+    python3 configure_both_servers.py --fleet [--inventory PATH] [--force] [--no-inventory]
+Each port waits for its sensor to wake (reset it with the magnet) and is
+configured the moment the sensor starts talking. Sensors are identified by
+the IMEI in their configuration dump (query command); commands whose value
+the provisioning inventory (df555.inventory) already records as confirmed
+are skipped, so pass --force to resend everything.
 """
 
+import argparse
 import serial
 import serial.tools.list_ports
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from configure_sensor import DF555Configurator
+from df555 import protocol
+from df555.inventory import DEFAULT_PATH as INVENTORY_PATH, Inventory, plan
+from df555.protocol import build_server_command
+from df555.serial_io import read_response
 
 # Configuration
 SERVER_IP = "66.241.124.67"  # Fly.io IP address
 SERVER_PORT = "8888"
 
+# Fleet mode: how long each port waits for its sensor to be reset (seconds)
+FLEET_WAKE_TIMEOUT = 120
+
 def list_serial_ports():
     """List all available serial ports"""
     ports = serial.tools.list_ports.comports()
@@ -36,10 +55,7 @@ def build_server_config_command(server_num, ip_address, port):
 
     Format: 80029999<CMD><IP;PORT;>81
     """
-    command_code = "06" if server_num == 1 else "07"
-    content = f"{ip_address};{port};"
-    command = f"80029999{command_code}{content}81"
-    return command
+    return build_server_command(server_num, ip_address, port)
 
 def send_command(ser, command, server_num):
     """Send command to sensor and wait for response"""
@@ -62,13 +78,8 @@ def send_command(ser, command, server_num):
     print(f"✓ Sent {bytes_written} bytes")
     print("Waiting for response...")
 
-    # Wait for response
-    time.sleep(2)
-
-    response = b""
-    while ser.in_waiting > 0:
-        response += ser.read(ser.in_waiting)
-        time.sleep(0.1)
+    # Read response as it arrives
+    response = read_response(ser)
 
     if response:
         try:
@@ -86,7 +97,147 @@ def send_command(ser, command, server_num):
         print("⚠ No response received")
         return False
 
+def configure_port(device, wake_timeout=FLEET_WAKE_TIMEOUT, inventory=None, force=False):
+    """
+    Run a complete dual-server session on one port without printing
+
+    Waits for the sensor's boot output after a magnet reset, then sends the
+    server commands with DF555Configurator.apply() while the sensor is
+    awake. With an inventory, the configuration is read back first in the
+    same session: the IMEI in the query dump identifies the sensor, only
+    servers not yet confirmed are sent and every command and reply is
+    recorded. If the dump carries no IMEI both servers are sent unrecorded.
+
+    Args:
+        device: Serial port path
+        wake_timeout: Seconds to wait for the sensor to wake up
+        inventory: Optional df555.inventory.Inventory
+        force: Send both servers even if already confirmed
+
+    Returns:
+        Dict with 'port', 'imei', 'woke', 'server1', 'server2', 'skipped',
+        'elapsed' and 'error'
+    """
+    result = {
+        'port': device,
+        'imei': None,
+        'woke': False,
+        'server1': False,
+        'server2': False,
+        'skipped': 0,
+        'elapsed': 0.0,
+        'error': None,
+    }
+    start = time.monotonic()
+    configurator = DF555Configurator(device, verbose=False)
+
+    try:
+        if not configurator.connect():
+            result['error'] = configurator.error
+            return result
+        ser = configurator.serial
+
+        # The sensor reports one packet as soon as it wakes up
+        ser.timeout = wake_timeout
+        first = ser.read(1)
+        ser.timeout = configurator.TIMEOUT
+        if not first:
+            result['error'] = 'sensor did not wake'
+            return result
+        result['woke'] = True
+
+        # Let the boot output finish before sending commands
+        read_response(ser, terminators=())
+        ser.reset_input_buffer()
+
+        content = f"{SERVER_IP};{SERVER_PORT};"
+        batch = [
+            ('server1', protocol.CMD_SET_SERVER1, content),
+            ('server2', protocol.CMD_SET_SERVER2, content),
+        ]
+        records = []
+        if inventory is not None:
+            read_back = configurator.read_back()
+            if read_back['params'] is not None:
+                result['imei'] = read_back['params'].imei
+            if result['imei']:
+                records.append(read_back)
+                batch, skipped = plan(inventory, result['imei'], batch, force=force)
+                result['skipped'] = len(skipped)
+                for label, _, _ in skipped:
+                    result[label] = True
+
+        if batch:
+            report = configurator.apply(batch)
+            for entry in report['results']:
+                result[entry['label']] = entry['ok']
+            records += report['results']
+        if inventory is not None and result['imei']:
+            for entry in records:
+                inventory.record(result['imei'], entry['command'], entry['response'] or None, entry['confirmed'],
+                                 session=device)
+        result['error'] = configurator.error
+    except Exception as e:
+        # One bad port (or inventory write) must not abort the whole fleet
+        result['error'] = str(e) or type(e).__name__
+    finally:
+        configurator.disconnect()
+        result['elapsed'] = time.monotonic() - start
+
+    return result
+
+def run_fleet(ports, inventory=None, force=False):
+    """Configure every attached sensor concurrently and print a summary table"""
+    # Only USB adapters; skips built-in and Bluetooth serial ports
+    devices = [port.device for port in ports if port.vid is not None]
+    if not devices:
+        print("✗ No USB serial adapters found!")
+        return False
+
+    print("\n" + "="*60)
+    print(f"FLEET MODE: {len(devices)} port(s)")
+    print("="*60)
+    print(f"Reset each sensor with the magnet within {FLEET_WAKE_TIMEOUT} seconds.")
+    print("Each port is configured as soon as its sensor wakes up.")
+    print("="*60)
+
+    with ThreadPoolExecutor(max_workers=len(devices)) as pool:
+        results = list(pool.map(lambda device: configure_port(device, inventory=inventory, force=force),
+                                devices))
+
+    print("\n" + "="*60)
+    print("FLEET SUMMARY")
+    print("="*60)
+    print(f"{'Port':<24} {'Server 1':<10} {'Server 2':<10} {'Time':>6}  Notes")
+    print("-"*60)
+    for result in results:
+        server1 = '✓ PASS' if result['server1'] else '✗ FAIL'
+        server2 = '✓ PASS' if result['server2'] else '✗ FAIL'
+        notes = [result['imei'] or '', f"{result['skipped']} skipped" if result['skipped'] else '',
+                 result['error'] or '']
+        print(f"{result['port']:<24} {server1:<10} {server2:<10} "
+              f"{result['elapsed']:>5.1f}s  {' '.join(note for note in notes if note)}")
+    print("-"*60)
+
+    passed = sum(1 for r in results if r['server1'] and r['server2'])
+    print(f"{passed}/{len(results)} sensors configured for {SERVER_IP}:{SERVER_PORT}")
+    print("="*60)
+
+    return passed == len(results)
+
 def main():
+    parser = argparse.ArgumentParser(description='Configure Server 1 and Server 2 of Dingtek DF555 sensors')
+    parser.add_argument('port', nargs='?', help='Serial port (prompted for if omitted)')
+    parser.add_argument('--yes', action='store_true', help='Do not wait for Enter after the magnet reset')
+    parser.add_argument('--fleet', action='store_true', help='Configure every attached USB serial adapter at once')
+    parser.add_argument('--inventory', default=INVENTORY_PATH,
+                        help=f'Provisioning inventory database for --fleet (default: {INVENTORY_PATH})')
+    parser.add_argument('--no-inventory', action='store_true', help='Send both servers without the inventory')
+    parser.add_argument('--force', action='store_true', help='Send both servers even if already confirmed')
+    args = parser.parse_args()
+    if args.fleet and args.port:
+        parser.error('--fleet configures every adapter; do not pass a port')
+
     print("\n" + "="*60)
     print("DINGTEK DF555 DUAL SERVER CONFIGURATION")
     print("="*60)
@@ -100,10 +251,19 @@ def main():
         print("✗ No serial ports found!")
         sys.exit(1)
 
+    if args.fleet:
+        inventory = None if args.no_inventory else Inventory(args.inventory)
+        try:
+            passed = run_fleet(ports, inventory=inventory, force=args.force)
+        finally:
+            if inventory:
+                inventory.close()
+        sys.exit(0 if passed else 1)
+
     # Select port
-    auto_proceed = "--yes" in sys.argv
-    if len(sys.argv) > 1 and sys.argv[1] != "--yes":
-        selected_port = sys.argv[1]
+    auto_proceed = args.yes
+    if args.port:
+        selected_port = args.port
     else:
         try:
             selection = input("Select port number: ").strip()
@@ -144,7 +304,6 @@ def main():
         )
 
         print(f"✓ Port opened: {ser.name}")
-        time.sleep(0.5)
 
         # Build commands for both servers
         server1_cmd = build_server_config_command(1, SERVER_IP, SERVER_PORT)
@@ -153,9 +312,6 @@ def main():
         # Send Server 1 configuration
         success1 = send_command(ser, server1_cmd, 1)
 
-        # Wait between commands
-        time.sleep(1)
-
         # Send Server 2 configuration
         success2 = send_command(ser, server2_cmd, 2)
 
@@ -9,6 +9,10 @@ import time
 import sys
 import argparse
 
+from df555 import protocol
+from df555.inventory import DEFAULT_PATH as INVENTORY_PATH, Inventory, plan
+from df555.serial_io import read_response, read_responses, read_stream
+
 
 class DF555Configurator:
     """Configure DF555 sensor via serial port"""
@@ -19,21 +23,29 @@ class DF555Configurator:
     DATABITS = serial.EIGHTBITS
     STOPBITS = serial.STOPBITS_ONE
     TIMEOUT = 5  # seconds
+    INTER_FRAME_GAP = 0.02  # seconds between pipelined frames
 
     # Command codes
-    CMD_SET_SERVER1 = '06'
-    CMD_SET_SERVER2 = '07'  # Unverified - may need confirmation
-    CMD_SWITCH_FUNCTION = '09'  # Switch function setting (may include server mode)
+    CMD_SET_SERVER1 = protocol.CMD_SET_SERVER1
+    CMD_SET_SERVER2 = protocol.CMD_SET_SERVER2  # Unverified - may need confirmation
+    CMD_SWITCH_FUNCTION = protocol.CMD_SWITCH_FUNCTION  # May include server mode
 
-    def __init__(self, port):
+    def __init__(self, port, verbose=True):
         """
         Initialize configurator
 
         Args:
             port: Serial port path (e.g., '/dev/ttyUSB0', 'COM3')
+            verbose: Print progress (off when several ports run at once)
         """
         self.port = port
+        self.verbose = verbose
         self.serial = None
+        self.error = None
+
+    def _say(self, message):
+        if self.verbose:
+            print(message)
 
     def connect(self):
         """Establish serial connection"""
@@ -46,18 +58,19 @@ class DF555Configurator:
                 stopbits=self.STOPBITS,
                 timeout=self.TIMEOUT
             )
-            print(f"✓ Connected to {self.port}")
-            time.sleep(0.5)  # Allow connection to stabilize
+            self._say(f"✓ Connected to {self.port}")
+            self.serial.reset_input_buffer()  # Drop boot output from the reset
             return True
         except serial.SerialException as e:
-            print(f"✗ Failed to connect to {self.port}: {e}")
+            self.error = str(e)
+            self._say(f"✗ Failed to connect to {self.port}: {e}")
             return False
 
     def disconnect(self):
         """Close serial connection"""
         if self.serial and self.serial.is_open:
             self.serial.close()
-            print(f"✓ Disconnected from {self.port}")
+            self._say(f"✓ Disconnected from {self.port}")
 
     def build_command(self, cmd_code, content):
         """
@@ -72,13 +85,7 @@ class DF555Configurator:
         Returns:
             ASCII command string
         """
-        packet_head = '80'
-        command_type = '02'
-        header = '9999'
-        packet_tail = '81'
-
-        command = f"{packet_head}{command_type}{header}{cmd_code}{content}{packet_tail}"
-        return command
+        return protocol.build_command(cmd_code, content)
 
     def send_command(self, command):
         """
@@ -91,30 +98,173 @@ class DF555Configurator:
             Response from sensor or None
         """
         if not self.serial or not self.serial.is_open:
-            print("✗ Serial port not open")
+            self._say("✗ Serial port not open")
             return None
 
         try:
             # Send command as ASCII bytes
             self.serial.write(command.encode('ascii'))
-            print(f"→ Sent: {command}")
+            self._say(f"→ Sent: {command}")
 
-            # Wait for response
-            time.sleep(1)
-
-            # Read response
-            if self.serial.in_waiting > 0:
-                response = self.serial.read(self.serial.in_waiting)
-                print(f"← Received: {response.decode('ascii', errors='ignore')}")
+            # Read response as it arrives
+            response = read_response(self.serial)
+            if response:
+                self._say(f"← Received: {response.decode('ascii', errors='ignore')}")
                 return response
             else:
-                print("⚠ No response received (sensor may be restarting)")
+                self._say("⚠ No response received (sensor may be restarting)")
                 return None
 
         except Exception as e:
-            print(f"✗ Error sending command: {e}")
+            self._say(f"✗ Error sending command: {e}")
             return None
 
+    def build_batch(self, server1=None, server2=None, mode=None):
+        """
+        Build a command batch for apply()
+
+        Args:
+            server1: (ip, port) tuple for Server 1, or None
+            server2: (ip, port) tuple for Server 2, or None
+            mode: Server mode code ('00', '01', '02'), or None
+
+        Returns:
+            List of (label, cmd_code, content) tuples
+        """
+        batch = []
+        if server1:
+            ip, port = server1
+            batch.append(('Server 1', self.CMD_SET_SERVER1, f"{ip};{port};"))
+        if server2:
+            ip, port = server2
+            batch.append(('Server 2', self.CMD_SET_SERVER2, f"{ip};{port};"))
+        if mode:
+            batch.append(('Server mode', self.CMD_SWITCH_FUNCTION, mode))
+        return batch
+
+    def apply(self, batch, verify=False):
+        """
+        Send several commands in one session and match replies to them
+
+        All frames are written back-to-back (separated only by
+        INTER_FRAME_GAP) so the whole batch fits in one wake window. The
+        sensor answers commands in order, so replies are read back in the
+        same order they were sent.
+
+        Args:
+            batch: List of (label, cmd_code, content) tuples, see build_batch()
+            verify: Read the configuration back afterwards and compare it,
+                    adding 'read_back' and 'verified' to the report (see
+                    read_back() and verify())
+
+        Returns:
+            Report dict with 'port', 'elapsed' (seconds) and 'results', a list
+            of dicts with 'label', 'command', 'response', 'ok' (any reply) and
+            'confirmed' (the reply echoes the command) per command
+        """
+        report = {'port': self.port, 'elapsed': 0.0, 'results': []}
+        if not self.serial or not self.serial.is_open:
+            self._say("✗ Serial port not open")
+            return report
+
+        start = time.monotonic()
+        commands = [self.build_command(cmd_code, content) for _, cmd_code, content in batch]
+
+        try:
+            for i, command in enumerate(commands):
+                if i:
+                    time.sleep(self.INTER_FRAME_GAP)
+                self.serial.write(command.encode('ascii'))
+                self._say(f"→ Sent: {command}")
+            self.serial.flush()
+
+            replies = read_responses(self.serial, len(commands))
+            replies += [b''] * (len(commands) - len(replies))
+
+            for (label, _, _), command, response in zip(batch, commands, replies):
+                if response:
+                    self._say(f"← {label}: {response.decode('ascii', errors='ignore').strip()}")
+                report['results'].append({
+                    'label': label,
+                    'command': command,
+                    'response': response,
+                    'ok': bool(response),
+                    'confirmed': protocol.check_reply(command, response.decode('ascii', errors='ignore')) is True,
+                })
+        except serial.SerialException as e:
+            self.error = str(e)
+            self._say(f"✗ Error during session: {e}")
+
+        if verify:
+            report['read_back'] = self.read_back()
+            report['verified'] = self.verify(batch, report['read_back']['params'])
+
+        report['elapsed'] = time.monotonic() - start
+        return report
+
+    def read_back(self):
+        """
+        Read the sensor's configuration with the query command (type 01)
+
+        The parameter dump is parsed as it arrives, so this costs one reply
+        latency within the current session rather than another wake cycle.
+
+        Returns:
+            Dict with 'label', 'command', 'response', 'ok' and 'confirmed'
+            like apply() results, plus 'params' (protocol.SensorParams, or
+            None if no complete dump arrived)
+        """
+        command = protocol.build_command(self.CMD_SET_SERVER1, command_type=protocol.COMMAND_TYPE_QUERY)
+        result = {'label': 'Read-back', 'command': command, 'response': b'', 'ok': False,
+                  'confirmed': False, 'params': None}
+        if not self.serial or not self.serial.is_open:
+            self._say("✗ Serial port not open")
+            return result
+
+        reader = protocol.ParamReader()
+        try:
+            self.serial.write(command.encode('ascii'))
+            self.serial.flush()
+            self._say(f"→ Sent: {command}")
+            result['response'] = read_stream(self.serial, reader.feed)
+        except serial.SerialException as e:
+            self.error = str(e)
+            self._say(f"✗ Error reading configuration: {e}")
+            return result
+
+        result['params'] = reader.params
+        result['ok'] = bool(result['response'])
+        result['confirmed'] = result['params'] is not None
+        if reader.error:
+            self._say(f"✗ Query rejected: {reader.error}")
+        elif result['params'] is None:
+            self._say("⚠ Incomplete configuration dump (sensor may be restarting)")
+        return result
+
+    def verify(self, batch, params):
+        """
+        Compare a command batch with the configuration read back
+
+        Args:
+            batch: List of (label, cmd_code, content) tuples, see build_batch()
+            params: protocol.SensorParams from read_back(), or None
+
+        Returns:
+            List of dicts with 'label', 'expected', 'actual' and 'ok' (True,
+            False, or None when the parameter could not be read)
+        """
+        checks = []
+        for label, cmd_code, content in batch:
+            key = protocol.COMMAND_PARAMS.get(cmd_code)
+            actual = params.content(key) if params and key else None
+            checks.append({
+                'label': label,
+                'expected': content,
+                'actual': actual,
+                'ok': None if actual is None else actual == content,
+            })
+        return checks
+
     def configure_server1(self, ip, port):
         """
         Configure Server 1 address and port
@@ -237,11 +387,18 @@ def main():
                         help='Configure Server 2 IP and port (unverified)')
     parser.add_argument('--mode', choices=['00', '01', '02'],
                         help='Server mode: 00=Server1 only, 01=Server2 only, 02=Both servers')
+    parser.add_argument('--imei', help='Sensor IMEI; only settings that differ from the inventory are sent')
+    parser.add_argument('--inventory', default=INVENTORY_PATH,
+                        help=f'Provisioning inventory database (default: {INVENTORY_PATH})')
+    parser.add_argument('--force', action='store_true', help='Send every setting even if already confirmed')
+    parser.add_argument('--verify', action='store_true',
+                        help='Read the configuration back in the same session and compare it')
+    parser.add_argument('--read', action='store_true', help='Only read the configuration back')
 
     args = parser.parse_args()
 
-    if not args.server1 and not args.server2 and not args.mode:
-        parser.error('At least one of --server1, --server2, or --mode must be specified')
+    if not args.server1 and not args.server2 and not args.mode and not args.read:
+        parser.error('At least one of --server1, --server2, --mode or --read must be specified')
 
     print("=" * 60)
     print("DF555 Ultrasonic Level Sensor Configuration Tool")
@@ -254,37 +411,77 @@ def main():
 
     # Create configurator
     configurator = DF555Configurator(args.port)
+    batch = configurator.build_batch(
+        server1=args.server1,
+        server2=args.server2,
+        mode=args.mode
+    )
+    desired = batch
+    verify = args.verify or args.read
+    inventory = Inventory(args.inventory) if args.imei else None
+    if inventory:
+        batch, skipped = plan(inventory, args.imei, batch, force=args.force)
+        for label, _, content in skipped:
+            print(f"✓ {label} already confirmed ({content}), skipping")
+        if not batch and not verify:
+            print(f"\n✓ {args.imei} already holds the requested configuration, nothing to send")
+            inventory.close()
+            return 0
 
     # Connect to sensor
     if not configurator.connect():
         sys.exit(1)
 
     try:
-        # Configure Server 1 if specified
-        if args.server1:
-            ip, port = args.server1
-            configurator.configure_server1(ip, port)
-            time.sleep(2)  # Wait between commands
-
-        # Configure Server 2 if specified
-        if args.server2:
-            ip, port = args.server2
-            configurator.configure_server2(ip, port)
-            time.sleep(2)  # Wait between commands
-
-        # Configure Server Mode if specified
-        if args.mode:
-            configurator.configure_server_mode(args.mode)
+        report = configurator.apply(batch, verify=verify)
+        if verify:
+            # Settings skipped as already confirmed are checked as well
+            report['verified'] = configurator.verify(desired, report['read_back']['params'])
+        if inventory:
+            for result in report['results'] + ([report['read_back']] if verify else []):
+                inventory.record(args.imei, result['command'], result['response'] or None,
+                                 result['confirmed'], session=args.port)
 
         print("\n" + "=" * 60)
-        print("✓ Configuration complete!")
+        print("CONFIGURATION SUMMARY")
+        print("=" * 60)
+        for result in report['results']:
+            if result['confirmed']:
+                status = '✓ CONFIRMED'
+            else:
+                status = '✓ REPLIED' if result['ok'] else '⚠ NO REPLY'
+            print(f"{result['label']:<12} {status}")
+        if verify:
+            params = report['read_back']['params']
+            if params:
+                print("-" * 60)
+                for key, value in params.to_dict().items():
+                    print(f"{key:<12} {value}")
+            print("-" * 60)
+            for check in report['verified']:
+                if check['ok'] is None:
+                    status = '⚠ UNVERIFIED'
+                else:
+                    status = '✓ VERIFIED' if check['ok'] else f"✗ MISMATCH (sensor has {check['actual']})"
+                print(f"{check['label']:<12} {status}")
+        print(f"Session time: {report['elapsed']:.2f}s")
+        if inventory:
+            pending = inventory.pending(args.imei)
+            print(f"Inventory: {', '.join(pending) + ' still pending' if pending else 'all settings confirmed'}")
+        print("=" * 60)
         print("⚠ Please wait 30+ seconds for device to restart")
         print("=" * 60)
 
     finally:
         # Always disconnect
         configurator.disconnect()
+        if inventory:
+            inventory.close()
+    if verify and (report['read_back']['params'] is None
+                   or not all(check['ok'] for check in report['verified'])):
+        return 1
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
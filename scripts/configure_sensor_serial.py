@@ -13,9 +13,11 @@ Hardware Setup:
 
 import serial
 import serial.tools.list_ports
-import time
 import sys
 
+from df555.protocol import build_server_command, check_reply
+from df555.serial_io import read_response
+
 def list_serial_ports():
     """List all available serial ports"""
     ports = serial.tools.list_ports.comports()
@@ -44,9 +46,7 @@ def build_server_config_command(server_address, port):
     - Content: IP;PORT; (must have two semicolons!)
     - 81: Packet tail
     """
-    content = f"{server_address};{port};"
-    command = f"8002999906{content}81"  # 06 = Command code for Server1
-    return command
+    return build_server_command(1, server_address, port)
 
 def send_command_to_sensor(port_device, command, timeout=10):
     """
@@ -73,9 +73,6 @@ def send_command_to_sensor(port_device, command, timeout=10):
         print(f"Port opened successfully: {ser.name}")
         print(f"Settings: {ser.baudrate} baud, {ser.bytesize} data bits, {ser.stopbits} stop bit(s), {ser.parity} parity")
 
-        # Wait a moment for port to stabilize
-        time.sleep(0.5)
-
         # Clear any existing data in buffer
         ser.reset_input_buffer()
         ser.reset_output_buffer()
@@ -98,14 +95,8 @@ def send_command_to_sensor(port_device, command, timeout=10):
         print(f"✓ Sent {bytes_written} bytes to sensor")
         print("\nWaiting for sensor response...")
 
-        # Wait for response
-        time.sleep(2)
-
-        # Read response
-        response_data = b''
-        while ser.in_waiting > 0:
-            response_data += ser.read(ser.in_waiting)
-            time.sleep(0.1)
+        # Read response as it arrives
+        response_data = read_response(ser)
 
         if response_data:
             print(f"\n{'='*60}")
@@ -116,11 +107,14 @@ def send_command_to_sensor(port_device, command, timeout=10):
             print(f"Response (Length): {len(response_data)} bytes")
             print(f"{'='*60}\n")
 
-            # Check if configuration was successful
-            if b'Server1' in response_data or b'OK' in response_data:
-                print("✓ Configuration appears successful!")
+            # Any acknowledgement counts; --read on configure_sensor.py verifies the setting
+            confirmed = check_reply(command, response_data.decode('ascii', errors='ignore'))
+            if confirmed:
+                print("✓ Configuration confirmed by the sensor")
+            elif confirmed is False:
+                print("✗ Sensor rejected the command")
             else:
-                print("⚠ Unexpected response - please verify sensor configuration")
+                print("⚠ Unexpected response - verify with: python3 configure_sensor.py PORT --read")
         else:
             print("⚠ No response received from sensor")
             print("  This could mean:")
@@ -0,0 +1,6 @@
+"""
+Shared helpers for the Dingtek DF555 sensor tools in scripts/
+
+The standalone scripts import from this package, so run them from the
+scripts/ directory (or with scripts/ on PYTHONPATH).
+"""
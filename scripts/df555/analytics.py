@@ -0,0 +1,390 @@
+"""
+Streaming consumption and leak detection
+
+Updates a fixed handful of numbers per tank as each reading arrives, so
+consumption, refills and leaks are known without aggregating the readings
+table on every dashboard load:
+
+    rate_mm_h     EWMA of the level change rate (negative while draining)
+    usage_mm_h    EWMA of the drain rate, the tank's usual consumption
+    night_mm_h    EWMA of the drain rate over night hours, the leak baseline
+    consumed_mm   level drop today (and yesterday), ignoring sensor noise
+    refilled_mm   level rise from refills today (and yesterday)
+
+Events:
+    refill          the level rose by at least REFILL_MM between readings
+    abnormal_drain  the level fell DRAIN_FACTOR times faster than usual
+    leak            the night drain stayed above LEAK_MM_H for LEAK_NIGHTS
+                    nights in a row (reported once until it clears)
+
+Levels come from the sensor distance (a larger distance is a lower level),
+so no tank geometry is needed; with a tank height the snapshot also gives
+the water level. Days and nights follow local time (utc_offset hours).
+
+Usage:
+    python3 -m df555.analytics /data/archive --start 2025-01-01 --utc-offset 2
+    python3 -m df555.gateway --analytics-state=/var/lib/df555/tanks.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+logger = logging.getLogger('df555.analytics')
+
+# Level changes smaller than this are sensor noise (mm)
+NOISE_MM = 5
+
+# A rise of at least this much between two readings is a refill (mm)
+REFILL_MM = 100
+
+# EWMA time constants (hours) of the change rate and the usual drain rate
+RATE_TAU_H = 6.0
+USAGE_TAU_H = 72.0
+
+# abnormal_drain: faster than DRAIN_FACTOR × usual + DRAIN_MIN_MM_H, by at
+# least DRAIN_MIN_MM, once WARMUP_READINGS readings have set the baseline
+DRAIN_FACTOR = 4.0
+DRAIN_MIN_MM_H = 20.0
+DRAIN_MIN_MM = 50
+WARMUP_READINGS = 24
+
+# leak: night drain above LEAK_MM_H on LEAK_NIGHTS consecutive nights with
+# at least NIGHT_MIN_HOURS of readings
+NIGHT_HOURS = (1, 5)
+NIGHT_MIN_HOURS = 2.0
+NIGHT_WEIGHT = 0.3
+LEAK_MM_H = 3.0
+LEAK_NIGHTS = 3
+
+
+def write_state(path, data):
+    """Atomically write analytics data (StreamAnalytics.dump()) as JSON"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+class TankState:
+    """Constant-size analytics state of one tank"""
+
+    __slots__ = ('timestamp', 'distance', 'anchor', 'readings', 'rate', 'usage',
+                 'day', 'consumed', 'refilled', 'consumed_yesterday', 'refilled_yesterday',
+                 'last_refill', 'night', 'night_drop', 'night_hours', 'night_rate',
+                 'leak_nights', 'leak')
+
+    def __init__(self, timestamp, distance, day):
+        self.timestamp = timestamp
+        self.distance = distance
+        # Distance last counted towards consumption, moved past the noise band
+        self.anchor = distance
+        self.readings = 1
+        self.rate = 0.0
+        self.usage = 0.0
+        self.day = day
+        self.consumed = 0.0
+        self.refilled = 0.0
+        self.consumed_yesterday = 0.0
+        self.refilled_yesterday = 0.0
+        self.last_refill = None
+        self.night = None
+        self.night_drop = 0.0
+        self.night_hours = 0.0
+        self.night_rate = None
+        self.leak_nights = 0
+        self.leak = False
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        state = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(state, name, values.get(name))
+        return state
+
+
+def tank_heights(tanks):
+    """{imei: height_mm} from tank rows with the sensor 'imei' (or 'device_id')"""
+    heights = {}
+    for tank in tanks:
+        imei = _imei(str(tank.get('imei') or tank.get('device_id') or ''))
+        if imei and tank.get('height_mm'):
+            heights[imei] = int(tank['height_mm'])
+    return heights
+
+
+def _imei(key):
+    """IMEI of a binary device ID (1 + IMEI); state files used to be keyed by it"""
+    return key[1:] if len(key) == 16 and key.startswith('1') and key.isdigit() else key
+
+
+class StreamAnalytics:
+    """Per-tank streaming state and event detection"""
+
+    def __init__(self, heights=None, utc_offset=0.0, night_hours=NIGHT_HOURS):
+        """
+        Initialize analytics
+
+        Args:
+            heights: Optional {imei: tank height_mm} for water levels
+            utc_offset: Hours added to UTC for local days and nights
+            night_hours: Local (start, end) hours of the night window
+        """
+        self.heights = heights or {}
+        self.utc_offset = utc_offset
+        self.night_hours = night_hours
+        self.tanks = {}
+        self.stats = {
+            'readings': 0,
+            'ignored': 0,
+            'refill': 0,
+            'abnormal_drain': 0,
+            'leak': 0,
+        }
+
+    def _local(self, timestamp):
+        return time.gmtime(timestamp + self.utc_offset * 3600)
+
+    def observe(self, parsed):
+        """
+        Update from a decoded report (protocol.decode_report)
+
+        Returns:
+            List of event dicts
+        """
+        distance = parsed.get('distance')
+        # Keyed by IMEI like the archive, the alert rules and the tanks export
+        imei = parsed.get('imei') or parsed.get('device_id')
+        if distance is None or not imei:
+            return []
+        timestamp = parsed.get('timestamp')
+        if not isinstance(timestamp, int) or timestamp <= 0:
+            timestamp = int(time.time())
+        return self.update(imei, timestamp, distance * 1000)
+
+    def update(self, imei, timestamp, distance_mm):
+        """
+        Update a tank with one reading
+
+        Args:
+            imei: Sensor IMEI
+            timestamp: Unix time of the reading
+            distance_mm: Distance from the sensor to the water
+
+        Returns:
+            List of event dicts (type, imei, timestamp and details)
+        """
+        local = self._local(timestamp)
+        day = time.strftime('%Y-%m-%d', local)
+        state = self.tanks.get(imei)
+        if state is None:
+            self.tanks[imei] = TankState(timestamp, distance_mm, day)
+            self.stats['readings'] += 1
+            return []
+
+        hours = (timestamp - state.timestamp) / 3600
+        if hours <= 0:
+            # Out of order or repeated; the state only moves forward
+            self.stats['ignored'] += 1
+            return []
+
+        self.stats['readings'] += 1
+        events = []
+        if day != state.day:
+            state.consumed_yesterday, state.refilled_yesterday = state.consumed, state.refilled
+            state.consumed = state.refilled = 0.0
+            state.day = day
+
+        rise = state.distance - distance_mm
+        in_night = self._track_night(imei, state, local, timestamp, events)
+
+        if rise >= REFILL_MM:
+            state.refilled += rise
+            state.last_refill = timestamp
+            state.anchor = distance_mm
+            events.append(self._event('refill', imei, timestamp, amount_mm=round(rise, 1)))
+        else:
+            rate = rise / hours
+            state.rate += (1 - math.exp(-hours / RATE_TAU_H)) * (rate - state.rate)
+
+            drain = max(0.0, -rate)
+            if (state.readings >= WARMUP_READINGS and -rise >= DRAIN_MIN_MM
+                    and drain > DRAIN_FACTOR * state.usage + DRAIN_MIN_MM_H):
+                events.append(self._event('abnormal_drain', imei, timestamp, drop_mm=round(-rise, 1),
+                                          rate_mm_h=round(drain, 1), usual_mm_h=round(state.usage, 1)))
+            state.usage += (1 - math.exp(-hours / USAGE_TAU_H)) * (drain - state.usage)
+
+            if distance_mm - state.anchor >= NOISE_MM:
+                state.consumed += distance_mm - state.anchor
+                state.anchor = distance_mm
+            elif state.anchor - distance_mm >= NOISE_MM:
+                state.anchor = distance_mm
+
+            if in_night:
+                state.night_drop += max(0.0, -rise)
+                state.night_hours += hours
+
+        state.timestamp = timestamp
+        state.distance = distance_mm
+        state.readings += 1
+        return events
+
+    def _track_night(self, imei, state, local, timestamp, events):
+        """
+        Close the night of the previous reading once it is over
+
+        Returns:
+            True if the interval since the previous reading lies in a night
+        """
+        start, end = self.night_hours
+        night = time.strftime('%Y-%m-%d', local) if start <= local.tm_hour < end else None
+        if night == state.night:
+            return night is not None
+
+        if state.night is not None and state.night_hours >= NIGHT_MIN_HOURS:
+            rate = state.night_drop / state.night_hours
+            state.night_rate = rate if state.night_rate is None else \
+                state.night_rate + NIGHT_WEIGHT * (rate - state.night_rate)
+            state.leak_nights = state.leak_nights + 1 if rate >= LEAK_MM_H else 0
+            if state.leak_nights >= LEAK_NIGHTS and not state.leak:
+                state.leak = True
+                events.append(self._event('leak', imei, timestamp, night_mm_h=round(rate, 2),
+                                          nights=state.leak_nights))
+            elif not state.leak_nights:
+                state.leak = False
+
+        state.night = night
+        state.night_drop = 0.0
+        state.night_hours = 0.0
+        return False
+
+    def _event(self, kind, imei, timestamp, **details):
+        self.stats[kind] += 1
+        logger.info("Tank %s imei=%s %s", kind, imei,
+                    ' '.join(f'{key}={value}' for key, value in details.items()))
+        return dict(type=kind, imei=imei, timestamp=timestamp, **details)
+
+    def summary(self, imei):
+        """Precomputed dashboard values of one tank, or None"""
+        state = self.tanks.get(imei)
+        if state is None:
+            return None
+        height = self.heights.get(imei)
+        usage = state.usage
+        return {
+            'timestamp': state.timestamp,
+            'distance_mm': round(state.distance, 1),
+            'level_mm': round(max(0.0, min(height, height - state.distance)), 1) if height else None,
+            'rate_mm_h': round(state.rate, 2),
+            'usage_mm_h': round(usage, 2),
+            'night_mm_h': round(state.night_rate, 2) if state.night_rate is not None else None,
+            'hours_to_empty': round((height - state.distance) / usage, 1) if height and usage > 0.1 else None,
+            'consumed_today_mm': round(state.consumed, 1),
+            'refilled_today_mm': round(state.refilled, 1),
+            'consumed_yesterday_mm': round(state.consumed_yesterday, 1),
+            'refilled_yesterday_mm': round(state.refilled_yesterday, 1),
+            'last_refill': state.last_refill,
+            'leak': state.leak,
+        }
+
+    def snapshot(self):
+        """Dashboard values of every tank"""
+        return {imei: self.summary(imei) for imei in self.tanks}
+
+    def dump(self):
+        """State and dashboard values as a JSON-serializable dict"""
+        return {
+            'updated': int(time.time()),
+            'utc_offset': self.utc_offset,
+            'tanks': self.snapshot(),
+            'state': {imei: state.to_dict() for imei, state in self.tanks.items()},
+        }
+
+    def save(self, path):
+        """Write dump() to a JSON file (atomically)"""
+        write_state(path, self.dump())
+
+    def load(self, path):
+        """
+        Restore state saved by save()
+
+        Returns:
+            Number of tanks restored (0 if the file does not exist)
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable analytics state path=%s error=%s", path, e)
+            return 0
+        self.tanks = {_imei(key): TankState.from_dict(values) for key, values in data.get('state', {}).items()}
+        return len(self.tanks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay archived readings through the tank analytics')
+    parser.add_argument('archive', help='Archive directory (df555.archive)')
+    parser.add_argument('--device', help='IMEI (default: all devices)')
+    parser.add_argument('--start', help="First day ('YYYY-MM-DD') or unix time")
+    parser.add_argument('--end', help='Last day or unix time')
+    parser.add_argument('--tanks', help='JSON list of tank rows with the sensor imei, for water levels')
+    parser.add_argument('--utc-offset', type=float, default=0.0, help='Local time offset in hours')
+    parser.add_argument('--state', help='Write the resulting state to this JSON file')
+    parser.add_argument('--events', action='store_true', help='Print every event')
+    args = parser.parse_args()
+
+    from df555.archive import Archive, _parse_time
+
+    heights = {}
+    if args.tanks:
+        with open(args.tanks) as f:
+            heights = tank_heights(json.load(f))
+
+    analytics = StreamAnalytics(heights, args.utc_offset)
+    end = _parse_time(args.end)
+    if args.end and not args.end.isdigit():
+        end += 86399
+
+    data = Archive(args.archive).load(args.device, _parse_time(args.start), end,
+                                      columns=('timestamp', 'height_mm'))
+    order = sorted(range(len(data['timestamp'])), key=lambda i: data['timestamp'][i])
+    began = time.perf_counter()
+    for i in order:
+        distance = float(data['height_mm'][i])
+        if distance != distance:
+            continue
+        for event in analytics.update(str(data['device'][i]), int(data['timestamp'][i]), distance):
+            if args.events:
+                when = time.strftime('%Y-%m-%d %H:%M', time.gmtime(event['timestamp']))
+                print(f"{when}  {event['imei']}  {event['type']}")
+    elapsed = time.perf_counter() - began
+
+    print("=" * 60)
+    print("DF555 TANK ANALYTICS")
+    print("=" * 60)
+    print(f"Tanks:          {len(analytics.tanks)}")
+    print(f"Readings:       {analytics.stats['readings']} ({analytics.stats['readings'] / max(elapsed, 1e-9):,.0f}/s)")
+    print(f"Refills:        {analytics.stats['refill']}")
+    print(f"Abnormal drain: {analytics.stats['abnormal_drain']}")
+    print(f"Leaks:          {analytics.stats['leak']}")
+    if args.state:
+        analytics.save(args.state)
+        print(f"✓ State written to {args.state}")
+    print("=" * 60)
+    return 0 if analytics.tanks else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,594 @@
+"""
+Time-partitioned columnar archive of sensor history
+Requires: pip install numpy
+
+Readings are stored per device (IMEI) and UTC day:
+
+    <root>/device=<imei>/<YYYY-MM-DD>.df5a
+
+A partition file is a JSON header followed by one contiguous, 64-byte
+aligned, little-endian array per column:
+
+    'DF5A' | version (u16) | header length (u32) | header JSON | columns
+
+The header holds the row count and, per column, its dtype, offset and
+min/max (ignoring missing values). Scans skip partitions by name (device,
+day) and by those statistics without reading any data, and
+open_partition() memory-maps only the columns that are used.
+
+Sources:
+    captures  TCP capture logs with hex frames (see df555.batch)
+    cloud     Dingtek ThingsBoard history (see df555.dingtek_cloud)
+
+Usage:
+    python3 -m df555.archive captures /data/archive storage/logs/laravel*.log
+    python3 -m df555.archive cloud /data/archive --start 2025-01-01 --end 2025-07-01
+    python3 -m df555.archive info /data/archive --device 868000000000001 --start 2025-03-01
+"""
+
+import argparse
+import calendar
+import json
+import os
+import re
+import struct
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from df555.batch import decode_frames, iter_hex_frames
+
+MAGIC = b'DF5A'
+VERSION = 1
+PREFIX = struct.Struct('<4sHI')
+ALIGN = 64
+SUFFIX = '.df5a'
+
+SOURCE_CAPTURE = 1
+SOURCE_CLOUD = 2
+
+# Missing values are NaN for floats and -1 for signed integers
+COLUMNS = (
+    ('timestamp', '<i8'),     # unix seconds
+    ('height_mm', '<f4'),     # distance from the sensor to the water
+    ('level_mm', '<f4'),      # water level, when the cloud reports one
+    ('temperature', '<f4'),
+    ('battery_mv', '<f4'),
+    ('rsrp', '<f4'),          # dBm
+    ('frame_count', '<i4'),
+    ('status', '<i4'),
+    ('report_type', '<i2'),
+    ('source', 'u1'),         # SOURCE_CAPTURE or SOURCE_CLOUD
+)
+DTYPES = dict(COLUMNS)
+
+# Rows buffered across partitions before Archive.add() flushes
+FLUSH_ROWS = 1_000_000
+CHUNK_FRAMES = 100_000
+
+_PARTITION = re.compile(r'^(\d{4}-\d{2}-\d{2})' + re.escape(SUFFIX) + '$')
+
+
+def _missing(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return np.nan
+    return 0 if dtype.kind == 'u' else -1
+
+
+def empty_columns(rows):
+    """Column arrays of length rows, all values missing"""
+    return {name: np.full(rows, _missing(dtype), dtype=dtype) for name, dtype in COLUMNS}
+
+
+def _present(values):
+    if values.dtype.kind == 'f':
+        return ~np.isnan(values)
+    if values.dtype.kind == 'i':
+        return values != -1
+    return np.ones(len(values), dtype=bool)
+
+
+def _align(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def day_of(timestamp):
+    """UTC day string of a unix time"""
+    return time.strftime('%Y-%m-%d', time.gmtime(int(timestamp)))
+
+
+def day_start(day):
+    """Unix time of 00:00 UTC on a 'YYYY-MM-DD' day"""
+    return calendar.timegm(time.strptime(day, '%Y-%m-%d'))
+
+
+def write_partition(path, columns, device=None, day=None):
+    """
+    Write columns to a partition file (atomically replacing it)
+
+    Args:
+        path: Partition file path
+        columns: Dict of equal-length arrays for every name in COLUMNS
+        device: Device recorded in the header
+        day: Day recorded in the header
+    """
+    rows = len(columns['timestamp'])
+    header = {'version': VERSION, 'device': device, 'day': day, 'rows': rows, 'columns': []}
+    offset = 0
+    arrays = []
+    for name, dtype in COLUMNS:
+        values = np.ascontiguousarray(columns[name], dtype=dtype)
+        present = values[_present(values)]
+        header['columns'].append({
+            'name': name,
+            'dtype': dtype,
+            'offset': offset,
+            'min': present.min().item() if len(present) else None,
+            'max': present.max().item() if len(present) else None,
+            'missing': int(rows - len(present)),
+        })
+        arrays.append((offset, values))
+        offset = _align(offset + values.nbytes)
+
+    encoded = json.dumps(header, separators=(',', ':')).encode()
+    data_start = _align(PREFIX.size + len(encoded))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(encoded)))
+        f.write(encoded)
+        for column_offset, values in arrays:
+            f.seek(data_start + column_offset)
+            f.write(values.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+
+def read_header(path):
+    """
+    Read a partition header without touching the column data
+
+    Raises:
+        ValueError: if the file is not a partition
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(PREFIX.size)
+        if len(prefix) < PREFIX.size:
+            raise ValueError(f"{path}: truncated partition")
+        magic, version, length = PREFIX.unpack(prefix)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a version {VERSION} partition")
+        header = json.loads(f.read(length))
+    header['data_start'] = _align(PREFIX.size + length)
+    header['stats'] = {column['name']: (column['min'], column['max']) for column in header['columns']}
+    return header
+
+
+def open_partition(path, columns=None, header=None):
+    """
+    Memory-map the columns of a partition
+
+    Args:
+        path: Partition file path
+        columns: Column names to map, defaults to all
+        header: Header from read_header(), if already read
+
+    Returns:
+        Dict of read-only np.memmap arrays
+    """
+    header = header or read_header(path)
+    wanted = set(columns) if columns else None
+    return {
+        column['name']: np.memmap(path, dtype=column['dtype'], mode='r',
+                                  offset=header['data_start'] + column['offset'], shape=(header['rows'],))
+        for column in header['columns']
+        if wanted is None or column['name'] in wanted
+    }
+
+
+def merge_columns(parts):
+    """
+    Concatenate column dicts, sort by time and drop duplicates
+
+    Rows with the same (timestamp, source) are duplicates; the one from the
+    later part wins, so re-running a backfill overwrites earlier values.
+    """
+    merged = {name: np.concatenate([part[name] for part in parts]) for name, _ in COLUMNS}
+    rows = len(merged['timestamp'])
+    order = np.lexsort((np.arange(rows), merged['source'], merged['timestamp']))
+    timestamp = merged['timestamp'][order]
+    source = merged['source'][order]
+    last = np.ones(rows, dtype=bool)
+    last[:-1] = (timestamp[1:] != timestamp[:-1]) | (source[1:] != source[:-1])
+    keep = order[last]
+    return {name: values[keep] for name, values in merged.items()}
+
+
+class Archive:
+    """A directory of device/day partitions"""
+
+    def __init__(self, root, flush_rows=FLUSH_ROWS):
+        """
+        Initialize archive
+
+        Args:
+            root: Archive directory
+            flush_rows: Buffered rows that trigger a flush in add()
+        """
+        self.root = root
+        self.flush_rows = flush_rows
+        self._buffer = {}
+        self._buffered = 0
+
+    def path(self, device, day):
+        return os.path.join(self.root, f'device={device}', day + SUFFIX)
+
+    def add(self, device, columns):
+        """Buffer rows of one device, split by UTC day"""
+        days = columns['timestamp'] // 86400
+        order = np.argsort(days, kind='stable')
+        days = days[order]
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        for rows in np.split(order, bounds):
+            if not len(rows):
+                continue
+            day = day_of(columns['timestamp'][rows[0]])
+            self._buffer.setdefault((device, day), []).append({name: values[rows] for name, values in columns.items()})
+            self._buffered += len(rows)
+        if self._buffered >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """
+        Merge buffered rows into their partitions
+
+        Returns:
+            Number of partitions written
+        """
+        written = 0
+        for (device, day), parts in self._buffer.items():
+            path = self.path(device, day)
+            if os.path.exists(path):
+                existing = {name: np.array(values) for name, values in open_partition(path).items()}
+                parts = [existing] + parts
+            write_partition(path, merge_columns(parts), device, day)
+            written += 1
+        self._buffer.clear()
+        self._buffered = 0
+        return written
+
+    def partitions(self, device=None, start=None, end=None):
+        """
+        Partitions selected by name only
+
+        Args:
+            device: IMEI, or None for all devices
+            start: Unix time of the first wanted reading, or None
+            end: Unix time of the last wanted reading, or None
+
+        Yields:
+            (device, day, path)
+        """
+        if not os.path.isdir(self.root):
+            return
+        first = day_of(start) if start is not None else None
+        last = day_of(end) if end is not None else None
+        for entry in sorted(os.listdir(self.root)):
+            if not entry.startswith('device='):
+                continue
+            name = entry[len('device='):]
+            if device is not None and name != device:
+                continue
+            directory = os.path.join(self.root, entry)
+            for filename in sorted(os.listdir(directory)):
+                match = _PARTITION.match(filename)
+                if not match:
+                    continue
+                day = match.group(1)
+                if (first and day < first) or (last and day > last):
+                    continue
+                yield name, day, os.path.join(directory, filename)
+
+    def scan(self, device=None, start=None, end=None, ranges=None):
+        """
+        Partitions selected by name and header statistics
+
+        Args:
+            ranges: {column: (low, high)}; partitions whose min/max cannot
+                overlap are skipped (None bounds are open)
+
+        Yields:
+            (device, day, path, header)
+        """
+        ranges = dict(ranges or {})
+        if start is not None or end is not None:
+            ranges['timestamp'] = (start, end)
+
+        for name, day, path in self.partitions(device, start, end):
+            header = read_header(path)
+            if all(self._overlaps(header['stats'].get(column), low, high)
+                   for column, (low, high) in ranges.items()):
+                yield name, day, path, header
+
+    @staticmethod
+    def _overlaps(stats, low, high):
+        if not stats or stats[0] is None:
+            return False
+        return (low is None or stats[1] >= low) and (high is None or stats[0] <= high)
+
+    def load(self, device=None, start=None, end=None, columns=None):
+        """
+        Read the rows of the selected partitions into memory
+
+        Returns:
+            Dict of arrays (plus 'device' when several devices match),
+            limited to [start, end]
+        """
+        names = list(columns or DTYPES)
+        if 'timestamp' not in names:
+            names.append('timestamp')
+        parts = []
+        for name, _, path, header in self.scan(device, start, end):
+            mapped = open_partition(path, names, header)
+            keep = np.ones(header['rows'], dtype=bool)
+            if start is not None:
+                keep &= mapped['timestamp'] >= start
+            if end is not None:
+                keep &= mapped['timestamp'] <= end
+            part = {column: np.array(values[keep]) for column, values in mapped.items()}
+            part['device'] = np.full(int(keep.sum()), name)
+            parts.append(part)
+
+        if not parts:
+            result = {column: np.empty(0, dtype=DTYPES[column]) for column in names}
+            result['device'] = np.empty(0, dtype='U15')
+            return result
+        return {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
+
+
+def capture_columns(readings):
+    """
+    Archive columns and IMEIs from decoded frames (df555.batch.READING_DTYPE)
+
+    Returns:
+        (imeis, columns)
+    """
+    columns = empty_columns(len(readings))
+    columns['timestamp'][:] = readings['timestamp']
+    columns['height_mm'][:] = readings['height_mm']
+    columns['temperature'][:] = readings['temperature']
+    columns['battery_mv'][:] = readings['battery_mv']
+    columns['rsrp'][:] = readings['rsrp']
+    columns['frame_count'][:] = readings['frame_count']
+    columns['status'][:] = readings['status']
+    columns['report_type'][:] = readings['report_type']
+    columns['source'][:] = SOURCE_CAPTURE
+    # device_id is '1 + IMEI' as 16 hex digits
+    imeis = readings['device_id'].astype('U16').view('U1').reshape(-1, 16)[:, 1:].copy().view('U15').ravel()
+    return imeis, columns
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def history_columns(pages):
+    """
+    Archive columns from ThingsBoard history pages (iter_history())
+
+    Units follow DingtekThingsBoardService::processTelemetryData: distance
+    / 10 is metres, level is cm, volt is 0.01 V and rsrp is 0.1 dBm.
+    """
+    rows = {}
+    for page in pages:
+        for key, values in page.items():
+            for point in values:
+                rows.setdefault(point['ts'], {})[key.lower()] = _float(point.get('value'))
+
+    stamps = sorted(rows)
+    columns = empty_columns(len(stamps))
+    columns['timestamp'][:] = [ts // 1000 for ts in stamps]
+    columns['source'][:] = SOURCE_CLOUD
+    conversions = (
+        ('distance', 'height_mm', 100),
+        ('level', 'level_mm', 10),
+        ('water_level', 'level_mm', 10),
+        ('temperature', 'temperature', 1),
+        ('temp', 'temperature', 1),
+        ('volt', 'battery_mv', 10),
+        ('voltage', 'battery_mv', 10),
+        ('rsrp', 'rsrp', 0.1),
+    )
+    for key, column, scale in conversions:
+        values = np.fromiter((rows[ts].get(key, np.nan) for ts in stamps), dtype='f8', count=len(stamps))
+        present = ~np.isnan(values)
+        columns[column][present] = values[present] * scale
+    return columns
+
+
+def backfill_captures(archive, lines):
+    """
+    Archive the frames found in capture log lines
+
+    Returns:
+        Number of readings archived
+    """
+    total = 0
+    frames = iter_hex_frames(lines)
+    while True:
+        chunk = [frame for _, frame in zip(range(CHUNK_FRAMES), frames)]
+        if not chunk:
+            break
+        imeis, columns = capture_columns(decode_frames(chunk))
+        devices, inverse = np.unique(imeis, return_inverse=True)
+        for index, device in enumerate(devices):
+            rows = np.flatnonzero(inverse == index)
+            archive.add(str(device), {name: values[rows] for name, values in columns.items()})
+        total += len(imeis)
+    archive.flush()
+    return total
+
+
+def backfill_cloud(archive, client, start, end, concurrency=8, page_size=100):
+    """
+    Archive ThingsBoard history of every device for [start, end] (unix s)
+
+    Returns:
+        Dict with 'devices', 'readings' and 'failed' counts
+    """
+    from df555.dingtek_cloud import CloudError
+
+    results = {'devices': 0, 'readings': 0, 'failed': 0}
+
+    def fetch(device):
+        pages = client.iter_history(device['id']['id'], start * 1000, end * 1000)
+        return device, history_columns(pages)
+
+    def collect(done):
+        for future in done:
+            try:
+                device, columns = future.result()
+            except (CloudError, KeyError, TypeError) as e:
+                results['failed'] += 1
+                print(f"✗ {e}")
+                continue
+            results['devices'] += 1
+            if len(columns['timestamp']):
+                archive.add(device.get('name') or device['id']['id'], columns)
+                results['readings'] += len(columns['timestamp'])
+
+    pending = set()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='backfill') as executor:
+        for device in client.iter_devices(page_size):
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(fetch, device))
+        collect(wait(pending).done)
+
+    archive.flush()
+    return results
+
+
+def _parse_time(value):
+    """'YYYY-MM-DD' or unix seconds"""
+    if value is None:
+        return None
+    return int(value) if value.isdigit() else day_start(value)
+
+
+def print_info(archive, device=None, start=None, end=None):
+    partitions = list(archive.scan(device, start, end))
+    if not partitions:
+        print("✗ No partitions selected")
+        return 1
+
+    rows = sum(header['rows'] for *_, header in partitions)
+    size = sum(os.path.getsize(path) for _, _, path, _ in partitions)
+    stats = {}
+    for *_, header in partitions:
+        for name, (low, high) in header['stats'].items():
+            if low is None:
+                continue
+            current = stats.get(name)
+            stats[name] = (min(current[0], low), max(current[1], high)) if current else (low, high)
+
+    print("=" * 60)
+    print("DF555 ARCHIVE")
+    print("=" * 60)
+    print(f"Root:        {archive.root}")
+    print(f"Devices:     {len({p[0] for p in partitions})}")
+    print(f"Partitions:  {len(partitions)} ({partitions[0][1]} .. {partitions[-1][1]})")
+    print(f"Rows:        {rows}")
+    print(f"Size:        {size / 1024:.1f} KiB ({size / max(rows, 1):.1f} bytes/row)")
+    print("-" * 60)
+    for name, _ in COLUMNS:
+        if name in stats:
+            low, high = stats[name]
+            if name == 'timestamp':
+                low, high = time.strftime('%Y-%m-%d %H:%M', time.gmtime(low)), time.strftime('%Y-%m-%d %H:%M', time.gmtime(high))
+            print(f"{name:12} min={low}  max={high}")
+    print("=" * 60)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill and inspect the DF555 columnar archive')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    captures = commands.add_parser('captures', help='Archive frames from TCP capture logs')
+    captures.add_argument('root', help='Archive directory')
+    captures.add_argument('logs', nargs='+', help='Laravel logs or hex dumps')
+
+    cloud = commands.add_parser('cloud', help='Archive Dingtek ThingsBoard history')
+    cloud.add_argument('root', help='Archive directory')
+    cloud.add_argument('--start', required=True, help="First day ('YYYY-MM-DD') or unix time")
+    cloud.add_argument('--end', help='Last day or unix time (default: now)')
+    cloud.add_argument('--concurrency', type=int, default=8, help='Devices fetched in parallel')
+    cloud.add_argument('--stub', type=int, metavar='DEVICES', help='Use a local stub cloud with this many devices')
+
+    info = commands.add_parser('info', help='Show partitions and statistics')
+    info.add_argument('root', help='Archive directory')
+    info.add_argument('--device', help='IMEI')
+    info.add_argument('--start', help="First day ('YYYY-MM-DD') or unix time")
+    info.add_argument('--end', help='Last day or unix time')
+
+    args = parser.parse_args()
+    archive = Archive(args.root)
+
+    if args.command == 'captures':
+        total = 0
+        start = time.monotonic()
+        for log in args.logs:
+            with open(log, 'r', errors='ignore') as f:
+                count = backfill_captures(archive, f)
+            print(f"✓ {log}: {count} readings")
+            total += count
+        print(f"Archived {total} readings in {time.monotonic() - start:.1f}s")
+        return 0 if total else 1
+
+    if args.command == 'cloud':
+        from df555.dingtek_cloud import TOKEN_CACHE, DingtekCloudClient, StubDingtekCloud
+
+        start = _parse_time(args.start)
+        end = _parse_time(args.end) if args.end else int(time.time())
+        if args.end and not args.end.isdigit():
+            end += 86399  # include the whole last day
+
+        stub = None
+        if args.stub:
+            stub = StubDingtekCloud(args.stub).__enter__()
+            client = DingtekCloudClient(stub.url, 'stub', 'stub', pool_size=args.concurrency)
+        else:
+            username, password = os.environ.get('DINGTEK_USERNAME'), os.environ.get('DINGTEK_PASSWORD')
+            if not username or not password:
+                print("✗ Set DINGTEK_USERNAME and DINGTEK_PASSWORD")
+                return 1
+            client = DingtekCloudClient(os.environ.get('DINGTEK_BASE_URL', 'https://cloud.dingtek.com'),
+                                        username, password, pool_size=args.concurrency, token_cache=TOKEN_CACHE)
+        began = time.monotonic()
+        try:
+            results = backfill_cloud(archive, client, start, end, args.concurrency)
+        finally:
+            client.close()
+            if stub:
+                stub.__exit__(None, None, None)
+        print(f"Archived {results['readings']} readings from {results['devices']} devices "
+              f"({results['failed']} failed) in {time.monotonic() - began:.1f}s")
+        return 0 if not results['failed'] else 1
+
+    end = _parse_time(args.end)
+    if args.end and not args.end.isdigit():
+        end += 86399
+    return print_info(archive, args.device, _parse_time(args.start), end)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Vectorized batch decoder for captured DF555 uplink reports
+Requires: pip install numpy
+
+Frames are bucketed by length (with or without GPS), each bucket is viewed
+with np.frombuffer through a big-endian record dtype, and the fields are
+copied into one native structured array in input order.
+
+Usage:
+    python3 -m df555.batch laravel.log -o readings.npy
+    python3 -m df555.batch capture.bin --binary
+"""
+
+import argparse
+import re
+import sys
+
+import numpy as np
+
+from df555 import protocol
+
+# On-the-wire layouts (packed, big-endian)
+_HEADER_FIELDS = [
+    ('head', 'u1'),
+    ('forced_bit', 'u1'),
+    ('device_type', 'u1'),
+    ('report_type', 'u1'),
+    ('packet_size', 'u1'),
+    ('height_mm', '>u2'),
+    ('gps_selection', 'u1'),
+]
+_BODY_FIELDS = [
+    ('temperature', 'u1'),
+    ('status', '>u2'),
+    ('battery', '>u2'),
+    ('rsrp', '>f4'),
+    ('frame_count', '>u2'),
+    ('timestamp', '>u4'),
+    ('device_id', 'u1', (8,)),
+    ('tail', 'u1'),
+]
+WIRE_DTYPE = np.dtype(_HEADER_FIELDS + _BODY_FIELDS)
+WIRE_DTYPE_GPS = np.dtype(_HEADER_FIELDS + [('longitude', '>f4'), ('latitude', '>f4')] + _BODY_FIELDS)
+
+# Decoded readings (native byte order)
+READING_DTYPE = np.dtype([
+    ('report_type', 'u1'),
+    ('height_mm', 'u2'),
+    ('has_gps', '?'),
+    ('longitude', 'f4'),
+    ('latitude', 'f4'),
+    ('temperature', 'u1'),
+    ('status', 'u2'),
+    ('status_full', '?'),
+    ('status_fire', '?'),
+    ('status_power', '?'),
+    ('battery_mv', 'u4'),
+    ('rsrp', 'f4'),
+    ('frame_count', 'u2'),
+    ('timestamp', 'u4'),
+    ('device_id', 'U16'),
+])
+
+_COPIED_FIELDS = ('report_type', 'height_mm', 'temperature', 'status', 'rsrp', 'frame_count', 'timestamp')
+_HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype='S1')
+_LOGGED_HEX = re.compile(r'"hex_data":"([0-9a-fA-F]+)"')
+
+
+def _hex_ids(raw):
+    """Convert an (n, 8) uint8 array of device ids to 16-digit hex strings"""
+    nibbles = np.empty((len(raw), 16), dtype=np.uint8)
+    nibbles[:, 0::2] = raw >> 4
+    nibbles[:, 1::2] = raw & 0x0F
+    return _HEX_DIGITS[nibbles].view('S16').ravel().astype('U16')
+
+
+def _decode_bucket(out, rows, wire):
+    """Fill out[rows] from a bucket of wire records"""
+    for name in _COPIED_FIELDS:
+        out[name][rows] = wire[name]
+
+    status = wire['status']
+    out['status_full'][rows] = (status & protocol.STATUS_FULL) != 0
+    out['status_fire'][rows] = (status & protocol.STATUS_FIRE) != 0
+    out['status_power'][rows] = (status & protocol.STATUS_POWER) != 0
+    out['battery_mv'][rows] = wire['battery'].astype(np.uint32) * 10
+    out['device_id'][rows] = _hex_ids(wire['device_id'])
+
+    if 'longitude' in wire.dtype.names:
+        out['has_gps'][rows] = True
+        out['longitude'][rows] = wire['longitude']
+        out['latitude'][rows] = wire['latitude']
+    else:
+        out['has_gps'][rows] = False
+        out['longitude'][rows] = np.nan
+        out['latitude'][rows] = np.nan
+
+
+def _decode_wire(out, valid, rows, wire):
+    """Validate a bucket of wire records and decode the good ones into out"""
+    gps = 1 if 'longitude' in wire.dtype.names else 0
+    ok = (
+        (wire['head'] == protocol.PACKET_HEAD)
+        & (wire['tail'] == protocol.PACKET_TAIL)
+        & ((wire['report_type'] == protocol.REPORT_TRIGGER)
+           | (wire['report_type'] == protocol.REPORT_HEARTBEAT))
+        & (wire['gps_selection'] == gps)
+    )
+    _decode_bucket(out, rows[ok], wire[ok])
+    valid[rows[ok]] = True
+
+
+def decode_frames(frames):
+    """
+    Decode a sequence of individual frames
+
+    Frames that are not trigger/heartbeat reports of a known length, or
+    whose head/tail bytes are wrong, are dropped.
+
+    Args:
+        frames: Iterable of bytes-like frames
+
+    Returns:
+        Structured array with READING_DTYPE, in input order
+    """
+    frames = list(frames)
+    lengths = np.fromiter((len(frame) for frame in frames), dtype=np.intp, count=len(frames))
+    out = np.zeros(len(frames), dtype=READING_DTYPE)
+    valid = np.zeros(len(frames), dtype=bool)
+
+    for wire_dtype in (WIRE_DTYPE, WIRE_DTYPE_GPS):
+        rows = np.flatnonzero(lengths == wire_dtype.itemsize)
+        if len(rows):
+            wire = np.frombuffer(b''.join([frames[i] for i in rows]), dtype=wire_dtype)
+            _decode_wire(out, valid, rows, wire)
+
+    return out[valid]
+
+
+def frame_offsets(buffer):
+    """
+    Locate back-to-back frames in a buffer using each header's packet size
+
+    Scanning stops at the first byte that is not a packet head or whose
+    packet size runs past the end of the buffer.
+
+    Returns:
+        (offsets, sizes) integer arrays
+    """
+    view = memoryview(buffer)
+    offsets = []
+    sizes = []
+    offset = 0
+    end = len(view)
+
+    while offset + protocol.HEADER_SIZE <= end and view[offset] == protocol.PACKET_HEAD:
+        size = view[offset + 4]
+        if size < protocol.HEADER_SIZE + 1 or offset + size > end:
+            break
+        offsets.append(offset)
+        sizes.append(size)
+        offset += size
+
+    return np.asarray(offsets, dtype=np.intp), np.asarray(sizes, dtype=np.intp)
+
+
+def decode_buffer(buffer):
+    """
+    Decode a buffer of back-to-back frames (e.g., a raw TCP capture)
+
+    Frames of each length are gathered with one fancy-indexing operation
+    rather than being sliced out one by one.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    offsets, sizes = frame_offsets(buffer)
+    out = np.zeros(len(offsets), dtype=READING_DTYPE)
+    valid = np.zeros(len(offsets), dtype=bool)
+
+    for wire_dtype in (WIRE_DTYPE, WIRE_DTYPE_GPS):
+        rows = np.flatnonzero(sizes == wire_dtype.itemsize)
+        if len(rows):
+            gathered = data[offsets[rows, None] + np.arange(wire_dtype.itemsize)]
+            _decode_wire(out, valid, rows, gathered.view(wire_dtype).ravel())
+
+    return out[valid]
+
+
+def hex_frame(line):
+    """
+    Frame of one hex dump line, or None
+
+    Accepts a plain hex line or a Laravel log line containing the hex_data
+    field written by SensorTcpServer::processSensorData.
+    """
+    match = _LOGGED_HEX.search(line)
+    text = match.group(1) if match else line.strip()
+    if not text:
+        return None
+    try:
+        return bytes.fromhex(text)
+    except ValueError:
+        return None
+
+
+def iter_hex_frames(lines):
+    """Yield frames from hex dumps, see hex_frame()"""
+    for line in lines:
+        frame = hex_frame(line)
+        if frame is not None:
+            yield frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch-decode captured DF555 uplink reports')
+    parser.add_argument('capture', help='Hex dump / Laravel log file, or raw binary with --binary')
+    parser.add_argument('--binary', action='store_true', help='Capture is raw back-to-back frames')
+    parser.add_argument('-o', '--output', help='Save decoded readings as .npy')
+    args = parser.parse_args()
+
+    if args.binary:
+        with open(args.capture, 'rb') as f:
+            readings = decode_buffer(f.read())
+    else:
+        with open(args.capture, 'r', errors='ignore') as f:
+            readings = decode_frames(iter_hex_frames(f))
+
+    print(f"Decoded {len(readings)} readings from {len(np.unique(readings['device_id']))} device(s)")
+    if args.output:
+        np.save(args.output, readings)
+        print(f"Saved to {args.output}")
+
+    return 0 if len(readings) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
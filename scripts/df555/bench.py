@@ -0,0 +1,312 @@
+"""
+Benchmark suite for the DF555 toolchain
+
+Runs reproducible (seeded) benchmarks and writes the results as JSON so
+runs can be compared over time:
+
+    codec     build_report / parse_frame / StreamFramer throughput
+    batch     NumPy batch decoder (df555.batch), skipped without numpy
+    gateway   connections/s and ack latency of an in-process gateway under
+              the simulated fleet (df555.simulator) against a stub API
+    forwarder readings/s and batches through BatchForwarder to a stub API
+    config    configure_sensor.py session duration against the virtual
+              serial emulator (df555.emulator), skipped without pyserial
+
+Usage:
+    python3 -m df555.bench --output bench-$(date +%Y%m%d).json
+    python3 -m df555.bench --only codec,batch --quick
+    python3 -m df555.bench --compare bench-20261001.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import timeit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from df555 import protocol
+from df555.simulator import LoadGenerator, VirtualSensor, percentile
+
+BENCHMARKS = ('codec', 'batch', 'gateway', 'forwarder', 'config')
+
+
+class StubApi:
+    """Local stand-in for the Laravel bulk endpoint, counting readings"""
+
+    def __init__(self):
+        self.readings = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with stub._lock:
+                    stub.requests += 1
+                    stub.readings += len(json.loads(body).get('readings', []))
+                reply = b'{"status":"success"}'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def sample_frames(count, seed=0):
+    """Frames from a seeded virtual fleet (about 30% with GPS)"""
+    rng = random.Random(seed)
+    fleet = [VirtualSensor(i, random.Random(rng.random()), start_time=1700000000) for i in range(100)]
+    return [fleet[i % len(fleet)].next_frame() for i in range(count)]
+
+
+def per_second(fn, items, repeat):
+    """Best-of-repeat rate of fn(), which processes items things per call"""
+    best = min(timeit.repeat(fn, number=1, repeat=repeat))
+    return round(items / best, 1)
+
+
+def bench_codec(args):
+    frames = sample_frames(args.frames)
+    stream = b''.join(frames)
+    fields = dict(height_mm=1234, device_id='1868000000000001', rsrp=-95.5,
+                  frame_count=7, timestamp=1700000000)
+
+    def encode():
+        for _ in range(args.frames):
+            protocol.build_report(**fields)
+
+    def decode():
+        for frame in frames:
+            protocol.parse_frame(frame)
+
+    def frame_stream():
+        framer = protocol.StreamFramer()
+        for offset in range(0, len(stream), 1460):
+            framer.feed(stream[offset:offset + 1460])
+
+    return {
+        'frames': args.frames,
+        'encode_per_s': per_second(encode, args.frames, args.repeat),
+        'decode_per_s': per_second(decode, args.frames, args.repeat),
+        'framer_per_s': per_second(frame_stream, args.frames, args.repeat),
+    }
+
+
+def bench_batch(args):
+    try:
+        from df555 import batch
+    except ImportError as e:
+        return {'skipped': str(e)}
+
+    frames = sample_frames(args.frames)
+    stream = b''.join(frames)
+    return {
+        'frames': args.frames,
+        'decode_frames_per_s': per_second(lambda: batch.decode_frames(frames), args.frames, args.repeat),
+        'decode_buffer_per_s': per_second(lambda: batch.decode_buffer(stream), args.frames, args.repeat),
+    }
+
+
+def bench_gateway(args):
+    from df555.gateway import SensorGateway
+
+    async def run(api):
+        gateway = SensorGateway('127.0.0.1', 0, api_url=api.url, api_key='')
+        await gateway.start()
+        port = gateway.server.sockets[0].getsockname()[1]
+        generator = LoadGenerator('127.0.0.1', port, sensors=1000, rate=args.rate,
+                                  concurrency=args.concurrency, seed=0)
+        summary = await generator.run(count=args.connections)
+        await gateway.stop()
+        return summary
+
+    with StubApi() as api:
+        summary = asyncio.run(run(api))
+        summary['forwarded'] = api.readings
+        summary['api_requests'] = api.requests
+    return summary
+
+
+def bench_forwarder(args):
+    from df555.forwarder import BatchForwarder, HttpPool
+
+    readings = [{'device_id': f'1868{i % 1000:012d}', 'distance': 1.2, 'frame_count': i}
+                for i in range(args.readings)]
+
+    async def run(api):
+        pool = HttpPool(api.url)
+        forwarder = BatchForwarder(pool)
+        forwarder.start()
+        start = time.perf_counter()
+        for reading in readings:
+            forwarder.submit(reading)
+            if forwarder.pending >= forwarder.max_batch * pool.size:
+                # Yield to the flush loop, like a gateway between connections
+                await asyncio.sleep(0)
+        while forwarder.stats['forwarded'] + forwarder.stats['failed'] < len(readings):
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        await forwarder.stop()
+        pool.close()
+        return forwarder.stats, elapsed
+
+    with StubApi() as api:
+        stats, elapsed = asyncio.run(run(api))
+    return {
+        'readings': len(readings),
+        'forwarded': stats['forwarded'],
+        'batches': stats['batches'],
+        'elapsed': round(elapsed, 3),
+        'readings_per_s': round(stats['forwarded'] / elapsed, 1),
+    }
+
+
+def bench_config(args):
+    try:
+        from configure_sensor import DF555Configurator
+        from df555.emulator import SerialEmulator
+    except ImportError as e:
+        return {'skipped': str(e)}
+
+    durations = []
+    ok = 0
+    with SerialEmulator(always_awake=True, latency=args.serial_latency) as emulator:
+        for _ in range(args.sessions):
+            configurator = DF555Configurator(emulator.port)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if configurator.connect():
+                    batch = configurator.build_batch(('66.241.124.67', 8888), ('66.241.124.67', 8889), '02')
+                    report = configurator.apply(batch)
+                    ok += all(result['ok'] for result in report['results'])
+                    configurator.disconnect()
+            durations.append(time.perf_counter() - start)
+
+    durations.sort()
+    return {
+        'sessions': args.sessions,
+        'ok': ok,
+        'serial_latency': args.serial_latency,
+        'session_ms': {
+            'p50': round(percentile(durations, 50) * 1000, 3),
+            'max': round(durations[-1] * 1000, 3),
+        },
+    }
+
+
+def metadata():
+    """Where and on what the benchmarks ran"""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        revision = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def flatten(results, prefix=''):
+    """Numeric leaves of a results dict as {'a.b.c': value}"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline, current):
+    """Print every numeric result next to its baseline value"""
+    old = flatten(baseline.get('results', {}))
+    new = flatten(current['results'])
+    print("=" * 60)
+    print(f"COMPARED WITH {baseline.get('meta', {}).get('git_revision')} "
+          f"({baseline.get('meta', {}).get('timestamp')})")
+    print("=" * 60)
+    for name in sorted(new):
+        if name not in old:
+            continue
+        change = f"{(new[name] - old[name]) / old[name] * 100:+.1f}%" if old[name] else ''
+        print(f"{name:40} {old[name]:>12} → {new[name]:>12} {change}")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the DF555 toolchain')
+    parser.add_argument('--only', help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--quick', action='store_true', help='Smaller workloads for a fast check')
+    parser.add_argument('--output', help='Write results JSON to this file')
+    parser.add_argument('--compare', help='Baseline results JSON to compare against')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions of timed loops (best is kept)')
+    parser.add_argument('--rate', type=float, default=2000, help='Gateway benchmark connections per second')
+    parser.add_argument('--concurrency', type=int, default=200, help='Gateway benchmark concurrent connections')
+    parser.add_argument('--serial-latency', type=float, default=0.005, help='Emulated sensor reply latency')
+    args = parser.parse_args()
+
+    args.frames = 2000 if args.quick else 20000
+    args.connections = 500 if args.quick else 5000
+    args.readings = 2000 if args.quick else 50000
+    args.sessions = 3 if args.quick else 20
+
+    selected = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.WARNING)
+    functions = {'codec': bench_codec, 'batch': bench_batch, 'gateway': bench_gateway,
+                 'forwarder': bench_forwarder, 'config': bench_config}
+
+    output = {'meta': metadata(), 'results': {}}
+    for name in selected:
+        print(f"⏱  {name} ...", file=sys.stderr)
+        output['results'][name] = functions[name](args)
+
+    print(json.dumps(output, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"✓ Results written to {args.output}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Duplicate report suppression
+
+A DF555 retransmits a report when it misses the "OK" ack, and in dual
+server mode (configure_both_servers.py) every report arrives twice. Each
+copy would otherwise become its own SensorReading row and Firebase write.
+
+DedupCache remembers recently seen reports by (device_id, frame_count,
+timestamp) in an LRU bounded both in size and in age, so a duplicate is
+dropped before it costs an HTTP call or a database insert. Each gateway
+process has its own cache; across processes the bulk API drops repeated
+report keys (see SensorGateway shared_dedup).
+"""
+
+import time
+from collections import OrderedDict
+
+# Remember up to this many reports, for at most this many seconds
+DEDUP_SIZE = 100000
+DEDUP_WINDOW = 3600.0
+
+
+def report_key(parsed):
+    """
+    Identity of a decoded report
+
+    Returns:
+        (device_id, frame_count, timestamp), or None for reports without a
+        frame counter (ASCII formats), which are never deduplicated
+    """
+    if 'frame_count' not in parsed:
+        return None
+    return (parsed.get('device_id'), parsed['frame_count'], parsed.get('timestamp'))
+
+
+class DedupCache:
+    """Size- and time-bounded LRU set of recently seen report keys"""
+
+    def __init__(self, max_size=DEDUP_SIZE, window=DEDUP_WINDOW, clock=time.monotonic):
+        """
+        Initialize cache
+
+        Args:
+            max_size: Maximum number of keys kept (least recently seen go first)
+            window: Seconds a key is remembered
+            clock: Time source, monotonic seconds
+        """
+        self.max_size = max_size
+        self.window = window
+        self.clock = clock
+        self._seen = OrderedDict()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+        }
+
+    def __len__(self):
+        return len(self._seen)
+
+    def _expire(self, now):
+        """Drop keys older than the window (oldest are at the front)"""
+        seen = self._seen
+        cutoff = now - self.window
+        while seen:
+            key, added = next(iter(seen.items()))
+            if added > cutoff:
+                break
+            del seen[key]
+            self.stats['evictions'] += 1
+
+    def contains(self, key):
+        """
+        Check for a duplicate without remembering key
+
+        Counts a hit or a miss.
+        """
+        self._expire(self.clock())
+        if key in self._seen:
+            self.stats['hits'] += 1
+            return True
+        self.stats['misses'] += 1
+        return False
+
+    def add(self, key):
+        """Remember key as seen now"""
+        now = self.clock()
+        seen = self._seen
+        seen[key] = now
+        seen.move_to_end(key)
+        while len(seen) > self.max_size:
+            seen.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def seen(self, key):
+        """
+        Check and remember key in one step
+
+        Returns:
+            True if key was seen within the window (a duplicate)
+        """
+        if self.contains(key):
+            # A retransmission keeps the entry fresh
+            self.add(key)
+            return True
+        self.add(key)
+        return False
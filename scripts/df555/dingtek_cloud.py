@@ -0,0 +1,637 @@
+"""
+Concurrent Dingtek ThingsBoard sync worker
+
+Python counterpart of `php artisan dingtek:sync`
+(DingtekThingsBoardService::syncAllDevices). Instead of fetching each
+device's telemetry one after another, it:
+
+- reuses one JWT, cached on disk until shortly before it expires (like the
+  dingtek_auth_token cache entry), and logs in again on 401
+- streams the device list page by page
+- fetches telemetry with bounded concurrency over a pooled keep-alive
+  HTTP client
+- backs off on 429/5xx, honouring Retry-After, and pauses every thread
+  while the cloud is rate limiting
+- posts the raw telemetry in batches to /api/sensors/dingtek/telemetry,
+  where the app stores it with the same service code as the PHP command
+  (sensors keyed by ThingsBoard device id, IMEI from the device name)
+
+Removing sensors that no longer exist in Dingtek stays with the PHP
+command.
+
+Usage:
+    DINGTEK_USERNAME=... DINGTEK_PASSWORD=... APP_URL=... python3 -m df555.dingtek_cloud
+    python3 -m df555.dingtek_cloud --stub 2000 --stub-rate-limit 300   # local stub cloud
+"""
+
+import argparse
+import base64
+import contextlib
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from df555.forwarder import MAX_BATCH, HttpPool
+
+logger = logging.getLogger('df555.dingtek_cloud')
+
+DEFAULT_BASE_URL = 'https://cloud.dingtek.com'
+USER_DEVICES = '/api/user/devices'
+TENANT_DEVICES = '/api/tenant/devices'
+
+# SensorController::receiveDingtekTelemetry; takes up to MAX_BATCH devices
+TELEMETRY_PATH = '/api/sensors/dingtek/telemetry'
+
+# Tokens usually expire in 24 h; the PHP service caches them for 23 h
+TOKEN_TTL = 23 * 3600
+TOKEN_MARGIN = 300
+TOKEN_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'df555', 'dingtek_token.json')
+
+# Keys and page size for historical telemetry (getHistoricalTelemetry)
+HISTORY_KEYS = 'distance,level,temperature,volt,rsrp'
+HISTORY_LIMIT = 1000
+
+MAX_RETRIES = 5
+BACKOFF_MIN = 0.5
+BACKOFF_MAX = 30.0
+
+
+class CloudError(Exception):
+    """Raised when the Dingtek cloud cannot be queried"""
+
+
+def jwt_expiry(token):
+    """Expiry (unix time) from a JWT's 'exp' claim, or None"""
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def retry_after(headers):
+    """Seconds from a Retry-After header, or None"""
+    value = headers.get('Retry-After') if headers else None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class DingtekCloudClient:
+    """Thread-safe ThingsBoard REST client with a shared, reused JWT"""
+
+    def __init__(self, base_url, username, password, pool_size=8, timeout=60,
+                 token_cache=None, max_retries=MAX_RETRIES):
+        """
+        Initialize client
+
+        Args:
+            base_url: Dingtek ThingsBoard URL
+            username: Account username
+            password: Account password
+            pool_size: Keep-alive connections (the fetch concurrency)
+            timeout: Socket timeout in seconds
+            token_cache: File to keep the JWT in between runs, or None
+            max_retries: Attempts per request on 429, 5xx and network errors
+        """
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.pool = HttpPool(base_url, size=pool_size, timeout=timeout)
+        self.token_cache = token_cache
+        self.max_retries = max_retries
+        self.stats = {
+            'requests': 0,
+            'logins': 0,
+            'rate_limited': 0,
+            'retries': 0,
+        }
+        self._token = None
+        self._expires_at = 0.0
+        self._token_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._pause_until = 0.0
+        self._load_token()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _load_token(self):
+        if not self.token_cache:
+            return
+        try:
+            with open(self.token_cache) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return
+        if cached.get('base_url') == self.base_url and cached.get('username') == self.username:
+            self._token = cached.get('token')
+            self._expires_at = float(cached.get('expires_at', 0))
+
+    def _save_token(self):
+        if not self.token_cache:
+            return
+        os.makedirs(os.path.dirname(self.token_cache) or '.', exist_ok=True)
+        tmp = self.token_cache + '.tmp'
+        with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump({'base_url': self.base_url, 'username': self.username,
+                       'token': self._token, 'expires_at': self._expires_at}, f)
+        os.replace(tmp, self.token_cache)
+
+    def login(self):
+        """
+        Authenticate and cache the token
+
+        Raises:
+            CloudError: if the cloud rejects the credentials
+        """
+        body = json.dumps({'username': self.username, 'password': self.password}).encode()
+        try:
+            status, data = self.pool.request('POST', '/api/auth/login', body=body)
+        except (http.client.HTTPException, OSError) as e:
+            raise CloudError(f"Login failed: {e}") from e
+        self._count('logins')
+        if status != 200:
+            raise CloudError(f"Login failed with HTTP {status}: {data[:200]!r}")
+        token = json.loads(data).get('token')
+        if not token:
+            raise CloudError("No token in authentication response")
+
+        expiry = jwt_expiry(token)
+        self._token = token
+        self._expires_at = min(time.time() + TOKEN_TTL, expiry - TOKEN_MARGIN if expiry else float('inf'))
+        self._save_token()
+        logger.info("Authenticated with Dingtek ThingsBoard as %s", self.username)
+        return token
+
+    def token(self, stale=None):
+        """
+        Current token, logging in only when there is none or it expired
+
+        Args:
+            stale: A token the cloud just rejected; refreshed unless another
+                thread already replaced it
+        """
+        with self._token_lock:
+            if self._token and self._token != stale and time.time() < self._expires_at:
+                return self._token
+            return self.login()
+
+    def _pause(self, seconds):
+        """Hold back every thread (the rate limit applies to the account)"""
+        with self._token_lock:
+            self._pause_until = max(self._pause_until, time.monotonic() + seconds)
+
+    def get_json(self, path, params=None):
+        """
+        GET a JSON resource with retry and backoff
+
+        Raises:
+            CloudError: on a non-retryable status or when retries run out
+        """
+        if params:
+            path = f"{path}?{urllib.parse.urlencode(params)}"
+        refreshed = False
+        error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count('retries')
+            delay = self._pause_until - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            token = self.token()
+            backoff = min(BACKOFF_MIN * 2 ** attempt, BACKOFF_MAX) * random.uniform(0.5, 1.0)
+            try:
+                self._count('requests')
+                status, headers, data = self.pool.fetch('GET', path, headers={'X-Authorization': f'Bearer {token}'})
+            except (http.client.HTTPException, OSError) as e:
+                error = str(e)
+                time.sleep(backoff)
+                continue
+
+            if status == 200:
+                return json.loads(data) if data else None
+            if status == 401 and not refreshed:
+                refreshed = True
+                self.token(stale=token)
+                continue
+            if status == 429:
+                self._count('rate_limited')
+                self._pause(retry_after(headers) or backoff)
+                error = 'HTTP 429'
+                continue
+            if status >= 500:
+                error = f'HTTP {status}'
+                time.sleep(retry_after(headers) or backoff)
+                continue
+            raise CloudError(f"HTTP {status} for {path}: {data[:200]!r}")
+
+        raise CloudError(f"Giving up on {path} after {self.max_retries + 1} attempts ({error})")
+
+    def iter_devices(self, page_size=100, endpoint=USER_DEVICES):
+        """Yield devices page by page (ThingsBoard PageData)"""
+        page = 0
+        while True:
+            data = self.get_json(endpoint, {'pageSize': page_size, 'page': page}) or {}
+            devices = data.get('data') or []
+            yield from devices
+            has_next = data.get('hasNext')
+            if not devices or has_next is False or (has_next is None and len(devices) < page_size):
+                break
+            page += 1
+
+    def get_telemetry(self, device_id, keys=None):
+        """Latest time series values of a device"""
+        params = {'keys': keys} if keys else None
+        return self.get_json(f'/api/plugins/telemetry/DEVICE/{device_id}/values/timeseries', params)
+
+    def iter_history(self, device_id, start_ts, end_ts, keys=HISTORY_KEYS, limit=HISTORY_LIMIT):
+        """
+        Yield historical telemetry for [start_ts, end_ts] (unix ms) in pages
+
+        ThingsBoard returns at most limit points per key, newest first, so
+        the window end moves back past the oldest point of any key that
+        filled its page until every key comes back short. Pages can overlap
+        for keys that were already complete; callers deduplicate by 'ts'.
+
+        Yields:
+            {key: [{'ts': ms, 'value': str}, ...]} dicts
+        """
+        path = f'/api/plugins/telemetry/DEVICE/{device_id}/values/timeseries'
+        end = end_ts
+        while end >= start_ts:
+            page = self.get_json(path, {'keys': keys, 'startTs': start_ts, 'endTs': end, 'limit': limit}) or {}
+            yield page
+            full = [values[-1]['ts'] for values in page.values() if len(values) >= limit]
+            if not full:
+                break
+            end = max(full) - 1
+
+    def close(self):
+        self.pool.close()
+
+
+def telemetry_entry(device, telemetry):
+    """
+    Wrap a device and its latest telemetry for the telemetry endpoint
+
+    The telemetry is posted as ThingsBoard returned it; the app maps keys and
+    units in DingtekThingsBoardService::processTelemetryData, like it does
+    for `php artisan dingtek:sync`.
+
+    Returns:
+        {'device': ..., 'telemetry': ...} dict, or None if there is no
+        telemetry to store
+    """
+    device_id = (device.get('id') or {}).get('id')
+    if not device_id or not telemetry or not any(values for values in telemetry.values()):
+        return None
+    return {
+        'device': {key: device[key] for key in ('id', 'name', 'type') if key in device},
+        'telemetry': telemetry,
+    }
+
+
+def post_batch(api, batch, max_retries=MAX_RETRIES):
+    """
+    Post device telemetry to the telemetry endpoint, retrying with backoff
+
+    Returns:
+        Response dict ('synced', 'failed', 'errors') if the API accepted the
+        batch, otherwise None
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            status, body = api.post_json(TELEMETRY_PATH, {'devices': batch})
+            if 200 <= status < 300:
+                return json.loads(body) if body else {}
+            logger.warning("Telemetry post returned HTTP %s: %r", status, body[:200])
+            if status < 500 and status != 429:
+                return None
+        except (http.client.HTTPException, OSError) as e:
+            logger.warning("Telemetry post failed: %s", e)
+        time.sleep(min(BACKOFF_MIN * 2 ** attempt, BACKOFF_MAX))
+    return None
+
+
+def sync_devices(client, api=None, concurrency=8, page_size=100, batch_size=MAX_BATCH, endpoint=USER_DEVICES):
+    """
+    Sync latest telemetry of every device
+
+    Args:
+        client: DingtekCloudClient
+        api: HttpPool for the Laravel app, or None for a dry run
+        concurrency: Telemetry requests in flight
+        page_size: Devices per page
+        batch_size: Devices per telemetry request
+        endpoint: USER_DEVICES or TENANT_DEVICES
+
+    Returns:
+        Results dict like syncAllDevices() plus posting counters
+    """
+    results = {'devices': 0, 'synced': 0, 'failed': 0, 'no_data': 0,
+               'posted': 0, 'post_failed': 0, 'batches': 0, 'errors': []}
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        response = {} if api is None else post_batch(api, batch)
+        if response is None:
+            results['post_failed'] += len(batch)
+        else:
+            results['posted'] += len(batch)
+            results['batches'] += 1
+            # Devices the app could not store (processTelemetryData threw)
+            for error in response.get('errors') or []:
+                results['synced'] -= 1
+                results['failed'] += 1
+                results['errors'].append(f"{error.get('device_id')}: {error.get('error')}")
+        batch.clear()
+
+    def fetch(device):
+        return device, client.get_telemetry(device['id']['id'])
+
+    def collect(done):
+        for future in done:
+            try:
+                device, telemetry = future.result()
+            except (CloudError, KeyError, TypeError) as e:
+                results['failed'] += 1
+                results['errors'].append(str(e))
+                logger.error("Failed to sync device: %s", e)
+                continue
+            entry = telemetry_entry(device, telemetry)
+            if entry is None:
+                results['no_data'] += 1
+                continue
+            results['synced'] += 1
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                flush()
+
+    pending = set()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='dingtek') as executor:
+        for device in client.iter_devices(page_size, endpoint):
+            results['devices'] += 1
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(fetch, device))
+        collect(wait(pending).done)
+
+    flush()
+    return results
+
+
+class StubDingtekCloud:
+    """
+    Local stand-in for the Dingtek ThingsBoard REST API
+
+    Serves login, paged device lists and latest telemetry for a generated
+    fleet, with optional per-request latency and a requests-per-second
+    limit answered with 429 and Retry-After.
+    """
+
+    def __init__(self, devices=100, latency=0.0, rate_limit=None, token_ttl=3600, seed=0):
+        rng = random.Random(seed)
+        self.devices = [
+            {
+                'id': {'entityType': 'DEVICE', 'id': str(uuid.UUID(int=rng.getrandbits(128)))},
+                'name': f'{860000000000000 + i:015d}',
+                'type': 'DF555',
+            }
+            for i in range(devices)
+        ]
+        self.by_id = {d['id']['id']: d for d in self.devices}
+        self.index = {d['id']['id']: i for i, d in enumerate(self.devices)}
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.token_ttl = token_ttl
+        self.stats = {'logins': 0, 'requests': 0, 'rate_limited': 0, 'unauthorized': 0}
+        self._tokens = {}
+        self._window = (0, 0)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def issue_token(self):
+        exp = int(time.time() + self.token_ttl)
+        claims = base64.urlsafe_b64encode(json.dumps({'sub': 'stub', 'exp': exp}).encode()).rstrip(b'=')
+        token = f'eyJhbGciOiJub25lIn0.{claims.decode()}.{uuid.uuid4().hex}'
+        self._tokens[token] = exp
+        return token
+
+    def _limited(self):
+        if not self.rate_limit:
+            return False
+        second = int(time.monotonic())
+        with self._lock:
+            window, count = self._window
+            count = count + 1 if window == second else 1
+            self._window = (second, count)
+            return count > self.rate_limit
+
+    def telemetry(self, device_id):
+        index = self.index[device_id]
+        ts = int(time.time() * 1000) - index * 1000
+        return {key: [{'ts': ts, 'value': value}] for key, value in self._values(index, ts).items()}
+
+    def _values(self, index, ts):
+        hour = ts // 3600000
+        return {
+            'distance': str(5 + (index * 37 + hour * 11) % 150 / 10),
+            'temperature': str(20 + (index + hour) % 10),
+            'volt': str(340 + (index + hour // 24) % 40),
+            'rsrp': str(-700 - (index * 7 + hour) % 300),
+        }
+
+    def history(self, device_id, start_ts, end_ts, limit, keys=None):
+        """Hourly history, newest first, at most limit points per key"""
+        index = self.index[device_id]
+        first = -(-start_ts // 3600000) * 3600000
+        last = end_ts // 3600000 * 3600000
+        points = range(last, first - 1, -3600000)[:limit]
+        series = {}
+        for ts in points:
+            for key, value in self._values(index, ts).items():
+                if keys is None or key in keys:
+                    series.setdefault(key, []).append({'ts': ts, 'value': value})
+        return series
+
+    def _handler(self):
+        stub = self
+        telemetry_path = re.compile(r'^/api/plugins/telemetry/DEVICE/([^/]+)/values/timeseries$')
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def reply(self, status, payload=None, headers=None):
+                body = json.dumps(payload).encode() if payload is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def gate(self):
+                """Latency, rate limit and auth shared by all endpoints"""
+                with stub._lock:
+                    stub.stats['requests'] += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub._limited():
+                    with stub._lock:
+                        stub.stats['rate_limited'] += 1
+                    self.reply(429, {'message': 'Too many requests'}, {'Retry-After': '1'})
+                    return False
+                return True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not self.gate():
+                    return
+                if self.path != '/api/auth/login' or not json.loads(body or b'{}').get('password'):
+                    self.reply(401, {'message': 'Authentication failed'})
+                    return
+                with stub._lock:
+                    stub.stats['logins'] += 1
+                    token = stub.issue_token()
+                self.reply(200, {'token': token, 'refreshToken': uuid.uuid4().hex})
+
+            def do_GET(self):
+                if not self.gate():
+                    return
+                token = (self.headers.get('X-Authorization') or '').removeprefix('Bearer ')
+                if stub._tokens.get(token, 0) < time.time():
+                    with stub._lock:
+                        stub.stats['unauthorized'] += 1
+                    self.reply(401, {'message': 'Token has expired'})
+                    return
+
+                url = urllib.parse.urlsplit(self.path)
+                query = dict(urllib.parse.parse_qsl(url.query))
+                if url.path in (USER_DEVICES, TENANT_DEVICES):
+                    size = int(query.get('pageSize', 100))
+                    page = int(query.get('page', 0))
+                    data = stub.devices[page * size:(page + 1) * size]
+                    total_pages = -(-len(stub.devices) // size)
+                    self.reply(200, {'data': data, 'totalPages': total_pages,
+                                     'totalElements': len(stub.devices), 'hasNext': page + 1 < total_pages})
+                    return
+
+                match = telemetry_path.match(url.path)
+                if match and match.group(1) in stub.by_id and 'startTs' in query:
+                    keys = query['keys'].split(',') if query.get('keys') else None
+                    self.reply(200, stub.history(match.group(1), int(query['startTs']), int(query['endTs']),
+                                                 int(query.get('limit', 100)), keys))
+                    return
+                if match and match.group(1) in stub.by_id:
+                    self.reply(200, stub.telemetry(match.group(1)))
+                    return
+                self.reply(404, {'message': 'Not found'})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync Dingtek ThingsBoard telemetry into the Laravel app')
+    parser.add_argument('--base-url', default=os.environ.get('DINGTEK_BASE_URL', DEFAULT_BASE_URL),
+                        help='Dingtek ThingsBoard URL (default: $DINGTEK_BASE_URL)')
+    parser.add_argument('--api-url', default=os.environ.get('APP_URL'), help='Laravel app URL (default: $APP_URL)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Telemetry requests in flight')
+    parser.add_argument('--page-size', type=int, default=100, help='Devices per page')
+    parser.add_argument('--tenant', action='store_true', help='List tenant devices instead of user devices')
+    parser.add_argument('--token-cache', default=TOKEN_CACHE, help='File to reuse the JWT from')
+    parser.add_argument('--dry-run', action='store_true', help='Fetch telemetry but do not post it')
+    parser.add_argument('--stub', type=int, metavar='DEVICES', help='Run against a local stub cloud with this many devices')
+    parser.add_argument('--stub-latency', type=float, default=0.02, help='Stub cloud latency per request (seconds)')
+    parser.add_argument('--stub-rate-limit', type=int, help='Stub cloud requests per second before 429')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    with contextlib.ExitStack() as stack:
+        username = os.environ.get('DINGTEK_USERNAME')
+        password = os.environ.get('DINGTEK_PASSWORD')
+        token_cache = args.token_cache
+        if args.stub:
+            stub = stack.enter_context(StubDingtekCloud(args.stub, args.stub_latency, args.stub_rate_limit))
+            args.base_url, username, password, token_cache = stub.url, 'stub', 'stub', None
+            if not args.api_url:
+                args.dry_run = True
+
+        if not username or not password:
+            print("✗ Dingtek service is not configured. Set DINGTEK_USERNAME and DINGTEK_PASSWORD.")
+            return 1
+        if not args.api_url and not args.dry_run:
+            print("✗ Set APP_URL or --api-url (or use --dry-run)")
+            return 1
+
+        client = DingtekCloudClient(args.base_url, username, password, pool_size=args.concurrency,
+                                    token_cache=token_cache)
+        api = None if args.dry_run else HttpPool(args.api_url, api_key=os.environ.get('SENSOR_API_KEY'))
+
+        start = time.monotonic()
+        try:
+            results = sync_devices(client, api, args.concurrency, args.page_size,
+                                   endpoint=TENANT_DEVICES if args.tenant else USER_DEVICES)
+        except CloudError as e:
+            print(f"✗ Sync failed: {e}")
+            return 1
+        finally:
+            client.close()
+            if api:
+                api.close()
+        elapsed = time.monotonic() - start
+
+    print("=" * 60)
+    print("DINGTEK SYNC COMPLETED" + (" (dry run)" if args.dry_run else ""))
+    print("=" * 60)
+    print(f"Devices listed:   {results['devices']}")
+    print(f"Devices synced:   {results['synced']}")
+    print(f"No telemetry:     {results['no_data']}")
+    print(f"Failed:           {results['failed']}")
+    print(f"{'Would post:' if args.dry_run else 'Posted:':18}{results['posted']} in {results['batches']} batches"
+          + (f" ({results['post_failed']} failed)" if results['post_failed'] else ""))
+    print(f"Cloud requests:   {client.stats['requests']} (logins {client.stats['logins']}, "
+          f"rate limited {client.stats['rate_limited']}, retries {client.stats['retries']})")
+    print(f"Elapsed:          {elapsed:.2f}s")
+    print("=" * 60)
+    for error in results['errors'][:10]:
+        print(f"  ✗ {error}")
+
+    return 0 if results['failed'] == 0 and results['post_failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Virtual serial DF555 emulator (Linux/macOS)
+
+Creates a pseudo-terminal that behaves like the DF555 TTL debug port: it
+parses `80 <type> 9999 <cmd> <content> 81` downlink commands, replies the
+way the configuration tools expect, and only listens during the wake
+window after a (simulated) magnet reset. Reply latency and dropped bytes
+can be injected to exercise timing-sensitive code.
+
+Usage:
+    python3 -m df555.emulator                 # prints the port, Enter = magnet reset
+    python3 configure_sensor.py /dev/pts/5 --server1 66.241.124.67 8888
+
+In code:
+    with SerialEmulator(latency=0.02) as emulator:
+        emulator.wake()
+        run_tool(emulator.port)
+"""
+
+import argparse
+import os
+import random
+import select
+import sys
+import threading
+import time
+import tty
+
+from df555 import protocol
+
+# The sensor accepts commands for 2-3 seconds after a magnet reset
+WAKE_WINDOW = 3.0
+
+DEFAULT_PARAMS = {
+    'server1': '129.226.11.30;10560;',
+    'server2': '0.0.0.0;0;',
+    'server_mode': '00',
+}
+DEFAULT_IMEI = '868000000000001'
+
+# Content length of fixed-size commands; server commands end at the second ';'
+_FIXED_CONTENT = {protocol.CMD_SWITCH_FUNCTION: 2}
+_SERVER_COMMANDS = {
+    protocol.CMD_SET_SERVER1: ('server1', 'Server1'),
+    protocol.CMD_SET_SERVER2: ('server2', 'Server2'),
+}
+_HEADER_LEN = 10  # 80 + type + password + command code
+
+
+def dump_params(params):
+    """Parameter dump sent in reply to a query command"""
+    lines = [f'IMEI:{params["imei"]}'] if params.get('imei') else []
+    lines += [f'{label}:{params[key]}' for key, label in protocol.PARAM_LABELS]
+    return ('\r\n'.join(lines) + '\r\nOK\r\n').encode('ascii')
+
+
+def apply_command(params, frame):
+    """
+    Apply a downlink command to a sensor's parameters, like the firmware
+
+    Args:
+        params: Parameter dict (see DEFAULT_PARAMS), updated in place
+        frame: Complete command string ('80...81')
+
+    Returns:
+        Reply bytes
+    """
+    command_type = frame[2:4]
+    password = frame[4:8]
+    cmd = frame[8:10]
+    content = frame[10:-2]
+
+    if password != protocol.PASSWORD:
+        return b'Password error\r\n'
+
+    if command_type == protocol.COMMAND_TYPE_QUERY:
+        return dump_params(params)
+    if command_type == protocol.COMMAND_TYPE_RESET:
+        # Factory reset restores the settings; the IMEI is the modem's
+        params.update(DEFAULT_PARAMS)
+        return b'Reset OK\r\n'
+    if cmd in _SERVER_COMMANDS:
+        key, label = _SERVER_COMMANDS[cmd]
+        params[key] = content
+        return f'{label}:{content}OK\r\n'.encode('ascii')
+    if cmd == protocol.CMD_SWITCH_FUNCTION:
+        params['server_mode'] = content
+        return f'ServerMode:{content}OK\r\n'.encode('ascii')
+    return b'Command error\r\n'
+
+
+class SerialEmulator:
+    """A DF555 on the far side of a pty"""
+
+    def __init__(self, wake_window=WAKE_WINDOW, latency=0.0, drop_rate=0.0,
+                 always_awake=False, params=None, seed=None, imei=DEFAULT_IMEI):
+        """
+        Initialize emulator
+
+        Args:
+            wake_window: Seconds the sensor listens after wake()
+            latency: Seconds before each reply is written
+            drop_rate: Probability of dropping each reply byte
+            always_awake: Ignore the wake window
+            params: Initial parameters (defaults to DEFAULT_PARAMS)
+            seed: Seed for reproducible byte drops
+            imei: IMEI reported in the query dump
+        """
+        self.wake_window = wake_window
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.always_awake = always_awake
+        self.params = dict(params or DEFAULT_PARAMS)
+        self.params.setdefault('imei', imei)
+        self.rng = random.Random(seed)
+        self.commands = []
+        self.ignored_bytes = 0
+        self._awake_until = 0.0
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._running = False
+        self.port = None
+
+    def start(self):
+        """Open the pty and start serving"""
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the pty"""
+        self._running = False
+        if self._thread:
+            self._thread.join()
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def wake(self, boot_report=True):
+        """Simulate a magnet reset: open the wake window and report once"""
+        with self._lock:
+            self._awake_until = time.monotonic() + self.wake_window
+            self._buffer.clear()
+        if boot_report:
+            self._write(b'DF555 boot\r\n')
+
+    @property
+    def awake(self):
+        return self.always_awake or time.monotonic() < self._awake_until
+
+    def _serve(self):
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                break
+            with self._lock:
+                if not self.awake:
+                    self.ignored_bytes += len(data)
+                    continue
+                self._buffer += data
+                frames = self._take_frames()
+            for frame in frames:
+                self._handle(frame)
+
+    def _take_frames(self):
+        """Split complete ASCII commands off the receive buffer"""
+        frames = []
+        while True:
+            start = self._buffer.find(b'80')
+            if start < 0:
+                self._buffer.clear()
+                break
+            del self._buffer[:start]
+            if len(self._buffer) < _HEADER_LEN:
+                break
+
+            command_type = self._buffer[2:4].decode('ascii', errors='replace')
+            cmd = self._buffer[8:10].decode('ascii', errors='replace')
+            if command_type in (protocol.COMMAND_TYPE_QUERY, protocol.COMMAND_TYPE_RESET):
+                # Query and reset carry no content
+                end = _HEADER_LEN
+            elif cmd in _SERVER_COMMANDS:
+                first = self._buffer.find(b';', _HEADER_LEN)
+                second = self._buffer.find(b';', first + 1) if first >= 0 else -1
+                if second < 0:
+                    break
+                end = second + 1
+            else:
+                end = _HEADER_LEN + _FIXED_CONTENT.get(cmd, 0)
+
+            if len(self._buffer) < end + 2:
+                break
+            if self._buffer[end:end + 2] != b'81':
+                # Not a valid command; resync on the next '80'
+                del self._buffer[:2]
+                continue
+            frames.append(bytes(self._buffer[:end + 2]).decode('ascii', errors='replace'))
+            del self._buffer[:end + 2]
+        return frames
+
+    def _handle(self, frame):
+        """Apply a command and reply"""
+        self.commands.append(frame)
+        self._reply(apply_command(self.params, frame))
+
+    def dump_params(self):
+        """Parameter dump sent in reply to a query command"""
+        return dump_params(self.params)
+
+    def _reply(self, data):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.drop_rate:
+            data = bytes(b for b in data if self.rng.random() >= self.drop_rate)
+        self._write(data)
+
+    def _write(self, data):
+        if self._master is not None and data:
+            os.write(self._master, data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Emulate a DF555 on a virtual serial port')
+    parser.add_argument('--wake-window', type=float, default=WAKE_WINDOW, help='Seconds awake after reset')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before each reply')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Probability of dropping a reply byte')
+    parser.add_argument('--always-awake', action='store_true', help='Ignore the wake window')
+    parser.add_argument('--imei', default=DEFAULT_IMEI, help='IMEI reported in the query dump')
+    args = parser.parse_args()
+
+    emulator = SerialEmulator(
+        wake_window=args.wake_window,
+        latency=args.latency,
+        drop_rate=args.drop_rate,
+        always_awake=args.always_awake,
+        imei=args.imei
+    ).start()
+
+    print("=" * 60)
+    print("DF555 SERIAL EMULATOR")
+    print("=" * 60)
+    print(f"Port: {emulator.port}")
+    print("Press Enter to simulate a magnet reset, Ctrl-C to quit")
+    print("=" * 60)
+
+    try:
+        while True:
+            input()
+            emulator.wake()
+            print(f"✓ Awake for {args.wake_window}s | params: {emulator.params}")
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        emulator.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,479 @@
+"""
+Coalescing publisher of the latest tank state to Firebase Realtime Database
+
+SensorController::syncWithFirebase writes a tank's node once per stored
+reading, although the mobile app only shows the latest one. The gateway
+instead keeps the latest value of each database path in memory and
+flushes the dirty paths every interval seconds as one multi-path update
+(PATCH of {"tanks/<id>/latest_reading": ..., ...} on the root). A path
+has at most one write in flight: a newer value arriving meanwhile waits
+for the next flush, and a failed write is retried unless a newer value
+replaced it. A burst of readings from one tank then costs one write.
+
+Per tank the publisher writes tanks/<id>/latest_reading and
+tanks/<id>/last_updated, plus the tank columns the app shows (name,
+location, capacity_liters, ...) and the sensor node the first time the
+tank is seen, in the shape syncWithFirebase writes them. Tanks come from
+the same JSON export as the alert rules (rows with the sensor imei, and
+optionally sensor_id and sensor_status for the sensor node). Readings of
+devices without a tank row are not published; the gateway leaves those to
+the API's own sync. With several gateway processes each one coalesces on
+its own.
+
+Databases:
+    rest      FIREBASE_DATABASE_URL, authenticated with FIREBASE_AUTH (a
+              database secret or ID token) if set; FIREBASE_DATABASE_EMULATOR_HOST
+              (host:port) targets the local emulator instead, namespace
+              FIREBASE_PROJECT_ID
+    stub      in-memory database with configurable latency and failures
+
+Usage:
+    python3 -m df555.gateway --tanks tanks.json --firebase rest
+    python3 -m df555.firebase tanks.json --readings 20000 --rate 5000
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+from df555 import protocol
+from df555.forwarder import HttpPool
+from df555.rules import load_json, water_level_percentage
+
+logger = logging.getLogger('df555.firebase')
+
+# Seconds between flushes, paths per update request, concurrent requests
+INTERVAL = 1.0
+MAX_PATHS = 500
+CONCURRENCY = 4
+
+# Flush rounds on shutdown (paths still in flight or failed are retried)
+STOP_ATTEMPTS = 3
+
+# Tank columns published with the first reading of a tank
+TANK_FIELDS = ('id', 'name', 'location', 'capacity_liters', 'organization_id', 'organization_name')
+
+# Sensor node fields and the tank export columns they come from
+SENSOR_FIELDS = (('id', 'sensor_id'), ('device_id', 'device_id'), ('status', 'sensor_status'))
+
+# SensorController::storeSensorReading estimates the voltage as battery % of 3.7 V
+BATTERY_VOLTS = 3.7
+
+
+class FirebaseError(Exception):
+    """Raised when the database did not accept an update"""
+
+
+def _iso(timestamp=None):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def latest_reading(parsed, tank, reading_id=None):
+    """
+    The latest_reading node of a tank for a decoded report, shaped like
+    the one SensorController::syncWithFirebase writes
+
+    Args:
+        parsed: Decoded report
+        tank: Tank row
+        reading_id: sensor_readings id the API stored the report as
+    """
+    height_mm = int(tank.get('height_mm') or 0)
+    distance = parsed.get('distance')
+    distance_mm = int(distance * 1000) if distance is not None else None
+    battery = protocol.battery_percent(parsed)
+    timestamp = parsed.get('timestamp')
+    return {
+        'id': reading_id,
+        'distance_mm': distance_mm,
+        'water_level_mm': max(0, height_mm - distance_mm) if distance_mm is not None else None,
+        'water_level_percentage': water_level_percentage(parsed, tank),
+        'temperature': parsed.get('temperature'),
+        'battery_voltage': round(battery / 100 * BATTERY_VOLTS, 2) if battery is not None else None,
+        'timestamp': _iso(timestamp) if isinstance(timestamp, int) else _iso(),
+    }
+
+
+def sensor_node(parsed, tank):
+    """The sensor node of a tank, shaped like the one syncWithFirebase writes"""
+    node = {key: tank.get(column) for key, column in SENSOR_FIELDS}
+    if node['device_id'] is None:
+        node['device_id'] = parsed.get('device_id')
+    return node
+
+
+class RestDatabase:
+    """Realtime Database REST API (or its emulator), multi-path PATCH on the root"""
+
+    def __init__(self, database_url=None, auth=None, pool_size=CONCURRENCY, timeout=10):
+        """
+        Initialize client
+
+        Args:
+            database_url: e.g. https://<project>.firebaseio.com, defaults to
+                          $FIREBASE_DATABASE_URL
+            auth: Database secret or ID token, defaults to $FIREBASE_AUTH
+            pool_size: Keep-alive connections
+            timeout: Seconds per request
+
+        Raises:
+            FirebaseError: if no database URL is configured
+        """
+        emulator = os.environ.get('FIREBASE_DATABASE_EMULATOR_HOST')
+        database_url = database_url or os.environ.get('FIREBASE_DATABASE_URL')
+        query = {}
+        if emulator:
+            namespace = os.environ.get('FIREBASE_PROJECT_ID')
+            if not namespace and database_url:
+                namespace = urlparse(database_url).hostname.split('.')[0]
+            database_url = f'http://{emulator}'
+            query['ns'] = namespace or 'default'
+        elif not database_url:
+            raise FirebaseError("Set FIREBASE_DATABASE_URL (or FIREBASE_DATABASE_EMULATOR_HOST)")
+        else:
+            auth = auth if auth is not None else os.environ.get('FIREBASE_AUTH')
+            if auth:
+                query['auth'] = auth
+        self.url = database_url
+        self.path = '/.json' + (f'?{urlencode(query)}' if query else '')
+        self.pool = HttpPool(database_url, size=pool_size, timeout=timeout)
+
+    def update(self, values):
+        """
+        Write several paths in one atomic request
+
+        Args:
+            values: {path: value}
+
+        Raises:
+            FirebaseError: if the database did not accept the update
+        """
+        body = json.dumps(values, separators=(',', ':')).encode()
+        try:
+            status, data = self.pool.request('PATCH', self.path, body=body,
+                                             headers={'Content-Type': 'application/json'})
+        except (http.client.HTTPException, OSError) as e:
+            raise FirebaseError(str(e)) from e
+        if not 200 <= status < 300:
+            raise FirebaseError(f"HTTP {status}: {data[:200]!r}")
+
+    def close(self):
+        self.pool.close()
+
+
+class StubDatabase:
+    """In-memory database applying multi-path updates, for tests and benchmarks"""
+
+    def __init__(self, latency=(0.01, 0.05), failure_rate=0.0, seed=None):
+        """
+        Initialize stub
+
+        Args:
+            latency: (min, max) seconds per update
+            failure_rate: Probability that an update is rejected
+            seed: Random seed for latency and failures
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.data = {}
+        self.updates = 0
+        self.paths_written = 0
+        self.max_inflight_per_path = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def update(self, values):
+        with self._lock:
+            for path in values:
+                self._inflight[path] = self._inflight.get(path, 0) + 1
+                self.max_inflight_per_path = max(self.max_inflight_per_path, self._inflight[path])
+            delay = self.rng.uniform(*self.latency)
+            failed = self.rng.random() < self.failure_rate
+        try:
+            time.sleep(delay)
+            if failed:
+                raise FirebaseError("stub failure")
+            with self._lock:
+                for path, value in values.items():
+                    self._set(path, value)
+                self.updates += 1
+                self.paths_written += len(values)
+        finally:
+            with self._lock:
+                for path in values:
+                    self._inflight[path] -= 1
+
+    def _set(self, path, value):
+        *parents, leaf = path.strip('/').split('/')
+        node = self.data
+        for key in parents:
+            node = node.setdefault(key, {})
+        node[leaf] = value
+
+    def get(self, path):
+        """Value at a path, or None"""
+        node = self.data
+        for key in path.strip('/').split('/'):
+            if not isinstance(node, dict) or key not in node:
+                return None
+            node = node[key]
+        return node
+
+    def close(self):
+        pass
+
+
+def make_database(name, **options):
+    """Database adapter by name ('rest' or 'stub')"""
+    if name == 'stub':
+        return StubDatabase(**options)
+    if name == 'rest':
+        return RestDatabase(**options)
+    raise ValueError(f"Unknown Firebase database: {name}")
+
+
+class FirebasePublisher:
+    """Keep the latest state per database path and flush it in multi-path updates"""
+
+    def __init__(self, database, tanks=(), interval=INTERVAL, max_paths=MAX_PATHS,
+                 concurrency=CONCURRENCY, metrics=None):
+        """
+        Initialize publisher
+
+        Args:
+            database: RestDatabase or StubDatabase
+            tanks: Tank rows with the sensor imei (see load_tanks())
+            interval: Seconds between flushes of dirty paths
+            max_paths: Paths per update request
+            concurrency: Update requests in flight
+            metrics: df555.metrics.Registry to record counters in
+        """
+        self.database = database
+        self.interval = interval
+        self.max_paths = max_paths
+        self.tanks = {}
+        self.stats = {
+            'readings': 0,
+            'coalesced': 0,
+            'stale': 0,
+            'paths': 0,
+            'updates': 0,
+            'failed': 0,
+        }
+        self._pending = {}
+        self._inflight = set()
+        self._latest = {}
+        self._published = set()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.load_tanks(tanks)
+
+        if metrics is not None:
+            for key, help in (('paths', 'Database paths written'),
+                              ('updates', 'Multi-path update requests accepted'),
+                              ('coalesced', 'Path values replaced before they were written'),
+                              ('failed', 'Update requests the database did not accept')):
+                metrics.counter(f'df555_firebase_{key}_total', help, function=lambda key=key: self.stats[key])
+            metrics.gauge('df555_firebase_pending', 'Dirty paths waiting for a flush',
+                          function=lambda: len(self._pending))
+
+    def load_tanks(self, tanks):
+        """
+        Index tank rows by sensor IMEI (replacing the previous tanks)
+
+        Tanks whose TANK_FIELDS changed are published again with their next
+        state, so a renamed or moved tank does not keep its old details.
+        """
+        def details(tank):
+            return tuple(tank.get(field) for field in TANK_FIELDS + tuple(column for _, column in SENSOR_FIELDS))
+
+        previous = {tank['id']: details(tank) for tank in self.tanks.values()}
+        self.tanks = {str(tank.get('imei') or tank.get('device_id')): tank
+                      for tank in tanks if tank.get('id') is not None and (tank.get('imei') or tank.get('device_id'))}
+        current = {tank['id']: details(tank) for tank in self.tanks.values()}
+        self._published = {tank_id for tank_id in self._published if previous.get(tank_id) == current.get(tank_id)}
+        return len(self.tanks)
+
+    def start(self):
+        """Start the background flush loop"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush what is pending, wait for in-flight updates and stop"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        for _ in range(STOP_ATTEMPTS):
+            self._flush()
+            if self._tasks:
+                await asyncio.wait(set(self._tasks))
+            if not self._pending:
+                break
+        if self._pending:
+            logger.warning("Dropping %d unwritten Firebase paths", len(self._pending))
+
+    def tank(self, parsed):
+        """Tank row of a decoded report's device, or None"""
+        return self.tanks.get(str(parsed.get('imei') or parsed.get('device_id')))
+
+    def covers(self, parsed):
+        """
+        Whether publish() will write (or already holds newer) state for a
+        decoded report, so the API need not sync it to Firebase
+        """
+        tank = self.tank(parsed)
+        if tank is None:
+            return False
+        timestamp = parsed.get('timestamp')
+        return not isinstance(timestamp, int) or timestamp >= self._latest.get(tank['id'], 0)
+
+    def publish(self, parsed, reading_id=None):
+        """
+        Record the state of the tank a decoded report belongs to
+
+        Args:
+            parsed: Decoded report
+            reading_id: sensor_readings id the API stored the report as
+
+        Returns:
+            False if the report's device has no tank or the report is
+            older than the tank's latest state
+        """
+        tank = self.tank(parsed)
+        if tank is None:
+            return False
+        tank_id = tank['id']
+        timestamp = parsed.get('timestamp')
+        if isinstance(timestamp, int):
+            if timestamp < self._latest.get(tank_id, 0):
+                self.stats['stale'] += 1
+                return False
+            self._latest[tank_id] = timestamp
+
+        self.stats['readings'] += 1
+        values = {
+            f'tanks/{tank_id}/latest_reading': latest_reading(parsed, tank, reading_id),
+            f'tanks/{tank_id}/last_updated': _iso(),
+        }
+        if tank_id not in self._published:
+            self._published.add(tank_id)
+            values.update({f'tanks/{tank_id}/{field}': tank[field] for field in TANK_FIELDS if field in tank})
+            values[f'tanks/{tank_id}/sensor'] = sensor_node(parsed, tank)
+        for path, value in values.items():
+            if path in self._pending:
+                self.stats['coalesced'] += 1
+            self._pending[path] = value
+        self._wakeup.set()
+        return True
+
+    @property
+    def pending(self):
+        """Dirty paths not yet written"""
+        return len(self._pending)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Let the interval's readings coalesce before writing
+            await asyncio.sleep(self.interval)
+            self._wakeup.clear()
+            self._flush()
+
+    def _flush(self):
+        """Hand dirty paths that are not being written to update tasks"""
+        ready = [path for path in self._pending if path not in self._inflight]
+        for start in range(0, len(ready), self.max_paths):
+            values = {path: self._pending.pop(path) for path in ready[start:start + self.max_paths]}
+            self._inflight.update(values)
+            task = asyncio.create_task(self._write(values))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, values):
+        try:
+            async with self._slots:
+                await asyncio.to_thread(self.database.update, values)
+            self.stats['updates'] += 1
+            self.stats['paths'] += len(values)
+        except FirebaseError as e:
+            self.stats['failed'] += 1
+            logger.error("Failed to update %d Firebase paths: %s", len(values), e)
+            # Retry with the next flush unless a newer value replaced it
+            for path, value in values.items():
+                self._pending.setdefault(path, value)
+        finally:
+            self._inflight.difference_update(values)
+            if any(path in self._pending for path in values):
+                self._wakeup.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exercise the coalescing Firebase publisher with a synthetic burst')
+    parser.add_argument('tanks', help='JSON export of tank rows with the sensor imei')
+    parser.add_argument('--database', choices=('stub', 'rest'), default='stub',
+                        help='stub (in memory) or rest (FIREBASE_DATABASE_URL or the emulator)')
+    parser.add_argument('--readings', type=int, default=10000, help='Readings to publish')
+    parser.add_argument('--rate', type=float, default=2000, help='Readings per second')
+    parser.add_argument('--interval', type=float, default=INTERVAL, help='Seconds between flushes')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Stub update failure probability')
+    args = parser.parse_args()
+
+    tanks = [tank for tank in load_json(args.tanks) if tank.get('id') is not None]
+    if not tanks:
+        print("✗ No tank rows with an id")
+        return 1
+    options = {'failure_rate': args.failure_rate, 'seed': 0} if args.database == 'stub' else {}
+    database = make_database(args.database, **options)
+
+    async def burst():
+        publisher = FirebasePublisher(database, tanks, interval=args.interval)
+        publisher.start()
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for i in range(args.readings):
+            tank = tanks[i % len(tanks)]
+            publisher.publish({
+                'imei': str(tank.get('imei') or tank.get('device_id')),
+                'distance': round(rng.uniform(0.2, (tank.get('height_mm') or 2000) / 1000), 3),
+                'temperature': 25,
+                'battery_voltage_mv': 3600,
+                'timestamp': int(time.time()),
+            })
+            delay = (i + 1) / args.rate - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await publisher.stop()
+        return publisher, time.perf_counter() - start
+
+    try:
+        publisher, elapsed = asyncio.run(burst())
+    finally:
+        database.close()
+
+    stats = publisher.stats
+    print("=" * 60)
+    print("DF555 FIREBASE PUBLISHER")
+    print("=" * 60)
+    print(f"Readings:    {stats['readings']} in {elapsed:.1f}s")
+    print(f"Updates:     {stats['updates']} requests, {stats['paths']} paths")
+    print(f"Coalesced:   {stats['coalesced']} path values")
+    print(f"Failed:      {stats['failed']} requests, {publisher.pending} paths unwritten")
+    if isinstance(database, StubDatabase):
+        print(f"In flight:   at most {database.max_inflight_per_path} write(s) per path")
+    print("=" * 60)
+    return 0 if not publisher.pending else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+Batched, pooled forwarding of decoded readings to the Laravel API
+
+Readings are collected into micro-batches that are flushed when they reach
+max_batch readings or when the oldest reading is max_delay seconds old, and
+posted to /api/sensors/dingtek/bulk over a small pool of keep-alive HTTP
+connections. A burst of heartbeats then costs a handful of requests instead
+of one request (and one TCP/TLS handshake) per reading.
+"""
+
+import asyncio
+import http.client
+import json
+import logging
+import queue
+import select
+import time
+import urllib.parse
+
+from df555.metrics import stage_histogram
+
+logger = logging.getLogger('df555.forwarder')
+
+BULK_PATH = '/api/sensors/dingtek/bulk'
+
+# Same limit as SensorController::BULK_MAX_READINGS; larger batches are rejected
+MAX_BATCH = 200
+MAX_DELAY = 0.5  # seconds
+
+# Requests that may be sent again after the server might have received them
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'))
+
+# Client errors that say nothing about the batch itself (timeout, rate limit)
+RETRY_STATUSES = frozenset((408, 429))
+
+
+class ForwardError(Exception):
+    """Raised when a batch could not be delivered"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def permanent(self):
+        """The API rejected the batch (4xx); sending it again cannot succeed"""
+        return self.status is not None and 400 <= self.status < 500 and self.status not in RETRY_STATUSES
+
+
+def _dropped(conn):
+    """Whether the server closed an idle keep-alive connection (readable at EOF)"""
+    if conn.sock is None:
+        return True
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+class HttpPool:
+    """Thread-safe pool of keep-alive HTTP(S) connections to one host"""
+
+    def __init__(self, base_url, size=4, timeout=10, api_key=None):
+        """
+        Initialize pool
+
+        Args:
+            base_url: Scheme and host of the API (e.g., 'https://example.fly.dev')
+            size: Maximum number of open connections
+            timeout: Socket timeout in seconds
+            api_key: Sent as X-API-Key (see SensorAuthentication middleware)
+        """
+        url = urllib.parse.urlsplit(base_url)
+        self.connection_class = (
+            http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        )
+        self.host = url.hostname
+        self.port = url.port
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self.size = size
+        self.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if api_key:
+            self.headers['X-API-Key'] = api_key
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)
+
+    def _connect(self):
+        return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Send a request on a pooled connection, blocking until one is free
+
+        A connection the server closed while idle is replaced before use.
+        If sending fails on a reused connection anyway, the request is
+        retried once on a new one; once it was sent, only idempotent
+        methods are retried, so a POST never reaches the server twice.
+
+        Returns:
+            (status, body bytes)
+        """
+        status, _, data = self.fetch(method, path, body, headers)
+        return status, data
+
+    def fetch(self, method, path, body=None, headers=None):
+        """
+        Like request(), but also return the response headers
+
+        Returns:
+            (status, http.client.HTTPMessage headers, body bytes)
+        """
+        conn = self._idle.get()
+        try:
+            if conn is not None and _dropped(conn):
+                conn.close()
+                conn = None
+            for _ in range(2):
+                reused = conn is not None
+                if conn is None:
+                    conn = self._connect()
+                sent = False
+                try:
+                    conn.request(method, self.prefix + path, body=body, headers={**self.headers, **(headers or {})})
+                    sent = True
+                    response = conn.getresponse()
+                    data = response.read()
+                    if response.will_close:
+                        conn.close()
+                        conn = None
+                    return response.status, response.headers, data
+                except (http.client.HTTPException, ConnectionError):
+                    conn.close()
+                    conn = None
+                    if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                        raise
+        except BaseException:
+            if conn is not None:
+                conn.close()
+                conn = None
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def post_json(self, path, payload):
+        """POST a JSON payload, returning (status, body bytes)"""
+        return self.request('POST', path, body=json.dumps(payload).encode())
+
+    def close(self):
+        """Close all idle connections"""
+        for _ in range(self.size):
+            conn = self._idle.get()
+            if conn is not None:
+                conn.close()
+        for _ in range(self.size):
+            self._idle.put(None)
+
+
+class BatchForwarder:
+    """Micro-batch readings and post them through an HttpPool"""
+
+    def __init__(self, pool, path=BULK_PATH, max_batch=MAX_BATCH, max_delay=MAX_DELAY, metrics=None,
+                 fields=None, on_delivered=None):
+        """
+        Initialize forwarder
+
+        Args:
+            pool: HttpPool for the API host
+            path: Bulk ingest endpoint path
+            max_batch: Flush once this many readings are buffered
+            max_delay: Flush once the oldest buffered reading is this old
+            metrics: df555.metrics.Registry to record batch latency and size in
+            fields: Extra top-level fields of every bulk request body
+            on_delivered: Called on the loop with (contexts, response) after
+                the API accepted a batch, see submit()
+        """
+        self.pool = pool
+        self.path = path
+        self.fields = fields or {}
+        self.on_delivered = on_delivered
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = {
+            'submitted': 0,
+            'forwarded': 0,
+            'failed': 0,
+            'dropped': 0,
+            'batches': 0,
+        }
+        self._buffer = []
+        self._oldest = None
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(pool.size)
+        self._inflight = set()
+        self._task = None
+
+        self.stage_seconds = None
+        if metrics is not None:
+            self.stage_seconds = stage_histogram(metrics)
+            self.batch_size = metrics.histogram('df555_forward_batch_size', 'Readings per bulk request',
+                                                buckets=(1, 5, 10, 25, 50, 100, MAX_BATCH))
+            for key, help in (('forwarded', 'Readings accepted by the API'),
+                              ('failed', 'Readings in batches the API did not accept'),
+                              ('dropped', 'Readings discarded after a failed batch (no spool to retry from)'),
+                              ('batches', 'Bulk requests accepted by the API')):
+                metrics.counter(f'df555_forward_{key}_total', help, function=lambda key=key: self.stats[key])
+            metrics.gauge('df555_forward_pending', 'Readings buffered or in flight',
+                          function=lambda: self.pending)
+
+    def start(self):
+        """Start the background flush loop"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush what is buffered, wait for in-flight batches and stop"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._flush()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    def submit(self, reading, context=None):
+        """
+        Queue a reading for the next batch
+
+        Args:
+            reading: JSON-serializable reading
+            context: Passed to on_delivered with the batch's response
+        """
+        if not self._buffer:
+            # Arm the age timer in the flush loop
+            self._oldest = time.monotonic()
+            self._wakeup.set()
+        self._buffer.append((reading, context))
+        self.stats['submitted'] += 1
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+
+    @property
+    def pending(self):
+        """Readings buffered or in flight"""
+        return len(self._buffer) + sum(getattr(t, 'size', 0) for t in self._inflight)
+
+    async def _run(self):
+        while True:
+            if self._buffer:
+                timeout = max(0.0, self._oldest + self.max_delay - time.monotonic())
+            else:
+                timeout = None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            if self._buffer and (len(self._buffer) >= self.max_batch
+                                 or time.monotonic() - self._oldest >= self.max_delay):
+                await self._slots.acquire()
+                self._flush(acquired=True)
+
+    def _flush(self, acquired=False):
+        """Hand the current buffer to a send task"""
+        while self._buffer:
+            batch = self._buffer[:self.max_batch]
+            del self._buffer[:self.max_batch]
+            task = asyncio.create_task(self._send(batch, acquired))
+            task.size = len(batch)
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            acquired = False
+        self._oldest = time.monotonic()
+
+    async def send(self, batch):
+        """
+        Post one batch
+
+        Returns:
+            Decoded JSON response ({} if the body is not a JSON object)
+
+        Raises:
+            ForwardError: if the API did not accept the batch
+        """
+        try:
+            status, body = await asyncio.to_thread(self.pool.post_json, self.path, {'readings': batch, **self.fields})
+        except (http.client.HTTPException, OSError) as e:
+            raise ForwardError(str(e)) from e
+        if not 200 <= status < 300:
+            raise ForwardError(f"HTTP {status}: {body[:200]!r}", status)
+        try:
+            response = json.loads(body)
+        except ValueError:
+            return {}
+        return response if isinstance(response, dict) else {}
+
+    async def deliver(self, batch):
+        """
+        Post one batch and record the outcome in stats
+
+        Returns:
+            Decoded JSON response, see send()
+
+        Raises:
+            ForwardError: if the API did not accept the batch
+        """
+        start = time.perf_counter()
+        try:
+            response = await self.send(batch)
+        except ForwardError as e:
+            self.stats['failed'] += len(batch)
+            logger.error("Failed to forward batch of %d readings: %s", len(batch), e)
+            raise
+        finally:
+            if self.stage_seconds is not None:
+                self.stage_seconds.observe(time.perf_counter() - start, 'forward')
+                self.batch_size.observe(len(batch))
+        self.stats['forwarded'] += len(batch)
+        self.stats['batches'] += 1
+        return response
+
+    async def _send(self, entries, acquired):
+        if not acquired:
+            await self._slots.acquire()
+        try:
+            response = await self.deliver([reading for reading, _ in entries])
+        except ForwardError:
+            # Without a spool there is nothing to retry from
+            self.stats['dropped'] += len(entries)
+            logger.warning("Dropped %d readings of the failed batch (no spool to retry from)", len(entries))
+        else:
+            if self.on_delivered is not None:
+                self.on_delivered([context for _, context in entries], response)
+        finally:
+            self._slots.release()
@@ -0,0 +1,746 @@
+"""
+Asyncio TCP ingestion gateway for DF555 sensors
+
+Drop-in replacement for `php artisan sensor:tcp-server`: listens on port
+8888, reads reports (0x80 ... 0x81), answers "OK\r\n" to each one and
+forwards decoded readings in batches to /api/sensors/dingtek/bulk. Binary
+frames are delimited by their packet size (protocol.StreamFramer), so
+frames split across reads and several frames per connection are handled.
+
+Connections are served concurrently and only read and acknowledge; decoding
+happens in separate worker tasks fed by a queue and forwarding is batched
+by df555.forwarder, so a slow sensor or a slow API never blocks the accept
+loop.
+
+Retransmitted and dual-server duplicates are dropped by a df555.dedup
+cache keyed on (device_id, frame_count, timestamp) before they are
+forwarded. The cache is per process. With --processes the two copies of
+a dual-server report may reach different workers, so each reading also
+carries its key as "report_key" and the bulk API drops keys another
+request already stored (shared through the Laravel cache).
+
+With --spool-dir every report is appended to a durable df555.spool before
+it is acknowledged, and a drainer replays the spool to the API with retry
+and backoff. An API outage or a restart then loses nothing. A batch the
+API rejects (4xx) is split until the offending readings are isolated;
+those are written to rejected.jsonl in the spool directory and skipped,
+so one bad reading cannot hold up everything spooled behind it.
+
+With --metrics-port the gateway serves Prometheus metrics on /metrics
+(on --metrics-host, local only by default):
+df555_stage_seconds histograms for the first_byte (accept to first byte),
+read (report complete), parse, ack and forward stages, parse failures by
+reason, and gauges for open connections and queue depths.
+
+With --analytics-state the gateway keeps streaming per-tank analytics
+(df555.analytics: consumption, refill, leak and abnormal drain detection)
+for every forwarded reading and periodically writes their state and
+dashboard values to that JSON file. With --processes every worker keeps
+its own file (tanks.worker-N.json) for the readings it receives.
+
+With --rules and --tanks (JSON exports of the alert_rules and tanks
+tables) every forwarded reading is checked against its device's alert
+rules (df555.rules); raised and resolved alerts are logged, counted and
+appended to --alert-log. SIGHUP reloads both files. With --analytics-state
+the tank heights from --tanks also give the water levels.
+
+With --firebase and --tanks the latest state of each tank is published to
+Firebase Realtime Database by a coalescing writer (df555.firebase): dirty
+paths are flushed every --firebase-interval seconds as multi-path updates.
+Readings the writer publishes are sent with "sync_firebase": false so the
+API skips its own Firebase sync for them; readings of devices missing from
+--tanks are still synced by the API. Readings are published once the API
+has accepted them, with the id it stored them as.
+
+With --processes N the gateway runs as N worker processes sharing the port
+through SO_REUSEPORT, managed by df555.supervisor.
+
+Usage:
+    python3 -m df555.gateway --port=8888
+    python3 -m df555.gateway --spool-dir=/var/spool/df555
+    python3 -m df555.gateway --processes=4 --spool-dir=/var/spool/df555
+    python3 -m df555.gateway --analytics-state=/var/lib/df555/tanks.json --utc-offset=2
+    python3 -m df555.gateway --rules=rules.json --tanks=tanks.json --alert-log=/var/log/df555/alerts.jsonl
+    FIREBASE_DATABASE_URL=https://<project>.firebaseio.com python3 -m df555.gateway --tanks=tanks.json --firebase=rest
+    APP_URL=https://chenesa-shy-grass-3201.fly.dev python3 -m df555.gateway
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+from df555 import protocol
+from df555.analytics import StreamAnalytics, tank_heights, write_state
+from df555.dedup import DEDUP_SIZE, DEDUP_WINDOW, DedupCache, report_key
+from df555.firebase import INTERVAL as FIREBASE_INTERVAL, FirebasePublisher, make_database
+from df555.forwarder import MAX_BATCH, MAX_DELAY, BatchForwarder, ForwardError, HttpPool
+from df555.metrics import Registry, render, stage_histogram, start_http_server
+from df555.rules import RuleEngine, load_json
+from df555.spool import Spool, SpoolError
+
+logger = logging.getLogger('df555.gateway')
+
+ACK = b'OK\r\n'
+
+# Same limits as SensorTcpServer: 5 s per report, 2048-byte reads
+READ_TIMEOUT = 5.0
+READ_SIZE = 2048
+
+# Seconds to wait for another frame after acknowledging one
+FRAME_LINGER = 0.5
+
+# Largest unframed (ASCII) report buffered per connection
+MAX_RAW_REPORT = 65536
+
+# Spool drainer retry backoff and msync interval (seconds)
+RETRY_MIN = 0.5
+RETRY_MAX = 30.0
+SPOOL_SYNC_INTERVAL = 1.0
+
+# Snapshot keys that are gauges; every other key is a per-process counter
+SNAPSHOT_GAUGES = ('open_connections', 'queue_depth', 'forward_pending', 'spool_pending', 'dedup_size',
+                   'rules_invalid_rules', 'rules_active', 'firebase_pending')
+
+# Dead-letter file for spooled readings the API rejected
+REJECTED_FILE = 'rejected.jsonl'
+
+# Seconds between writes of the analytics state file
+ANALYTICS_SAVE_INTERVAL = 30.0
+
+
+def to_ingest_payload(parsed):
+    """
+    Prepare a decoded report for the ingest endpoint
+
+    The endpoint validates 'timestamp' as a date, so the unix time is sent
+    as ISO 8601 and kept separately as 'unix_timestamp'. The battery is
+    sent as the percentage it reads from 'battery', a binary report's
+    RSRP is also sent as 'rssi' (the only signal field the endpoint
+    stores), and fields a short ASCII report did not carry are left out
+    rather than sent as null.
+    """
+    payload = {key: value for key, value in parsed.items() if value is not None}
+    battery = protocol.battery_percent(payload)
+    if battery is not None:
+        payload['battery'] = battery
+    if 'rssi' not in payload and 'rsrp' in payload:
+        payload['rssi'] = int(round(payload['rsrp']))
+    if isinstance(payload.get('timestamp'), int):
+        payload['unix_timestamp'] = payload['timestamp']
+        payload['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(payload['timestamp']))
+    return payload
+
+
+def stored_readings(items, response):
+    """
+    Pair the items of an accepted batch with the sensor_readings ids the
+    API stored them as (the bulk response's 'ids')
+
+    Items the API did not store (rejected or duplicate readings, a null id)
+    are left out. Without ids in the response every item is kept, with
+    None as its id.
+
+    Returns:
+        List of (item, reading id)
+    """
+    ids = response.get('ids') if isinstance(response, dict) else None
+    if not isinstance(ids, list) or len(ids) != len(items):
+        return [(item, None) for item in items]
+    return [(item, reading_id) for item, reading_id in zip(items, ids) if reading_id is not None]
+
+
+class SensorGateway:
+    """Accept sensor connections, acknowledge reports and forward them"""
+
+    def __init__(self, host='0.0.0.0', port=8888, api_url=None, api_key=None,
+                 read_timeout=READ_TIMEOUT, workers=4, queue_size=10000,
+                 max_batch=MAX_BATCH, max_delay=MAX_DELAY, pool_size=4, spool_dir=None,
+                 reuse_port=False, dedup_size=DEDUP_SIZE, dedup_window=DEDUP_WINDOW, metrics_port=None,
+                 metrics_host='127.0.0.1',
+                 analytics_state=None, utc_offset=0.0, rules=None, tanks=None, alert_log=None,
+                 firebase=None, firebase_interval=FIREBASE_INTERVAL, shared_dedup=False):
+        """
+        Initialize gateway
+
+        Args:
+            host: Interface to listen on
+            port: TCP port (sensors are configured for 8888)
+            api_url: Base URL of the Laravel app, defaults to $APP_URL
+            api_key: Sent as X-API-Key (see SensorAuthentication middleware)
+            read_timeout: Seconds to wait for a complete report
+            workers: Number of decode worker tasks
+            queue_size: Maximum reports waiting to be processed
+            max_batch: Readings per bulk request
+            max_delay: Maximum seconds a reading waits for its batch
+            pool_size: Keep-alive connections to the API
+            spool_dir: Directory for the write-ahead spool, or None to hand
+                reports to the decoders through memory only
+            reuse_port: Set SO_REUSEPORT so several processes can share the port
+            dedup_size: Reports remembered for duplicate suppression
+            dedup_window: Seconds a report is remembered, 0 to disable
+                duplicate suppression
+            metrics_port: Serve Prometheus metrics on this port, or None
+            metrics_host: Interface for the metrics endpoint (not the sensor interface)
+            analytics_state: JSON file for streaming tank analytics, or None
+                to disable them
+            utc_offset: Local time offset (hours) for analytics days and nights
+            rules: JSON export of alert_rules rows, or None to skip alerts
+            tanks: JSON export of tank rows with the sensor imei (for rules,
+                Firebase and analytics water levels)
+            alert_log: Append alert events to this JSON-lines file
+            firebase: Publish the latest tank state to Firebase Realtime
+                Database ('rest' or 'stub'), or None
+            firebase_interval: Seconds between Firebase flushes
+            shared_dedup: Send each reading's dedup key so the bulk API drops
+                duplicates another process forwarded
+        """
+        self.host = host
+        self.port = port
+        self.api_url = api_url or os.environ.get('APP_URL', 'http://localhost:8080')
+        self.api_key = api_key if api_key is not None else os.environ.get('SENSOR_API_KEY')
+        self.read_timeout = read_timeout
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.pool = HttpPool(self.api_url, size=pool_size, api_key=self.api_key)
+        self.metrics = Registry()
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.metrics_server = None
+        self.firebase = None
+        if firebase:
+            self.firebase = FirebasePublisher(make_database(firebase), interval=firebase_interval,
+                                              metrics=self.metrics)
+        self.forwarder = BatchForwarder(self.pool, max_batch=max_batch, max_delay=max_delay, metrics=self.metrics,
+                                        on_delivered=self._delivered)
+        self.spool = Spool(spool_dir) if spool_dir else None
+        self.rejected_path = os.path.join(spool_dir, REJECTED_FILE) if spool_dir else None
+        self._spooled = asyncio.Event()
+        self.dedup = DedupCache(dedup_size, dedup_window) if dedup_window else None
+        self.shared_dedup = shared_dedup
+        self.analytics_state = analytics_state
+        self.analytics = StreamAnalytics(utc_offset=utc_offset) if analytics_state else None
+        if self.analytics is not None:
+            restored = self.analytics.load(analytics_state)
+            if restored:
+                logger.info("Restored analytics state of %s tanks from %s", restored, analytics_state)
+        self.rules_path = rules
+        self.tanks_path = tanks
+        self.alert_log = alert_log
+        self.rules = RuleEngine() if rules else None
+        if self.rules is not None or self.firebase is not None or self.tanks_path:
+            self.reload_rules()
+        self.reuse_port = reuse_port
+        self.server = None
+        self.stats = {
+            'connections': 0,
+            'open_connections': 0,
+            'reports': 0,
+            'parse_failures': 0,
+            'duplicates': 0,
+            'rejected': 0,
+        }
+        self._tasks = []
+        self._register_metrics()
+
+    def _register_metrics(self):
+        self.stage_seconds = stage_histogram(self.metrics)
+        self.parse_failures = self.metrics.counter(
+            'df555_parse_failures_total', 'Reports that could not be decoded', labels=('reason',)
+        )
+        for key, help in (('connections', 'Sensor connections accepted'),
+                          ('reports', 'Reports received and acknowledged'),
+                          ('duplicates', 'Duplicate reports dropped'),
+                          ('rejected', 'Spooled readings the API rejected, moved to the dead-letter file')):
+            self.metrics.counter(f'df555_{key}_total', help, function=lambda key=key: self.stats[key])
+        self.metrics.gauge('df555_open_connections', 'Sensor connections being served',
+                           function=lambda: self.stats['open_connections'])
+        self.metrics.gauge('df555_queue_depth', 'Reports waiting to be decoded and forwarded',
+                           function=lambda: self.queue_depth)
+        self.metrics.gauge('df555_spool_pending', 'Spooled reports not yet delivered',
+                           function=lambda: self.spool.pending if self.spool else 0)
+        self.tank_events = self.metrics.counter(
+            'df555_tank_events_total', 'Tank analytics events', labels=('type',)
+        )
+        self.metrics.gauge('df555_tanks_tracked', 'Tanks with streaming analytics state',
+                           function=lambda: len(self.analytics.tanks) if self.analytics is not None else 0)
+        self.alerts = self.metrics.counter(
+            'df555_alerts_total', 'Alert rule transitions', labels=('type', 'state')
+        )
+        self.metrics.gauge('df555_alerts_active', 'Raised alerts not yet resolved',
+                           function=lambda: self.rules.stats['active'] if self.rules is not None else 0)
+        self.metrics.gauge('df555_dedup_entries', 'Reports remembered for duplicate suppression',
+                           function=lambda: len(self.dedup) if self.dedup is not None else 0)
+
+    async def start(self):
+        """Start listening and launch the worker tasks"""
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, backlog=1024,
+            reuse_port=self.reuse_port or None
+        )
+        if self.spool:
+            self._tasks = [asyncio.create_task(self._drain()), asyncio.create_task(self._sync_spool())]
+        else:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.analytics is not None:
+            self._tasks.append(asyncio.create_task(self._save_analytics()))
+        self.forwarder.start()
+        if self.firebase is not None:
+            self.firebase.start()
+        if self.metrics_port is not None:
+            self.metrics_server = start_http_server(lambda: render(self.metrics.state()), self.metrics_host,
+                                                    self.metrics_port)
+        logger.info("TCP Server started on %s:%s", self.host, self.port)
+
+    async def serve_forever(self):
+        """Run until cancelled"""
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def run(self, signals=(signal.SIGTERM, signal.SIGINT)):
+        """Serve until one of signals arrives, then stop gracefully"""
+        await self.start()
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in signals:
+            loop.add_signal_handler(sig, stopping.set)
+        if self.rules is not None or self.firebase is not None or self.tanks_path:
+            loop.add_signal_handler(signal.SIGHUP, self.reload_rules)
+        await stopping.wait()
+        logger.info("TCP Server draining on %s:%s", self.host, self.port)
+        await self.stop()
+
+    async def stop(self):
+        """Stop accepting, let open connections and queued reports drain, then stop the workers"""
+        if self.server:
+            self.server.close()
+
+        # Connections already accepted still get their ack
+        deadline = time.monotonic() + self.read_timeout + 1
+        while self.stats['open_connections'] and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.server:
+            await self.server.wait_closed()
+
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.forwarder.stop()
+        self.pool.close()
+        if self.firebase is not None:
+            await self.firebase.stop()
+            self.firebase.database.close()
+        if self.analytics is not None:
+            await asyncio.to_thread(write_state, self.analytics_state, self.analytics.dump())
+        if self.spool:
+            self.spool.close()
+        if self.metrics_server:
+            await asyncio.to_thread(self.metrics_server.shutdown)
+            self.metrics_server.server_close()
+
+    async def read_reports(self, reader):
+        """
+        Yield the reports sent on a connection
+
+        Binary frames are yielded as soon as they are complete. After a
+        frame the connection is kept for FRAME_LINGER seconds in case the
+        sensor sends another one; a partial frame gets the full read
+        timeout. Data that cannot be framed (ASCII reports) is read like
+        SensorTcpServer does: until the last byte read is 0x81, the peer
+        closes, or the read timeout expires. Whatever is left at the end is
+        yielded as a final report so parse failures get logged.
+        """
+        loop = asyncio.get_running_loop()
+        framer = protocol.StreamFramer()
+        deadline = loop.time() + self.read_timeout
+        waiting_since = time.perf_counter()
+        first = True
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(reader.read(READ_SIZE), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            if first:
+                self.stage_seconds.observe(time.perf_counter() - waiting_since, 'first_byte')
+                first = False
+
+            frames = framer.feed(chunk)
+            for frame in frames:
+                self.stage_seconds.observe(time.perf_counter() - waiting_since, 'read')
+                yield frame
+                waiting_since = time.perf_counter()
+
+            if framer.raw:
+                if chunk[-1] == protocol.PACKET_TAIL or framer.buffered >= MAX_RAW_REPORT:
+                    break
+            elif frames:
+                deadline = loop.time() + (self.read_timeout if framer.buffered else FRAME_LINGER)
+
+        rest = framer.flush()
+        if rest:
+            self.stage_seconds.observe(time.perf_counter() - waiting_since, 'read')
+            yield rest
+
+    async def handle_connection(self, reader, writer):
+        """Read reports, spool or queue them and acknowledge each one"""
+        peer = writer.get_extra_info('peername') or ('unknown', 0)
+        client_ip = peer[0]
+        self.stats['connections'] += 1
+        self.stats['open_connections'] += 1
+        logger.info("TCP: New sensor connection ip=%s port=%s", client_ip, peer[1])
+
+        try:
+            async for data in self.read_reports(reader):
+                received = time.perf_counter()
+                self.stats['reports'] += 1
+                if self.spool:
+                    self.spool.append(client_ip.encode() + b'\n' + data)
+                    self._spooled.set()
+                else:
+                    await self.queue.put((data, client_ip))
+                writer.write(ACK)
+                await writer.drain()
+                self.stage_seconds.observe(time.perf_counter() - received, 'ack')
+        except SpoolError as e:
+            # No ack: the sensor keeps the reading and retransmits
+            logger.error("TCP: Failed to spool report ip=%s error=%s", client_ip, e)
+        except (ConnectionError, OSError) as e:
+            logger.warning("TCP: Connection error ip=%s error=%s", client_ip, e)
+        finally:
+            self.stats['open_connections'] -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    def snapshot(self):
+        """Current counters and gauges (SNAPSHOT_GAUGES) of the gateway and its components"""
+        snapshot = dict(self.stats)
+        snapshot.update({f'forward_{key}': value for key, value in self.forwarder.stats.items()})
+        snapshot['queue_depth'] = self.queue_depth
+        snapshot['forward_pending'] = self.forwarder.pending
+        snapshot['spool_pending'] = self.spool.pending if self.spool else 0
+        if self.dedup is not None:
+            snapshot.update({f'dedup_{key}': value for key, value in self.dedup.stats.items()})
+            snapshot['dedup_size'] = len(self.dedup)
+        if self.analytics is not None:
+            snapshot.update({f'analytics_{key}': value for key, value in self.analytics.stats.items()})
+        if self.rules is not None:
+            snapshot.update({f'rules_{key}': value for key, value in self.rules.stats.items()})
+        if self.firebase is not None:
+            snapshot.update({f'firebase_{key}': value for key, value in self.firebase.stats.items()})
+            snapshot['firebase_pending'] = self.firebase.pending
+        return snapshot
+
+    @property
+    def queue_depth(self):
+        """Reports waiting to be decoded: the spool backlog, or the in-memory queue"""
+        return self.spool.pending if self.spool else self.queue.qsize()
+
+    def process(self, data, client_ip):
+        """
+        Decode a report
+
+        Returns:
+            Decoded fields, or None if the data could not be parsed
+        """
+        start = time.perf_counter()
+        try:
+            return protocol.decode_report(data)
+        except protocol.FrameError as e:
+            self.stats['parse_failures'] += 1
+            self.parse_failures.inc(e.reason)
+            logger.warning("TCP: Unable to parse sensor data ip=%s reason=%s hex=%s",
+                           client_ip, e.reason, data[:250].hex())
+            return None
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - start, 'parse')
+
+    def is_duplicate(self, parsed):
+        """Check a decoded report against the dedup cache and remember it"""
+        key = report_key(parsed)
+        if self.dedup is None or key is None or not self.dedup.seen(key):
+            return False
+        self._drop_duplicate(key)
+        return True
+
+    def _drop_duplicate(self, key):
+        self.stats['duplicates'] += 1
+        logger.info("TCP: Dropped duplicate report device_id=%s frame_count=%s", key[0], key[1])
+
+    def ingest_payload(self, parsed):
+        """
+        Prepare a decoded report for the ingest endpoint (see
+        to_ingest_payload()), asking the API to skip its Firebase sync if
+        the gateway publishes the reading itself, and with shared_dedup
+        adding the report's dedup key
+        """
+        payload = to_ingest_payload(parsed)
+        if self.firebase is not None and self.firebase.covers(parsed):
+            payload['sync_firebase'] = False
+        key = report_key(parsed) if self.shared_dedup else None
+        if key is not None:
+            payload['report_key'] = ':'.join(str(part) for part in key)
+        return payload
+
+    def forward(self, parsed):
+        """Hand a decoded reading to the batch forwarder, analyzed once the API accepted it"""
+        self.forwarder.submit(self.ingest_payload(parsed), parsed)
+
+    def _delivered(self, readings, response):
+        """Analyze the decoded readings of a batch the API accepted"""
+        for parsed, reading_id in stored_readings(readings, response):
+            try:
+                self.analyze(parsed, reading_id)
+            except Exception:
+                logger.exception("Error analyzing reading device_id=%s", parsed.get('device_id'))
+
+    def analyze(self, parsed, reading_id=None):
+        """
+        Update the tank analytics, check the alert rules and publish the tank state of a forwarded reading
+
+        Args:
+            parsed: Decoded report
+            reading_id: sensor_readings id the API stored the reading as, if known
+        """
+        if self.analytics is not None:
+            for event in self.analytics.observe(parsed):
+                self.tank_events.inc(event['type'])
+        if self.rules is not None:
+            events = self.rules.evaluate(parsed)
+            for event in events:
+                self.alerts.inc(event['type'], event['state'])
+            if events and self.alert_log:
+                self._log_alerts(events)
+        if self.firebase is not None:
+            self.firebase.publish(parsed, reading_id)
+
+    def _log_alerts(self, events):
+        try:
+            with open(self.alert_log, 'a') as f:
+                f.writelines(json.dumps(event, separators=(',', ':')) + '\n' for event in events)
+        except OSError as e:
+            logger.error("Failed to write alert log path=%s error=%s", self.alert_log, e)
+
+    def reload_rules(self):
+        """(Re)load the alert rules and tanks files, keeping alert state"""
+        try:
+            tanks = load_json(self.tanks_path) if self.tanks_path else []
+            if self.rules is not None:
+                pairs = self.rules.load(load_json(self.rules_path), tanks)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to load alert rules path=%s tanks=%s error=%s", self.rules_path, self.tanks_path, e)
+            return
+        if self.rules is not None:
+            logger.info("Loaded %s alert rule bindings for %s devices", pairs, len(self.rules.index))
+        if self.firebase is not None:
+            logger.info("Publishing the state of %s tanks to Firebase", self.firebase.load_tanks(tanks))
+        if self.analytics is not None:
+            self.analytics.heights = tank_heights(tanks)
+
+    async def _worker(self):
+        """Decode queued reports and pass them to the forwarder"""
+        while True:
+            data, client_ip = await self.queue.get()
+            try:
+                parsed = self.process(data, client_ip)
+                if parsed and not self.is_duplicate(parsed):
+                    self.forward(parsed)
+            except Exception:
+                logger.exception("TCP: Error processing sensor data ip=%s", client_ip)
+            finally:
+                self.queue.task_done()
+
+    async def _drain(self):
+        """Replay spooled reports to the API, committing only what was accepted"""
+        while True:
+            self._spooled.clear()
+            records, position = self.spool.read(self.forwarder.max_batch)
+            if not records:
+                await self._spooled.wait()
+                # Give a burst a moment to fill the batch
+                await asyncio.sleep(self.forwarder.max_delay)
+                continue
+
+            # Decoded once; retries resend the same readings
+            entries = self._decode_spooled(records)
+            parts = [entries] if entries else []
+            backoff = RETRY_MIN
+            while parts:
+                part = parts[0]
+                try:
+                    response = await self.forwarder.deliver([payload for _, _, payload, _ in part])
+                except ForwardError as e:
+                    if not e.permanent:
+                        await asyncio.sleep(backoff)
+                        backoff = min(backoff * 2, RETRY_MAX)
+                        continue
+                    # Split the rejected batch until the bad readings are isolated
+                    del parts[0]
+                    if len(part) > 1:
+                        half = len(part) // 2
+                        parts[0:0] = [part[:half], part[half:]]
+                    else:
+                        self._reject(part[0], e)
+                    continue
+                del parts[0]
+                backoff = RETRY_MIN
+                # Keys are only remembered once accepted, so a retried
+                # batch is not mistaken for its own duplicate
+                for _, _, _, key in part:
+                    if key is not None:
+                        self.dedup.add(key)
+                for (_, parsed, _, _), reading_id in stored_readings(part, response):
+                    self.analyze(parsed, reading_id)
+
+            self.spool.commit(position, len(records))
+
+    def _decode_spooled(self, records):
+        """
+        Decode spooled records into deliverable readings
+
+        Returns:
+            List of (record, parsed, payload, dedup key or None), without
+            undecodable reports and duplicates
+        """
+        entries = []
+        keys = set()
+        for record in records:
+            client_ip, _, data = record.partition(b'\n')
+            parsed = self.process(data, client_ip.decode(errors='replace'))
+            if not parsed:
+                continue
+            key = report_key(parsed) if self.dedup is not None else None
+            if key is not None:
+                if key in keys or self.dedup.contains(key):
+                    self._drop_duplicate(key)
+                    continue
+                keys.add(key)
+            entries.append((record, parsed, self.ingest_payload(parsed), key))
+        return entries
+
+    def _reject(self, entry, error):
+        """Move a reading the API rejected to the dead-letter file"""
+        record, _, payload, _ = entry
+        client_ip, _, data = record.partition(b'\n')
+        self.stats['rejected'] += 1
+        logger.error("TCP: API rejected reading device_id=%s, moved to %s: %s",
+                     payload.get('device_id'), self.rejected_path, error)
+        line = json.dumps({
+            'rejected_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'status': error.status,
+            'error': str(error),
+            'client_ip': client_ip.decode(errors='replace'),
+            'hex': data.hex(),
+            'reading': payload,
+        }, separators=(',', ':'))
+        try:
+            with open(self.rejected_path, 'a') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            logger.error("Failed to write dead-letter file path=%s error=%s reading=%s",
+                         self.rejected_path, e, line)
+
+    async def _sync_spool(self):
+        """Periodically force spooled reports to disk"""
+        while True:
+            await asyncio.sleep(SPOOL_SYNC_INTERVAL)
+            await asyncio.to_thread(self.spool.flush)
+
+    async def _save_analytics(self):
+        """Periodically write the analytics state file"""
+        while True:
+            await asyncio.sleep(ANALYTICS_SAVE_INTERVAL)
+            try:
+                # Snapshot on the loop, write in a thread
+                await asyncio.to_thread(write_state, self.analytics_state, self.analytics.dump())
+            except OSError as e:
+                logger.error("Failed to write analytics state path=%s error=%s", self.analytics_state, e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TCP gateway for Dingtek DF555 sensor data')
+    parser.add_argument('--host', default='0.0.0.0', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=8888, help='TCP port (default: 8888)')
+    parser.add_argument('--api-url', help='Base URL of the Laravel app (default: $APP_URL)')
+    parser.add_argument('--workers', type=int, default=4, help='Decode worker tasks')
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH,
+                        help=f'Readings per bulk request (at most {MAX_BATCH}, the API limit)')
+    parser.add_argument('--batch-delay', type=float, default=MAX_DELAY,
+                        help='Maximum seconds a reading waits for its batch')
+    parser.add_argument('--spool-dir', help='Write-ahead spool directory (recommended in production)')
+    parser.add_argument('--dedup-window', type=float, default=DEDUP_WINDOW,
+                        help='Seconds to remember reports for duplicate suppression (0 disables)')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this port')
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help='Interface for the metrics endpoint (default: 127.0.0.1)')
+    parser.add_argument('--analytics-state', help='Keep tank analytics and write them to this JSON file')
+    parser.add_argument('--utc-offset', type=float, default=0.0,
+                        help='Local time offset in hours for analytics days and nights')
+    parser.add_argument('--rules', help='JSON export of alert_rules rows to evaluate')
+    parser.add_argument('--tanks', help='JSON export of tank rows with the sensor imei '
+                                        '(for --rules, --firebase, --analytics-state)')
+    parser.add_argument('--alert-log', help='Append raised and resolved alerts to this JSON-lines file')
+    parser.add_argument('--firebase', choices=('rest', 'stub'),
+                        help='Publish the latest tank state to Firebase Realtime Database (needs --tanks)')
+    parser.add_argument('--firebase-interval', type=float, default=FIREBASE_INTERVAL,
+                        help='Seconds between coalesced Firebase writes')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Worker processes sharing the port via SO_REUSEPORT (default: 1)')
+    args = parser.parse_args()
+    if not 1 <= args.batch_size <= MAX_BATCH:
+        parser.error(f'--batch-size must be between 1 and {MAX_BATCH}')
+    if args.firebase and not args.tanks:
+        parser.error('--firebase needs --tanks: only tanks listed there are published')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    options = {
+        'host': args.host,
+        'port': args.port,
+        'api_url': args.api_url,
+        'workers': args.workers,
+        'max_batch': args.batch_size,
+        'max_delay': args.batch_delay,
+        'spool_dir': args.spool_dir,
+        'dedup_window': args.dedup_window,
+        'metrics_port': args.metrics_port,
+        'metrics_host': args.metrics_host,
+        'analytics_state': args.analytics_state,
+        'utc_offset': args.utc_offset,
+        'rules': args.rules,
+        'tanks': args.tanks,
+        'alert_log': args.alert_log,
+        'firebase': args.firebase,
+        'firebase_interval': args.firebase_interval,
+        # Dual-server copies may reach different processes
+        'shared_dedup': args.processes > 1 and args.dedup_window > 0,
+    }
+
+    if args.processes > 1:
+        from df555.supervisor import Supervisor
+        return Supervisor(args.processes, options).run()
+    if args.spool_dir:
+        # Spools of a previous multi-process run
+        from df555.supervisor import adopt_spools
+        adopt_spools(args.spool_dir, 1)
+
+    asyncio.run(SensorGateway(**options).run())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
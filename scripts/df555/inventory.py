@@ -0,0 +1,271 @@
+"""
+Local provisioning inventory of DF555 sensors (SQLite)
+
+Records, per IMEI, the desired value of each setting and the last value
+the sensor confirmed, plus an append-only history of every command sent
+and its reply. The configuration tools use it to send only the commands
+whose desired value differs from what the sensor is known to hold, which
+keeps a session well inside the wake window, and to leave an audit trail
+of what each unit actually holds.
+
+Settings are keyed like the emulator parameters:
+
+    server1       'ip;port;' (command 06)
+    server2       'ip;port;' (command 07)
+    server_mode   '00', '01' or '02' (command 09)
+
+Usage:
+    python3 configure_sensor.py /dev/ttyUSB0 --imei 868000000000001 --server1 66.241.124.67 8888
+    python3 -m df555.inventory list
+    python3 -m df555.inventory show 868000000000001
+    python3 -m df555.inventory history 868000000000001
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from df555 import protocol
+
+DEFAULT_PATH = os.environ.get(
+    'DF555_INVENTORY', os.path.join(os.path.expanduser('~'), '.local', 'share', 'df555', 'inventory.db')
+)
+
+# Setting key of each configure command code
+SETTINGS = protocol.COMMAND_PARAMS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    imei TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    last_session REAL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    imei TEXT NOT NULL REFERENCES devices(imei),
+    key TEXT NOT NULL,
+    desired TEXT,
+    confirmed TEXT,
+    confirmed_at REAL,
+    PRIMARY KEY (imei, key)
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    imei TEXT NOT NULL,
+    at REAL NOT NULL,
+    session TEXT,
+    key TEXT,
+    value TEXT,
+    command TEXT NOT NULL,
+    response TEXT,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_imei ON history (imei, at);
+"""
+
+
+class Inventory:
+    """Desired and confirmed sensor settings with a command history"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        """
+        Open (and create) the inventory database
+
+        Args:
+            path: SQLite file, or ':memory:'
+        """
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # Fleet sessions record results from several threads
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _ensure(self, imei):
+        self._db.execute('INSERT OR IGNORE INTO devices (imei, created_at) VALUES (?, ?)', (imei, time.time()))
+
+    def set_desired(self, imei, settings):
+        """
+        Record the desired value of settings (others are left unchanged)
+
+        Args:
+            imei: Sensor IMEI
+            settings: {key: value}, e.g. {'server1': '66.241.124.67;8888;'}
+        """
+        with self._lock, self._db:
+            self._ensure(imei)
+            self._db.executemany(
+                'INSERT INTO settings (imei, key, desired) VALUES (?, ?, ?) '
+                'ON CONFLICT (imei, key) DO UPDATE SET desired = excluded.desired',
+                [(imei, key, value) for key, value in settings.items()]
+            )
+
+    def settings(self, imei):
+        """
+        Settings of a sensor
+
+        Returns:
+            {key: {'desired', 'confirmed', 'confirmed_at'}}
+        """
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT key, desired, confirmed, confirmed_at FROM settings WHERE imei = ? ORDER BY key', (imei,)
+            ).fetchall()
+        return {row['key']: dict(row) for row in rows}
+
+    def pending(self, imei):
+        """Desired values the sensor has not confirmed: {key: value}"""
+        return {key: setting['desired'] for key, setting in self.settings(imei).items()
+                if setting['desired'] is not None and setting['desired'] != setting['confirmed']}
+
+    def record(self, imei, command, response, ok, session=None):
+        """
+        Log a command and its reply; a confirmed configure command updates
+        the sensor's confirmed value, and a query reply (the parameter dump)
+        every value it reports
+
+        Args:
+            imei: Sensor IMEI
+            command: Command string sent
+            response: Reply (bytes or str), or None
+            ok: Whether the reply confirmed the command
+            session: Optional session label (e.g., the serial port)
+        """
+        if isinstance(response, bytes):
+            response = response.decode('ascii', errors='replace')
+        key = value = None
+        confirmed = {}
+        if command[2:4] == protocol.COMMAND_TYPE_CONFIGURE:
+            key = SETTINGS.get(command[8:10])
+            value = command[10:-2]
+            if key:
+                confirmed[key] = value
+        elif command[2:4] == protocol.COMMAND_TYPE_QUERY and response:
+            params = protocol.parse_params(response)
+            if params:
+                confirmed = {key: params.content(key) for key in SETTINGS.values()
+                             if params.content(key) is not None}
+        now = time.time()
+        with self._lock, self._db:
+            self._ensure(imei)
+            self._db.execute('UPDATE devices SET last_session = ? WHERE imei = ?', (now, imei))
+            self._db.execute(
+                'INSERT INTO history (imei, at, session, key, value, command, response, ok) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (imei, now, session, key, value, command, response, int(bool(ok)))
+            )
+            if ok and confirmed:
+                self._db.executemany(
+                    'INSERT INTO settings (imei, key, confirmed, confirmed_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (imei, key) DO UPDATE SET confirmed = excluded.confirmed, '
+                    'confirmed_at = excluded.confirmed_at',
+                    [(imei, setting, content, now) for setting, content in confirmed.items()]
+                )
+
+    def history(self, imei, limit=50):
+        """Most recent commands sent to a sensor, newest first"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT at, session, key, value, command, response, ok FROM history '
+                'WHERE imei = ? ORDER BY id DESC LIMIT ?', (imei, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def devices(self):
+        """Every sensor with its number of pending settings"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT d.imei, d.last_session, '
+                'SUM(s.desired IS NOT NULL AND s.desired IS NOT s.confirmed) AS pending '
+                'FROM devices d LEFT JOIN settings s ON s.imei = d.imei '
+                'GROUP BY d.imei ORDER BY d.imei'
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def plan(inventory, imei, batch, force=False):
+    """
+    Record a batch as desired settings and keep only what must be sent
+
+    Args:
+        inventory: Inventory
+        imei: Sensor IMEI
+        batch: List of (label, cmd_code, content), see DF555Configurator.build_batch()
+        force: Send everything regardless of the confirmed values
+
+    Returns:
+        (to_send, skipped) lists of batch entries
+    """
+    inventory.set_desired(imei, {SETTINGS[code]: content for _, code, content in batch if code in SETTINGS})
+    if force:
+        return list(batch), []
+    pending = inventory.pending(imei)
+    to_send, skipped = [], []
+    for entry in batch:
+        key = SETTINGS.get(entry[1])
+        (to_send if key is None or key in pending else skipped).append(entry)
+    return to_send, skipped
+
+
+def _when(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)) if timestamp else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect the DF555 provisioning inventory')
+    parser.add_argument('--db', default=DEFAULT_PATH, help=f'Inventory database (default: {DEFAULT_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='Sensors and their pending settings')
+    show = commands.add_parser('show', help='Desired and confirmed settings of a sensor')
+    show.add_argument('imei')
+    history = commands.add_parser('history', help='Commands sent to a sensor')
+    history.add_argument('imei')
+    history.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    with Inventory(args.db) as inventory:
+        if args.command == 'list':
+            devices = inventory.devices()
+            print(f"{'IMEI':<18} {'Pending':>7}  Last session")
+            print("-" * 60)
+            for device in devices:
+                print(f"{device['imei']:<18} {device['pending'] or 0:>7}  {_when(device['last_session'])}")
+            print(f"{len(devices)} sensor(s)")
+            return 0
+
+        if args.command == 'show':
+            settings = inventory.settings(args.imei)
+            if not settings:
+                print(f"✗ No settings recorded for {args.imei}")
+                return 1
+            print(f"{'Setting':<12} {'Desired':<26} {'Confirmed':<26} Confirmed at")
+            print("-" * 60)
+            for key, setting in settings.items():
+                mark = '✓' if setting['desired'] in (None, setting['confirmed']) else '✗'
+                print(f"{key:<12} {setting['desired'] or '-':<26} {setting['confirmed'] or '-':<26} "
+                      f"{_when(setting['confirmed_at'])} {mark}")
+            return 0
+
+        for entry in inventory.history(args.imei, args.limit):
+            status = '✓' if entry['ok'] else '✗'
+            response = (entry['response'] or '').strip().replace('\r\n', ' | ')
+            print(f"{_when(entry['at'])}  {status} {entry['command']:<48} {response}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
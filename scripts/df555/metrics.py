@@ -0,0 +1,234 @@
+"""
+In-process metrics with a Prometheus text endpoint
+
+Counters, gauges and histograms live in a Registry. Their state() is a
+plain, picklable dict, so worker processes can ship it to the supervisor,
+which merges it with merge_states(); render() turns a state into the
+Prometheus text exposition format served by start_http_server().
+
+Usage:
+    registry = Registry()
+    stage = stage_histogram(registry)
+    stage.observe(0.004, 'parse')
+    server = start_http_server(lambda: render(registry.state()), port=9100)
+"""
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('df555.metrics')
+
+# Seconds, from a fast decode up to a slow API round trip
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def stage_histogram(registry):
+    """The per-stage ingest latency histogram shared by gateway and forwarder"""
+    return registry.histogram('df555_stage_seconds', 'Seconds spent in each ingest stage', labels=('stage',))
+
+
+class Metric:
+    """Base class: a named family of values keyed by label values"""
+
+    kind = None
+
+    def __init__(self, name, help, labels=(), function=None):
+        """
+        Initialize metric
+
+        Args:
+            name: Metric name
+            help: One-line description
+            labels: Label names
+            function: Callable returning the current value, for metrics
+                that mirror an existing counter or gauge (unlabelled only)
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.function = function
+        self._values = {}
+
+    def _state_values(self):
+        if self.function is not None:
+            return {(): self.function()}
+        return dict(self._values)
+
+    def state(self):
+        return {'type': self.kind, 'help': self.help, 'labels': self.labels, 'values': self._state_values()}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        """Add amount to the counter for the given label values"""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        """Record one observation for the given label values"""
+        series = self._values.get(labels)
+        if series is None:
+            # Per-bucket (not cumulative) counts plus +Inf, then sum
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def state(self):
+        state = super().state()
+        state['buckets'] = self.buckets
+        state['values'] = {labels: (list(counts), total) for labels, (counts, total) in state['values'].items()}
+        return state
+
+
+class Registry:
+    """A set of metrics, created on first use"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _get(self, cls, name, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+        return metric
+
+    def counter(self, name, help, labels=(), function=None):
+        return self._get(Counter, name, help, labels, function)
+
+    def gauge(self, name, help, labels=(), function=None):
+        return self._get(Gauge, name, help, labels, function)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def state(self):
+        """Current values of all metrics"""
+        return {name: metric.state() for name, metric in list(self._metrics.items())}
+
+
+def merge_states(states, gauges=True):
+    """
+    Sum the states of several registries (e.g., one per worker process)
+
+    Args:
+        states: Iterable of Registry.state() dicts
+        gauges: Include gauges (leave them out for processes that exited)
+
+    Returns:
+        Merged state dict
+    """
+    merged = {}
+    for state in states:
+        for name, metric in state.items():
+            if metric['type'] == 'gauge' and not gauges:
+                continue
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = dict(metric, values={})
+            values = target['values']
+            for labels, value in metric['values'].items():
+                current = values.get(labels)
+                if current is None:
+                    values[labels] = value
+                elif metric['type'] == 'histogram':
+                    values[labels] = ([a + b for a, b in zip(current[0], value[0])], current[1] + value[1])
+                else:
+                    values[labels] = current + value
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(state):
+    """Format a state in the Prometheus text exposition format"""
+    lines = []
+    for name, metric in sorted(state.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric['labels']
+        for labels, value in sorted(metric['values'].items()):
+            if metric['type'] != 'histogram':
+                lines.append(f"{name}{_labels(names, labels)} {_number(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(metric['buckets'] + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(names, labels, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(names, labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def start_http_server(render_metrics, host='127.0.0.1', port=9100):
+    """
+    Serve GET /metrics from a background thread
+
+    Args:
+        render_metrics: Callable returning the exposition text
+        host: Interface to listen on
+        port: TCP port
+
+    Returns:
+        The ThreadingHTTPServer (call shutdown() to stop it)
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = render_metrics().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='df555-metrics', daemon=True).start()
+    logger.info("Metrics endpoint on http://%s:%s/metrics", host, server.server_port)
+    return server
@@ -0,0 +1,584 @@
+"""
+DF555 protocol codec
+
+Downlink commands are ASCII strings:  80 <type> 9999 <cmd> <content> 81
+Uplink reports are binary frames, see SensorTcpServer::parseBinaryFormat:
+
+    0x80 | forced bit | device type | report type | packet size | payload | 0x81
+
+Payload for trigger (0x01) and heartbeat (0x02) reports:
+
+    height (2, mm) | GPS selection (1) | [longitude (4, float) | latitude (4, float)]
+    | temperature (1) | status (2) | battery (2, 10 mV) | RSRP (4, float)
+    | frame count (2) | timestamp (4, unix) | device id (8, 1 + IMEI)
+
+All multi-byte fields are big-endian (network order), the floats included
+(SensorTcpServer::parsePayload reads them with unpack('G')). Decoding works
+on a memoryview with precompiled struct.Struct objects, so no intermediate
+copies are made while parsing.
+
+The packet size byte is the length of the whole frame, head to tail;
+StreamFramer uses it to split a TCP byte stream into frames.
+"""
+
+import re
+import struct
+import time
+
+PACKET_HEAD = 0x80
+PACKET_TAIL = 0x81
+DEVICE_TYPE_DF555 = 0x05
+
+# Downlink command types
+COMMAND_TYPE_RESET = '00'
+COMMAND_TYPE_QUERY = '01'
+COMMAND_TYPE_CONFIGURE = '02'
+
+# Default device password
+PASSWORD = '9999'
+
+# Downlink command codes
+CMD_SET_SERVER1 = '06'
+CMD_SET_SERVER2 = '07'  # Unverified - may need confirmation
+CMD_SWITCH_FUNCTION = '09'  # Switch function setting (may include server mode)
+
+# Parameter set by each configure command, and its label in a query dump
+COMMAND_PARAMS = {
+    CMD_SET_SERVER1: 'server1',
+    CMD_SET_SERVER2: 'server2',
+    CMD_SWITCH_FUNCTION: 'server_mode',
+}
+PARAM_LABELS = (
+    ('server1', 'Server1'),
+    ('server2', 'Server2'),
+    ('server_mode', 'ServerMode'),
+)
+
+# Uplink report types
+REPORT_TRIGGER = 0x01
+REPORT_HEARTBEAT = 0x02
+REPORT_COMMAND_REPLY = 0x03
+
+REPORT_TYPE_NAMES = {
+    REPORT_TRIGGER: 'Trigger Report',
+    REPORT_HEARTBEAT: 'Heartbeat',
+    REPORT_COMMAND_REPLY: 'Command Reply',
+}
+
+# Status bits
+STATUS_FULL = 0x01
+STATUS_FIRE = 0x02
+STATUS_POWER = 0x04
+
+HEADER = struct.Struct('>BBBBB')
+PAYLOAD = struct.Struct('>HBBHHfHI8s')
+PAYLOAD_GPS = struct.Struct('>HBffBHHfHI8s')
+
+HEADER_SIZE = HEADER.size
+FRAME_SIZE = HEADER_SIZE + PAYLOAD.size + 1
+FRAME_SIZE_GPS = HEADER_SIZE + PAYLOAD_GPS.size + 1
+
+# Offset of the GPS selection byte within a frame
+GPS_SELECTION_OFFSET = HEADER_SIZE + 2
+
+# Battery voltage mapped to the API's 0-100% 'battery' (as in dingtek:sync)
+BATTERY_EMPTY_MV = 3000
+BATTERY_FULL_MV = 4200
+
+
+class FrameError(ValueError):
+    """Raised when an uplink frame cannot be decoded"""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def build_command(cmd_code, content='', command_type=COMMAND_TYPE_CONFIGURE, password=PASSWORD):
+    """
+    Build a downlink command string
+
+    Format: 80 <TYPE> <PASSWORD> <CMD_CODE> <CONTENT> 81
+
+    Args:
+        cmd_code: Command code (e.g., '06' for Server 1)
+        content: Command content (e.g., 'IP;PORT;')
+        command_type: '02' configure, '01' query, '00' reset
+        password: Device password
+
+    Returns:
+        ASCII command string
+    """
+    return f"80{command_type}{password}{cmd_code}{content}81"
+
+
+def build_server_command(server_num, host, port, password=PASSWORD):
+    """
+    Build the command setting Server 1 or Server 2
+
+    The content must end with two semicolons (IP;PORT;) or the sensor
+    rejects it.
+    """
+    cmd_code = CMD_SET_SERVER1 if server_num == 1 else CMD_SET_SERVER2
+    return build_command(cmd_code, f"{host};{port};", password=password)
+
+
+def check_reply(command, reply):
+    """
+    Check whether the reply text received so far answers a command
+
+    A query ends with 'OK' after the parameter dump and a reset answers
+    'Reset OK'. The reply to a configure command is not documented (the
+    emulator echoes '<Label>:<content>OK'), so like the original serial
+    script any reply naming the parameter ('Server1') or saying 'OK'
+    counts; read the settings back with a query to verify them.
+
+    Returns:
+        True (confirmed), False (rejected) or None (incomplete)
+    """
+    if 'Password error' in reply or 'Command error' in reply:
+        return False
+    command_type = command[2:4]
+    if command_type == COMMAND_TYPE_QUERY:
+        return True if reply.rstrip().endswith('OK') else None
+    if command_type == COMMAND_TYPE_RESET:
+        return True if 'Reset OK' in reply else None
+    label = dict(PARAM_LABELS).get(COMMAND_PARAMS.get(command[8:10]))
+    return True if 'OK' in reply or (label and label in reply) else None
+
+
+class SensorParams:
+    """Sensor configuration read back with a query command"""
+
+    __slots__ = ('server1', 'server2', 'server_mode', 'extra')
+
+    def __init__(self, server1=None, server2=None, server_mode=None, extra=None):
+        """
+        Args:
+            server1, server2: (host, port) tuples, or None if not reported
+            server_mode: Server mode code ('00', '01' or '02'), or None
+            extra: Other reported parameters, {label: raw value}
+        """
+        self.server1 = server1
+        self.server2 = server2
+        self.server_mode = server_mode
+        self.extra = extra or {}
+
+    @classmethod
+    def from_values(cls, values):
+        """Build from a query dump, {label: raw value}"""
+        params = cls()
+        labels = {label.lower(): key for key, label in PARAM_LABELS}
+        for label, value in values.items():
+            key = labels.get(label.lower())
+            if key is None:
+                params.extra[label] = value
+            elif key == 'server_mode':
+                params.server_mode = value
+            else:
+                host, _, port = value.partition(';')
+                setattr(params, key, (host, _to_number(port, int)))
+        return params
+
+    def content(self, key):
+        """
+        Value of a parameter as configure command content, e.g. 'ip;port;'
+
+        Returns:
+            Content string, or None if the parameter was not reported
+        """
+        value = getattr(self, key)
+        if value is None or key == 'server_mode':
+            return value
+        return f"{value[0]};{value[1]};"
+
+    @property
+    def imei(self):
+        """IMEI line of the dump, or None if the firmware does not report it"""
+        return next((value for label, value in self.extra.items() if label.lower() == 'imei'), None)
+
+    def to_dict(self):
+        """Parameters keyed like COMMAND_PARAMS, as command content"""
+        values = {key: self.content(key) for key, _ in PARAM_LABELS}
+        values.update(self.extra)
+        return values
+
+    def __repr__(self):
+        return f"SensorParams({self.to_dict()!r})"
+
+
+class ParamReader:
+    """
+    Incremental parser of the parameter dump answering a query command
+
+    The dump is '<Label>:<value>' lines followed by an 'OK' line. Bytes
+    are fed as they arrive, so reading stops on the final line instead of
+    waiting for the line to go quiet.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.complete = False
+        self.error = None
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Consume received bytes
+
+        Returns:
+            True once the dump is complete or the sensor rejected the query
+        """
+        self._buffer += data
+        while not self.complete:
+            end = self._buffer.find(b'\n')
+            if end < 0:
+                # The final 'OK' may arrive without a line break
+                if self._buffer.strip() == b'OK':
+                    self.complete = True
+                break
+            line = self._buffer[:end].decode('ascii', errors='ignore').strip()
+            del self._buffer[:end + 1]
+            self._line(line)
+        return self.complete
+
+    def _line(self, line):
+        if line == 'OK':
+            self.complete = True
+        elif 'Password error' in line or 'Command error' in line:
+            self.error = line
+            self.complete = True
+        else:
+            label, separator, value = line.partition(':')
+            if separator and label.strip():
+                self.values[label.strip()] = value.strip()
+
+    @property
+    def params(self):
+        """SensorParams of a complete dump, or None"""
+        if not self.complete or self.error:
+            return None
+        return SensorParams.from_values(self.values)
+
+
+def parse_params(data):
+    """
+    Parse a complete query reply
+
+    Args:
+        data: Reply bytes or str
+
+    Returns:
+        SensorParams, or None if the reply is incomplete or an error
+    """
+    reader = ParamReader()
+    reader.feed(data.encode('ascii') if isinstance(data, str) else data)
+    return reader.params
+
+
+def build_report(height_mm, device_id, report_type=REPORT_HEARTBEAT, gps=None, temperature=25,
+                 status=0, battery_mv=3600, rsrp=-90.0, frame_count=0, timestamp=None,
+                 forced_bit=0x00, device_type=DEVICE_TYPE_DF555):
+    """
+    Build a binary uplink report frame, the inverse of parse_frame()
+
+    Args:
+        height_mm: Measured height in mm
+        device_id: 16 hex digits (1 + IMEI) or 8 raw bytes
+        report_type: REPORT_TRIGGER or REPORT_HEARTBEAT
+        gps: (longitude, latitude) tuple, or None for no GPS
+        temperature: Temperature in ℃ (0-255)
+        status: Status bits (STATUS_FULL | STATUS_FIRE | STATUS_POWER)
+        battery_mv: Battery voltage in mV
+        rsrp: Signal RSRP in dBm
+        frame_count: Frame counter (wraps at 65536)
+        timestamp: Unix time, defaults to now
+
+    Returns:
+        Frame bytes
+    """
+    if isinstance(device_id, str):
+        device_id = bytes.fromhex(device_id)
+    if timestamp is None:
+        timestamp = int(time.time())
+
+    common = (temperature, status, battery_mv // 10, rsrp, frame_count & 0xFFFF, timestamp, device_id)
+    if gps is None:
+        size = FRAME_SIZE
+        payload = PAYLOAD.pack(height_mm, 0x00, *common)
+    else:
+        size = FRAME_SIZE_GPS
+        payload = PAYLOAD_GPS.pack(height_mm, 0x01, gps[0], gps[1], *common)
+
+    header = HEADER.pack(PACKET_HEAD, forced_bit, device_type, report_type, size)
+    return header + payload + bytes((PACKET_TAIL,))
+
+
+def report_type_name(report_type):
+    """Get human-readable report type name"""
+    return REPORT_TYPE_NAMES.get(report_type, 'Unknown')
+
+
+def parse_frame(data):
+    """
+    Decode one binary uplink frame
+
+    Produces the same fields as SensorTcpServer::parsePayload so the result
+    can be forwarded to /api/sensors/dingtek/data unchanged. rsrp, longitude
+    and latitude are big-endian floats like every other field.
+
+    Args:
+        data: bytes, bytearray or memoryview holding exactly one frame
+
+    Returns:
+        Dict of decoded fields
+
+    Raises:
+        FrameError: with reason 'too_short', 'bad_head', 'bad_tail',
+            'unsupported_report_type' or 'truncated'
+    """
+    view = memoryview(data)
+    length = len(view)
+
+    if length < HEADER_SIZE + 1:
+        raise FrameError('too_short', f"Packet too short ({length} bytes)")
+    if view[0] != PACKET_HEAD:
+        raise FrameError('bad_head', f"Invalid packet head 0x{view[0]:02X}")
+    if view[length - 1] != PACKET_TAIL:
+        raise FrameError('bad_tail', f"Invalid packet tail 0x{view[length - 1]:02X}")
+
+    _, forced_bit, device_type, report_type, packet_size = HEADER.unpack_from(view)
+
+    if report_type != REPORT_TRIGGER and report_type != REPORT_HEARTBEAT:
+        raise FrameError('unsupported_report_type', f"Unsupported report type 0x{report_type:02X}")
+
+    has_gps = length > GPS_SELECTION_OFFSET and view[GPS_SELECTION_OFFSET] == 0x01
+    layout = PAYLOAD_GPS if has_gps else PAYLOAD
+    if length < HEADER_SIZE + layout.size + 1:
+        raise FrameError('truncated', f"Payload truncated ({length} bytes)")
+
+    if has_gps:
+        (height, _, longitude, latitude, temperature, status, voltage,
+         rsrp, frame_count, timestamp, device_id) = layout.unpack_from(view, HEADER_SIZE)
+    else:
+        (height, _, temperature, status, voltage,
+         rsrp, frame_count, timestamp, device_id) = layout.unpack_from(view, HEADER_SIZE)
+
+    device_id = device_id.hex()
+    parsed = {
+        'distance': height / 1000,
+        'height_mm': height,
+        'has_gps': has_gps,
+    }
+    if has_gps:
+        parsed['longitude'] = longitude
+        parsed['latitude'] = latitude
+    parsed.update({
+        'temperature': temperature,
+        'status_full': 1 if status & STATUS_FULL else 0,
+        'status_fire': 1 if status & STATUS_FIRE else 0,
+        'status_power': 1 if status & STATUS_POWER else 0,
+        'battery_level': voltage * 10 / 1000,
+        'battery_voltage_mv': voltage * 10,
+        'rsrp': rsrp,
+        'frame_count': frame_count,
+        'timestamp': timestamp,
+        'timestamp_readable': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp)),
+        'device_id': device_id,
+        'imei': device_id[1:],
+        'forced_bit': forced_bit,
+        'device_type': device_type,
+        'packet_size': packet_size,
+        'report_type': report_type,
+        'report_type_name': report_type_name(report_type),
+    })
+    return parsed
+
+
+class StreamFramer:
+    """
+    Split a TCP byte stream into binary frames
+
+    Chunks are appended to one growing buffer and each header's packet size
+    gives the next boundary, so every byte is looked at once no matter how
+    the stream is split across reads, and several frames may arrive on one
+    connection. A frame is only accepted if its tail byte is 0x81 where the
+    packet size says it is; a 0x81 inside the payload (e.g., in a float) is
+    never taken for the end of the frame.
+
+    A stream that does not start with a packet head, or whose header does
+    not describe a valid frame, switches the framer to raw mode: the rest
+    is buffered unframed and returned by flush(), which is how
+    SensorTcpServer treats every connection (ASCII reports, unknown
+    devices).
+    """
+
+    # Consumed bytes are dropped from the buffer once there are this many
+    COMPACT_AFTER = 4096
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._start = 0
+        self.raw = False
+
+    @property
+    def buffered(self):
+        """Bytes received but not yet returned as a frame"""
+        return len(self._buffer) - self._start
+
+    def feed(self, data):
+        """
+        Add received bytes
+
+        Args:
+            data: bytes-like chunk as read from the socket
+
+        Returns:
+            List of complete frames (bytes), possibly empty
+        """
+        buffer = self._buffer
+        buffer += data
+        if self.raw:
+            return []
+
+        frames = []
+        start = self._start
+        end = len(buffer)
+        while start < end:
+            if buffer[start] != PACKET_HEAD:
+                self.raw = True
+                break
+            if end - start < HEADER_SIZE:
+                break
+            size = buffer[start + 4]
+            if size <= HEADER_SIZE:
+                self.raw = True
+                break
+            if end - start < size:
+                break
+            if buffer[start + size - 1] != PACKET_TAIL:
+                self.raw = True
+                break
+            frames.append(bytes(buffer[start:start + size]))
+            start += size
+
+        if start == end:
+            buffer.clear()
+            start = 0
+        elif start >= self.COMPACT_AFTER:
+            del buffer[:start]
+            start = 0
+        self._start = start
+        return frames
+
+    def flush(self):
+        """Return and clear whatever has not been returned as a frame"""
+        rest = bytes(self._buffer[self._start:])
+        self._buffer.clear()
+        self._start = 0
+        return rest
+
+
+# Bytes of an ASCII report
+_TEXT_BYTES = bytes(range(0x20, 0x7F)) + b'\t\r\n'
+
+
+def _to_number(value, cast=float):
+    """Lenient numeric cast, like PHP's (float)/(int): leading number or 0"""
+    match = re.match(r'\s*[-+]?(\d+\.?\d*|\.\d+)', value)
+    return cast(float(match.group(0))) if match else cast(0)
+
+
+def parse_ascii(data):
+    """
+    Decode an ASCII report, see SensorTcpServer::parseAsciiFormat
+
+    Accepts 'DeviceID,Distance,Temperature,Battery,RSSI' lines (distance in
+    mm) or key-value pairs such as 'device=ABC;distance=1200'.
+
+    Args:
+        data: bytes-like report
+
+    Returns:
+        Dict of decoded fields, or None if no device id was found
+    """
+    text = bytes(data).decode('ascii', errors='ignore')
+    parsed = {}
+
+    for line in text.strip().split('\n'):
+        line = line.strip()
+
+        # Comma-separated format
+        if ',' in line:
+            parts = line.split(',')
+            if len(parts) >= 2:
+                return {
+                    'device_id': parts[0] or 'unknown',
+                    'distance': _to_number(parts[1]) / 1000,  # mm to meters
+                    'temperature': _to_number(parts[2]) if len(parts) > 2 else None,
+                    'battery_level': _to_number(parts[3], int) if len(parts) > 3 else None,
+                    'rssi': _to_number(parts[4], int) if len(parts) > 4 else None,
+                }
+
+        # Key-value format
+        if ':' in line or '=' in line:
+            for pair in re.split(r'[,;]', line):
+                match = re.match(r'(.+?)[:=](.+)', pair.strip())
+                if not match:
+                    continue
+                key = match.group(1).strip().lower()
+                value = match.group(2).strip()
+
+                if 'device' in key or 'id' in key:
+                    parsed['device_id'] = value
+                elif 'distance' in key or 'level' in key:
+                    parsed['distance'] = _to_number(value) / 1000
+                elif 'temp' in key:
+                    parsed['temperature'] = _to_number(value)
+                elif 'battery' in key or 'bat' in key:
+                    parsed['battery_level'] = _to_number(value, int)
+                elif 'rssi' in key or 'signal' in key:
+                    parsed['rssi'] = _to_number(value, int)
+
+    return parsed if 'device_id' in parsed else None
+
+
+def decode_report(data):
+    """
+    Decode a report received on the TCP port
+
+    Binary frames (starting with 0x80) go to parse_frame(); anything else is
+    tried as ASCII. Binary frames are never tried as ASCII first, since
+    payload bytes can look like ',' or ':'.
+
+    Raises:
+        FrameError: if the data cannot be decoded; reason 'bad_head' for
+            binary data without the 0x80 head, 'unrecognized' for text that
+            is no known ASCII format
+    """
+    if len(data) and data[0] == PACKET_HEAD:
+        return parse_frame(data)
+
+    parsed = parse_ascii(data)
+    if parsed is None:
+        # ASCII reports may end with the 0x81 tail like binary frames
+        if bytes(data).rstrip(bytes((PACKET_TAIL,))).translate(None, _TEXT_BYTES):
+            raise FrameError('bad_head', f"Invalid packet head 0x{data[0]:02X}")
+        raise FrameError('unrecognized', "Unrecognized report format")
+    return parsed
+
+
+def battery_percent(parsed):
+    """
+    Battery charge of a decoded report as the 0-100% the API stores
+
+    Binary frames carry the voltage, mapped linearly between
+    BATTERY_EMPTY_MV and BATTERY_FULL_MV; ASCII reports carry a level.
+
+    Returns:
+        Percentage, or None if the report has no battery field
+    """
+    if parsed.get('battery_voltage_mv') is not None:
+        percent = (parsed['battery_voltage_mv'] - BATTERY_EMPTY_MV) / (BATTERY_FULL_MV - BATTERY_EMPTY_MV) * 100
+        return round(max(0.0, min(100.0, percent)), 1)
+    return parsed.get('battery_level')
@@ -0,0 +1,502 @@
+"""
+Time-scaled replay of captured DF555 traffic
+
+Frames logged by SensorTcpServer::processSensorData (hex_data) are
+extracted, with the time of their log line, into a compact capture file:
+
+    'DF5R' | version (u16) | first arrival (u64, unix ms) | records
+
+where each record is the milliseconds since the previous arrival (u32),
+the frame length (u16) and the frame bytes; about 40 bytes per report
+instead of the few hundred of a log line.
+
+A capture is replayed against a TCP gateway (one connection per report,
+waiting for the 'OK' ack like a sensor) or the HTTP bulk endpoint (each
+frame decoded and POSTed to /api/sensors/dingtek/bulk as the gateway
+forwards it, one reading per request), keeping the original
+inter-arrival times divided by --speed. Reports of one device are sent in
+order, each after the previous one was acknowledged, so bursts such as the
+morning heartbeat storm keep their shape while per-device sequences stay
+intact. Arrival times have the resolution of the log (usually a second).
+
+Usage:
+    python3 -m df555.replay extract traffic.df5r storage/logs/laravel-2025-*.log
+    python3 -m df555.replay info traffic.df5r
+    python3 -m df555.replay run traffic.df5r --tcp 127.0.0.1:8888 --speed 100
+    python3 -m df555.replay run traffic.df5r --http http://localhost:8000 --speed 10 --json
+"""
+
+import argparse
+import asyncio
+import calendar
+import heapq
+import http.client
+import json
+import os
+import re
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from df555 import protocol
+from df555.forwarder import BULK_PATH, HttpPool
+from df555.gateway import to_ingest_payload
+from df555.simulator import percentile
+
+MAGIC = b'DF5R'
+VERSION = 1
+PREFIX = struct.Struct('<4sHQ')
+RECORD = struct.Struct('<IH')
+SUFFIX = '.df5r'
+
+# Reports scheduled but not yet sent, per unit of concurrency
+BACKLOG_FACTOR = 10
+
+# '[2025-01-15 06:00:01]' (Laravel) or '2025-01-15 06:00:01,123' (Python logging)
+_LOG_TIME = re.compile(r'^\[?(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2}):(\d{2})(?:[.,](\d{1,6}))?')
+
+
+def log_time(line):
+    """Unix time (seconds, UTC) at the start of a log line, or None"""
+    match = _LOG_TIME.match(line)
+    if not match:
+        return None
+    fields = [int(value) for value in match.groups()[:6]]
+    fraction = match.group(7)
+    return calendar.timegm(fields) + (int(fraction) / 10 ** len(fraction) if fraction else 0.0)
+
+
+def device_key(frame):
+    """Device id of a frame, or None if it cannot be decoded"""
+    try:
+        return protocol.decode_report(frame).get('device_id')
+    except protocol.FrameError:
+        return None
+
+
+def iter_log_frames(lines):
+    """
+    Yield (arrival, frame) from a log, see df555.batch.hex_frame()
+
+    Lines without a timestamp (plain hex dumps) take the timestamp in the
+    frame itself, or the previous arrival.
+    """
+    from df555.batch import hex_frame
+
+    arrival = 0.0
+    for line in lines:
+        frame = hex_frame(line)
+        if not frame:
+            continue
+        at = log_time(line)
+        if at is None:
+            try:
+                at = float(protocol.parse_frame(frame)['timestamp'])
+            except (protocol.FrameError, KeyError):
+                at = arrival
+        arrival = at
+        yield arrival, frame
+
+
+def write_capture(path, records):
+    """
+    Write (arrival, frame) records to a capture file
+
+    Records are expected in time order; one arriving earlier than its
+    predecessor is stored with a zero gap.
+
+    Returns:
+        Number of records written
+    """
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, 0))
+        previous = None
+        for arrival, frame in records:
+            arrival_ms = int(arrival * 1000)
+            if previous is None:
+                first = previous = arrival_ms
+            gap = max(0, arrival_ms - previous)
+            previous = max(previous, arrival_ms)
+            f.write(RECORD.pack(min(gap, 0xFFFFFFFF), len(frame)))
+            f.write(frame)
+            count += 1
+        if count:
+            f.seek(0)
+            f.write(PREFIX.pack(MAGIC, VERSION, first))
+    return count
+
+
+def read_capture(path):
+    """
+    Yield (arrival, frame) records from a capture file
+
+    Raises:
+        ValueError: if the file is not a capture
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(PREFIX.size)
+        if len(prefix) < PREFIX.size:
+            raise ValueError(f"{path}: truncated capture")
+        magic, version, arrival_ms = PREFIX.unpack(prefix)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a DF555 capture (version {VERSION})")
+        while True:
+            record = f.read(RECORD.size)
+            if len(record) < RECORD.size:
+                return
+            gap, length = RECORD.unpack(record)
+            frame = f.read(length)
+            if len(frame) < length:
+                return
+            arrival_ms += gap
+            yield arrival_ms / 1000, frame
+
+
+def extract(path, logs):
+    """
+    Extract logged frames from several logs into one capture
+
+    Each log is read in order and the logs are merged by arrival time, so
+    daily log files may be given in any order.
+
+    Returns:
+        Number of frames extracted
+    """
+    files = [open(log, errors='replace') for log in logs]
+    try:
+        return write_capture(path, heapq.merge(*(iter_log_frames(f) for f in files), key=lambda r: r[0]))
+    finally:
+        for f in files:
+            f.close()
+
+
+def capture_info(path):
+    """Frames, devices, time span and the busiest second of a capture"""
+    frames = 0
+    size = 0
+    devices = set()
+    first = last = None
+    window = deque()
+    peak = 0
+    for arrival, frame in read_capture(path):
+        frames += 1
+        size += len(frame)
+        devices.add(device_key(frame))
+        first = arrival if first is None else first
+        last = arrival
+        window.append(arrival)
+        while window[0] <= arrival - 1:
+            window.popleft()
+        peak = max(peak, len(window))
+    return {
+        'frames': frames,
+        'devices': len(devices - {None}),
+        'undecodable_devices': None in devices,
+        'bytes': size,
+        'start': first,
+        'end': last,
+        'span': round(last - first, 3) if frames else 0.0,
+        'peak_rate': peak,
+    }
+
+
+class TcpTarget:
+    """A gateway speaking the sensor protocol: one connection per report"""
+
+    def __init__(self, host, port, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def __str__(self):
+        return f"tcp://{self.host}:{self.port}"
+
+    async def send(self, frame):
+        """
+        Deliver one report
+
+        Returns:
+            None on success, else a failure reason
+        """
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            writer.write(frame)
+            await writer.drain()
+            ack = await asyncio.wait_for(reader.readuntil(b'\n'), self.timeout)
+            return None if ack.startswith(b'OK') else 'bad_ack'
+        except asyncio.TimeoutError:
+            return 'timeout'
+        except asyncio.IncompleteReadError:
+            return 'closed'
+        except OSError:
+            return 'connect'
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def close(self):
+        pass
+
+
+class HttpTarget:
+    """
+    The Laravel bulk endpoint, decoded reports POSTed over keep-alive connections
+
+    The app cannot store raw frames (receiveDingtekData does not decode
+    binary reports), so each frame is decoded and sent as the gateway would
+    forward it.
+    """
+
+    def __init__(self, base_url, concurrency, path=BULK_PATH, timeout=10.0, api_key=None):
+        self.base_url = base_url
+        self.path = path
+        self.pool = HttpPool(base_url, size=concurrency, timeout=timeout, api_key=api_key)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='replay')
+
+    def __str__(self):
+        return self.base_url.rstrip('/') + self.path
+
+    async def send(self, frame):
+        try:
+            payload = to_ingest_payload(protocol.decode_report(frame))
+        except protocol.FrameError:
+            return 'undecodable'
+        loop = asyncio.get_running_loop()
+        try:
+            status, body = await loop.run_in_executor(
+                self.executor, self.pool.post_json, self.path, {'readings': [payload]}
+            )
+        except OSError:
+            return 'connect'
+        except http.client.HTTPException:
+            return 'http_error'
+        if status >= 300:
+            return f'http_{status}'
+        try:
+            rejected = json.loads(body or b'{}').get('rejected')
+        except (ValueError, AttributeError):
+            rejected = None
+        return 'rejected' if rejected else None
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.pool.close()
+
+
+class Replayer:
+    """Send a capture to a target on its original (scaled) schedule"""
+
+    def __init__(self, target, speed=1.0, concurrency=200):
+        """
+        Initialize replayer
+
+        Args:
+            target: TcpTarget or HttpTarget
+            speed: Time scale (10 = ten times faster); 0 sends as fast as
+                   the target acknowledges, still in per-device order
+            concurrency: Maximum reports in flight
+        """
+        self.target = target
+        self.speed = speed
+        self.concurrency = concurrency
+        self.latencies = []
+        self.lags = []
+        self.failures = {}
+        self.sent = 0
+        self.devices = set()
+
+    async def _deliver(self, frame, due, previous, slots):
+        # A sensor sends its next report only after the previous one was acked
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with slots:
+            start = time.perf_counter()
+            if due is not None:
+                self.lags.append(max(0.0, start - due))
+            reason = await self.target.send(frame)
+            if reason is None:
+                self.latencies.append(time.perf_counter() - start)
+            else:
+                self.failures[reason] = self.failures.get(reason, 0) + 1
+
+    async def run(self, records, limit=None):
+        """
+        Replay (arrival, frame) records
+
+        Returns:
+            Summary dict (see summary())
+        """
+        slots = asyncio.Semaphore(self.concurrency)
+        backlog = asyncio.Semaphore(self.concurrency * BACKLOG_FACTOR)
+        last = {}
+        tasks = set()
+        origin = None
+        start = time.perf_counter()
+
+        def finished(task, device):
+            tasks.discard(task)
+            backlog.release()
+            if last.get(device) is task:
+                del last[device]
+
+        for arrival, frame in records:
+            if limit is not None and self.sent >= limit:
+                break
+            due = None
+            if self.speed:
+                origin = arrival if origin is None else origin
+                due = start + (arrival - origin) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            await backlog.acquire()
+            device = device_key(frame)
+            previous = last.get(device) if device is not None else None
+            task = asyncio.create_task(self._deliver(frame, due, previous, slots))
+            tasks.add(task)
+            if device is not None:
+                last[device] = task
+                self.devices.add(device)
+            task.add_done_callback(lambda task, device=device: finished(task, device))
+            self.sent += 1
+
+        if tasks:
+            await asyncio.wait(tasks)
+        return self.summary(time.perf_counter() - start)
+
+    def summary(self, elapsed):
+        """Throughput, ack latency and schedule lag percentiles (ms), failure counts"""
+        latencies = sorted(self.latencies)
+        lags = sorted(self.lags)
+
+        def ms(value):
+            return round(value * 1000, 3) if value is not None else None
+
+        return {
+            'target': str(self.target),
+            'speed': self.speed,
+            'sent': self.sent,
+            'acked': len(latencies),
+            'failed': sum(self.failures.values()),
+            'failures': dict(self.failures),
+            'devices': len(self.devices),
+            'elapsed': round(elapsed, 3),
+            'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': ms(percentile(latencies, 50)),
+                'p90': ms(percentile(latencies, 90)),
+                'p99': ms(percentile(latencies, 99)),
+                'max': ms(latencies[-1] if latencies else None),
+            },
+            # How late reports left compared to the scaled capture schedule
+            'lag_ms': {
+                'p50': ms(percentile(lags, 50)),
+                'p99': ms(percentile(lags, 99)),
+                'max': ms(lags[-1] if lags else None),
+            },
+        }
+
+
+def _when(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp)) if timestamp is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract and replay captured DF555 traffic')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    extract_parser = commands.add_parser('extract', help='Build a capture from Laravel logs or hex dumps')
+    extract_parser.add_argument('capture', help=f'Capture file to write ({SUFFIX})')
+    extract_parser.add_argument('logs', nargs='+', help='Log files with hex_data lines')
+
+    info_parser = commands.add_parser('info', help='Summarize a capture')
+    info_parser.add_argument('capture')
+
+    run_parser = commands.add_parser('run', help='Replay a capture against a gateway or the ingest API')
+    run_parser.add_argument('capture')
+    target = run_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--tcp', metavar='HOST:PORT', help='TCP gateway (df555.gateway or SensorTcpServer)')
+    target.add_argument('--http', metavar='URL',
+                        help=f'Laravel base URL, decoded reports are POSTed to {BULK_PATH} '
+                             '(X-API-Key from $SENSOR_API_KEY)')
+    run_parser.add_argument('--speed', type=float, default=1.0,
+                            help='Time scale, e.g. 1, 10 or 1000 (0 = as fast as acknowledged)')
+    run_parser.add_argument('--concurrency', type=int, default=200, help='Maximum reports in flight')
+    run_parser.add_argument('--limit', type=int, help='Stop after this many reports')
+    run_parser.add_argument('--timeout', type=float, default=10.0, help='Seconds to wait for each ack')
+    run_parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    args = parser.parse_args()
+
+    if args.command == 'extract':
+        started = time.perf_counter()
+        count = extract(args.capture, args.logs)
+        if not count:
+            print("✗ No frames found")
+            return 1
+        print(f"✓ Extracted {count} frames to {args.capture} in {time.perf_counter() - started:.1f}s")
+        return 0
+
+    try:
+        if args.command == 'info':
+            info = capture_info(args.capture)
+        else:
+            records = read_capture(args.capture)
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}")
+        return 1
+
+    if args.command == 'info':
+        print("=" * 60)
+        print("DF555 CAPTURE")
+        print("=" * 60)
+        print(f"Frames:      {info['frames']} ({info['bytes']} bytes)")
+        print(f"Devices:     {info['devices']}{' (+ undecodable frames)' if info['undecodable_devices'] else ''}")
+        print(f"From:        {_when(info['start'])} UTC")
+        print(f"To:          {_when(info['end'])} UTC")
+        print(f"Span:        {info['span']}s")
+        print(f"Peak rate:   {info['peak_rate']} reports in one second")
+        print("=" * 60)
+        return 0
+
+    if args.tcp:
+        host, _, port = args.tcp.rpartition(':')
+        target = TcpTarget(host or '127.0.0.1', int(port), timeout=args.timeout)
+    else:
+        target = HttpTarget(args.http, args.concurrency, timeout=args.timeout,
+                            api_key=os.environ.get('SENSOR_API_KEY'))
+
+    replayer = Replayer(target, speed=args.speed, concurrency=args.concurrency)
+    try:
+        summary = asyncio.run(replayer.run(records, limit=args.limit))
+    finally:
+        target.close()
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        latency = summary['latency_ms']
+        lag = summary['lag_ms']
+        print("=" * 60)
+        print("DF555 REPLAY SUMMARY")
+        print("=" * 60)
+        print(f"Target:      {summary['target']}")
+        print(f"Speed:       {f'{args.speed:g}x' if args.speed else 'unpaced'}")
+        print(f"Devices:     {summary['devices']}")
+        print(f"Sent:        {summary['sent']} in {summary['elapsed']}s")
+        print(f"Acked:       {summary['acked']} ({summary['throughput']}/s)")
+        print(f"Failed:      {summary['failed']} {summary['failures'] or ''}")
+        print(f"Latency ms:  p50={latency['p50']} p90={latency['p90']} p99={latency['p99']} max={latency['max']}")
+        if args.speed:
+            print(f"Lag ms:      p50={lag['p50']} p99={lag['p99']} max={lag['max']}")
+        print("=" * 60)
+
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,415 @@
+"""
+Alert rule evaluation in the ingestion stream
+
+Active AlertRule rows are compiled once into small check functions and
+indexed by sensor IMEI: a rule with a tank_id applies to that tank's
+sensor, a rule without one to every sensor of its organization. Each
+decoded report is checked against its own device's rules only, and every
+(rule, device) pair keeps a little hysteresis state, so an alert is
+raised once when its condition holds and resolved once when it clears.
+
+Rule types and their condition keys (AlertRule.condition):
+
+    low_level       below_percent (tank low_level_threshold), clear_percent
+    critical_level  below_percent (tank critical_level_threshold), clear_percent
+    rapid_drop      drop_mm (200), within_minutes (60)
+    battery_low     below_volts (3.3), clear_volts
+    signal_weak     below_dbm (-110), clear_dbm
+    status_full     status bit set (full alarm)
+    status_power    status bit set (power alarm)
+    threshold       field, operator (<, <=, >, >=, ==, !=), value, clear
+
+Any condition may also set for_readings (consecutive breaching reports
+before the alert is raised, default 1) and severity.
+
+Usage:
+    python3 -m df555.rules rules.json tanks.json --archive /data/archive --start 2025-03-01
+    python3 -m df555.gateway --rules=rules.json --tanks=tanks.json --alert-log=/var/log/df555/alerts.jsonl
+"""
+
+import argparse
+import json
+import logging
+import operator
+import sys
+import time
+
+from df555.protocol import STATUS_FULL, STATUS_POWER
+
+logger = logging.getLogger('df555.rules')
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# Opposite operator, used for the default clear condition of 'threshold'
+INVERSE = {'<': '>=', '<=': '>', '>': '<=', '>=': '<', '==': '!=', '!=': '=='}
+
+# Alert.type and severity recorded for each rule type
+ALERT_TYPES = {
+    'low_level': ('low_water', 'warning'),
+    'critical_level': ('critical_water', 'critical'),
+    'rapid_drop': ('maintenance', 'warning'),
+    'battery_low': ('maintenance', 'warning'),
+    'signal_weak': ('maintenance', 'info'),
+    'status_full': ('maintenance', 'info'),
+    'status_power': ('maintenance', 'critical'),
+    'threshold': ('maintenance', 'info'),
+}
+
+# Percentage points / volts / dB between raising and clearing an alert
+LEVEL_HYSTERESIS = 5
+BATTERY_HYSTERESIS = 0.1
+SIGNAL_HYSTERESIS = 5
+
+
+class RuleError(ValueError):
+    """An alert rule that cannot be compiled"""
+
+
+def water_level_percentage(parsed, tank):
+    """Level percentage of a report, as SensorController computes it"""
+    height_mm = int(tank.get('height_mm') or 0)
+    distance = parsed.get('distance')
+    if height_mm <= 0 or distance is None:
+        return None
+    level_mm = max(0, height_mm - int(distance * 1000))
+    return round(level_mm / height_mm * 100, 2)
+
+
+def _below(value_of, below, clear):
+    """Tri-state check: True below 'below', False at or above 'clear', None between"""
+    def check(parsed, state):
+        value = value_of(parsed)
+        if value is None:
+            return None, None
+        if value < below:
+            return True, value
+        return (False if value >= clear else None), value
+    return check
+
+
+def _level(condition, tank, default_key, default):
+    below = float(condition.get('below_percent', tank.get(default_key) or default))
+    clear = float(condition.get('clear_percent', below + LEVEL_HYSTERESIS))
+    return _below(lambda parsed: water_level_percentage(parsed, tank), below, clear)
+
+
+def _rapid_drop(condition, tank):
+    drop_mm = float(condition.get('drop_mm', 200))
+    window = float(condition.get('within_minutes', 60)) * 60
+
+    def check(parsed, state):
+        distance = parsed.get('distance')
+        timestamp = parsed.get('timestamp') or time.time()
+        if distance is None:
+            return None, None
+        level = -distance * 1000
+        # Highest level seen within the window (a rise or a stale peak restarts it)
+        peak = state.get('peak')
+        if peak is None or level >= peak[1] or timestamp - peak[0] > window:
+            state['peak'] = peak = (timestamp, level)
+        drop = peak[1] - level
+        return drop >= drop_mm, round(drop, 1)
+    return check
+
+
+def _battery(condition, tank):
+    below = float(condition.get('below_volts', 3.3))
+    clear = float(condition.get('clear_volts', below + BATTERY_HYSTERESIS))
+    return _below(lambda parsed: parsed.get('battery_level'), below, clear)
+
+
+def _signal(condition, tank):
+    below = float(condition.get('below_dbm', -110))
+    clear = float(condition.get('clear_dbm', below + SIGNAL_HYSTERESIS))
+    return _below(lambda parsed: parsed.get('rsrp'), below, clear)
+
+
+def _status(field):
+    def compile_status(condition, tank):
+        def check(parsed, state):
+            value = parsed.get(field)
+            if value is None:
+                return None, None
+            return bool(value), value
+        return check
+    return compile_status
+
+
+def _threshold(condition, tank):
+    field = condition.get('field')
+    op = condition.get('operator', '<')
+    if not field or op not in OPERATORS or 'value' not in condition:
+        raise RuleError("threshold rules need field, a known operator and value")
+    breach = OPERATORS[op]
+    value = condition['value']
+    clear = condition.get('clear', value)
+    cleared = OPERATORS[INVERSE[op]]
+
+    def check(parsed, state):
+        current = parsed.get(field)
+        if current is None:
+            return None, None
+        if breach(current, value):
+            return True, current
+        return (False if cleared(current, clear) else None), current
+    return check
+
+
+COMPILERS = {
+    'low_level': lambda condition, tank: _level(condition, tank, 'low_level_threshold', 20),
+    'critical_level': lambda condition, tank: _level(condition, tank, 'critical_level_threshold', 10),
+    'rapid_drop': _rapid_drop,
+    'battery_low': _battery,
+    'signal_weak': _signal,
+    'status_full': _status('status_full'),
+    'status_power': _status('status_power'),
+    'threshold': _threshold,
+}
+
+
+class CompiledRule:
+    """An AlertRule bound to one tank, with its check function"""
+
+    __slots__ = ('id', 'name', 'type', 'organization_id', 'tank_id', 'alert_type',
+                 'severity', 'for_readings', 'action', 'check')
+
+    def __init__(self, rule, tank):
+        """
+        Compile rule for tank
+
+        Raises:
+            RuleError: for an unknown type or an invalid condition
+        """
+        rule_type = rule.get('type')
+        compiler = COMPILERS.get(rule_type)
+        if compiler is None:
+            raise RuleError(f"Unknown rule type: {rule_type}")
+
+        self.id = rule.get('id')
+        self.name = rule.get('name') or rule_type
+        self.type = rule_type
+        self.organization_id = rule.get('organization_id')
+        self.tank_id = tank.get('id')
+        self.alert_type, severity = ALERT_TYPES[rule_type]
+        self.action = rule.get('action')
+        try:
+            condition = rule.get('condition') or {}
+            if isinstance(condition, str):
+                condition = json.loads(condition)
+            self.severity = condition.get('severity', severity)
+            self.for_readings = max(1, int(condition.get('for_readings', 1)))
+            self.check = compiler(condition, tank)
+        except (AttributeError, TypeError, ValueError) as e:
+            raise RuleError(f"Invalid condition for rule {self.id}: {e}") from e
+
+
+class RuleEngine:
+    """Device-indexed compiled rules with per-rule hysteresis state"""
+
+    def __init__(self, rules=(), tanks=()):
+        """
+        Initialize engine
+
+        Args:
+            rules: AlertRule rows (dicts)
+            tanks: Tank rows (dicts) with the sensor 'imei' (or 'device_id')
+        """
+        self.index = {}
+        self.state = {}
+        self.stats = {
+            'evaluated': 0,
+            'checks': 0,
+            'triggered': 0,
+            'resolved': 0,
+            'invalid_rules': 0,
+            # Raised alerts; kept up to date so other threads (the metrics
+            # server) can read it without walking self.state
+            'active': 0,
+        }
+        self.load(rules, tanks)
+
+    def load(self, rules, tanks):
+        """
+        Compile rules and rebuild the device index
+
+        Hysteresis state is kept for rules that still apply, so reloading
+        does not raise alerts that are already active again.
+
+        Returns:
+            Number of compiled (rule, device) pairs
+        """
+        by_org = {}
+        by_tank = {}
+        for tank in tanks:
+            device = str(tank.get('imei') or tank.get('device_id') or '')
+            if not device:
+                continue
+            by_org.setdefault(tank.get('organization_id'), []).append((device, tank))
+            by_tank[tank.get('id')] = (device, tank)
+
+        index = {}
+        invalid = 0
+        for rule in rules:
+            if not rule.get('is_active', True):
+                continue
+            if rule.get('tank_id'):
+                targets = [by_tank[rule['tank_id']]] if rule['tank_id'] in by_tank else []
+            else:
+                targets = by_org.get(rule.get('organization_id'), [])
+            failed = False
+            for device, tank in targets:
+                try:
+                    compiled = CompiledRule(rule, tank)
+                except RuleError as e:
+                    # Only this tank goes without the rule
+                    failed = True
+                    logger.warning("Skipping alert rule id=%s for tank id=%s: %s", rule.get('id'), tank.get('id'), e)
+                    continue
+                index.setdefault(device, []).append(compiled)
+            invalid += failed
+
+        self.index = index
+        keep = {(rule.id, device) for device, rules in index.items() for rule in rules}
+        self.state = {key: value for key, value in self.state.items() if key in keep}
+        self.stats['invalid_rules'] = invalid
+        self.stats['active'] = sum(1 for state in self.state.values() if state['active'])
+        return len(keep)
+
+    def evaluate(self, parsed):
+        """
+        Check a decoded report against its device's rules
+
+        Returns:
+            List of alert events ('triggered' or 'resolved')
+        """
+        device = parsed.get('imei') or parsed.get('device_id')
+        rules = self.index.get(device)
+        if not rules:
+            return []
+
+        self.stats['evaluated'] += 1
+        events = []
+        for rule in rules:
+            key = (rule.id, device)
+            state = self.state.get(key)
+            if state is None:
+                state = self.state[key] = {'active': False, 'count': 0}
+            self.stats['checks'] += 1
+            breached, value = rule.check(parsed, state)
+            if breached is None:
+                continue
+            if breached:
+                state['count'] += 1
+                if not state['active'] and state['count'] >= rule.for_readings:
+                    state['active'] = True
+                    events.append(self._event('triggered', rule, device, parsed, value))
+            else:
+                state['count'] = 0
+                if state['active']:
+                    state['active'] = False
+                    events.append(self._event('resolved', rule, device, parsed, value))
+        return events
+
+    def active(self):
+        """
+        (rule_id, device) pairs with a raised alert
+
+        Walks the hysteresis state, so only call it from the thread that
+        evaluates reports; stats['active'] is the count for other threads.
+        """
+        return [key for key, state in self.state.items() if state['active']]
+
+    def _event(self, kind, rule, device, parsed, value):
+        self.stats[kind] += 1
+        self.stats['active'] += 1 if kind == 'triggered' else -1
+        event = {
+            'state': kind,
+            'rule_id': rule.id,
+            'rule': rule.name,
+            'rule_type': rule.type,
+            'type': rule.alert_type,
+            'severity': rule.severity,
+            'organization_id': rule.organization_id,
+            'tank_id': rule.tank_id,
+            'imei': device,
+            'value': value,
+            'timestamp': parsed.get('timestamp') or int(time.time()),
+            'action': rule.action,
+        }
+        log = logger.warning if kind == 'triggered' else logger.info
+        log("Alert %s rule=%s type=%s imei=%s value=%s", kind, rule.name, rule.type, device, value)
+        return event
+
+
+def load_json(path):
+    """Rows from a JSON export (a list, or {'data': [...]})"""
+    with open(path) as f:
+        data = json.load(f)
+    return data.get('data', []) if isinstance(data, dict) else data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate alert rules against archived readings')
+    parser.add_argument('rules', help='JSON export of alert_rules rows')
+    parser.add_argument('tanks', help='JSON export of tank rows with the sensor imei')
+    parser.add_argument('--archive', required=True, help='Archive directory (df555.archive)')
+    parser.add_argument('--start', help="First day ('YYYY-MM-DD') or unix time")
+    parser.add_argument('--end', help='Last day or unix time')
+    parser.add_argument('--events', action='store_true', help='Print every alert event')
+    args = parser.parse_args()
+
+    from df555.archive import Archive, _parse_time
+
+    # Alerts are printed with --events; the summary counts invalid rules
+    logging.basicConfig(level=logging.ERROR)
+    engine = RuleEngine(load_json(args.rules), load_json(args.tanks))
+    end = _parse_time(args.end)
+    if args.end and not args.end.isdigit():
+        end += 86399
+    data = Archive(args.archive).load(start=_parse_time(args.start), end=end)
+    order = data['timestamp'].argsort(kind='stable')
+
+    began = time.perf_counter()
+    for i in order:
+        distance = float(data['height_mm'][i])
+        parsed = {
+            'imei': str(data['device'][i]),
+            'timestamp': int(data['timestamp'][i]),
+            'distance': distance / 1000 if distance == distance else None,
+            'battery_level': float(data['battery_mv'][i]) / 1000,
+            'rsrp': float(data['rsrp'][i]),
+            'temperature': float(data['temperature'][i]),
+        }
+        if data['status'][i] >= 0:
+            parsed['status_full'] = 1 if data['status'][i] & STATUS_FULL else 0
+            parsed['status_power'] = 1 if data['status'][i] & STATUS_POWER else 0
+        for event in engine.evaluate(parsed):
+            if args.events:
+                when = time.strftime('%Y-%m-%d %H:%M', time.gmtime(event['timestamp']))
+                print(f"{when}  {event['imei']}  {event['state']:9} {event['rule']} ({event['value']})")
+    elapsed = time.perf_counter() - began
+
+    print("=" * 60)
+    print("DF555 ALERT RULES")
+    print("=" * 60)
+    print(f"Devices with rules: {len(engine.index)}")
+    print(f"Reports evaluated:  {engine.stats['evaluated']} ({engine.stats['evaluated'] / max(elapsed, 1e-9):,.0f}/s)")
+    print(f"Rule checks:        {engine.stats['checks']}")
+    print(f"Triggered:          {engine.stats['triggered']}")
+    print(f"Resolved:           {engine.stats['resolved']}")
+    print(f"Still active:       {engine.stats['active']}")
+    if engine.stats['invalid_rules']:
+        print(f"✗ Invalid rules:    {engine.stats['invalid_rules']}")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Serial I/O helpers for the DF555 TTL debug interface
+
+The sensor only accepts commands for 2-3 seconds after a magnet reset, so
+replies are read as the bytes arrive instead of after a fixed sleep.
+"""
+
+import re
+import time
+
+# Serial port settings as per DF555 documentation (115200 8N1)
+BAUDRATE = 115200
+
+# A reply is complete once the buffer ends with one of these; a bare "OK"
+# is read through its line end (or ends when the line goes quiet) so the
+# "\r\n" is not left behind for the next read
+TERMINATORS = (b'\x81', b'\r\n')
+
+# Splits a buffer holding several replies; "OK\r\n" counts as one terminator
+_REPLY_END = re.compile(rb'(?:OK)?\r\n|OK|\x81')
+
+# Default reply deadline and maximum silence between two bytes (seconds)
+RESPONSE_DEADLINE = 2.0
+INTER_BYTE_TIMEOUT = 0.05
+
+
+def read_response(ser, deadline=RESPONSE_DEADLINE, inter_byte_timeout=INTER_BYTE_TIMEOUT,
+                  terminators=TERMINATORS):
+    """
+    Read a sensor reply as bytes arrive
+
+    Stops as soon as the data ends with a protocol terminator, when the line
+    goes quiet for inter_byte_timeout after the first byte, or when the
+    overall deadline expires.
+
+    Args:
+        ser: Open serial.Serial instance
+        deadline: Maximum seconds to wait for the whole reply
+        inter_byte_timeout: Maximum seconds of silence once data has started
+        terminators: Byte strings that mark the end of a reply
+
+    Returns:
+        Received bytes (empty if nothing arrived before the deadline)
+    """
+    response = bytearray()
+
+    def feed(chunk):
+        response.extend(chunk)
+        return response.endswith(terminators)
+
+    return read_stream(ser, feed, deadline, inter_byte_timeout)
+
+
+def read_stream(ser, feed, deadline=RESPONSE_DEADLINE, inter_byte_timeout=INTER_BYTE_TIMEOUT):
+    """
+    Feed a reply to an incremental parser as bytes arrive
+
+    For replies spanning several lines (the query dump), where a terminator
+    does not mark the end; the parser decides when the reply is complete.
+
+    Args:
+        ser: Open serial.Serial instance
+        feed: Callable taking each chunk and returning True when complete
+        deadline: Maximum seconds to wait for the whole reply
+        inter_byte_timeout: Maximum seconds of silence once data has started
+
+    Returns:
+        Received bytes
+    """
+    original_timeout = ser.timeout
+    response = bytearray()
+    end = time.monotonic() + deadline
+
+    try:
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+
+            # Block for the first byte, then only for the inter-byte gap
+            ser.timeout = min(remaining, inter_byte_timeout) if response else remaining
+            chunk = ser.read(max(1, ser.in_waiting))
+            if not chunk:
+                break
+
+            response += chunk
+            if feed(chunk):
+                break
+    finally:
+        ser.timeout = original_timeout
+
+    return bytes(response)
+
+
+def split_replies(data):
+    """
+    Split a buffer into terminated replies
+
+    Args:
+        data: Bytes received from the sensor
+
+    Returns:
+        (replies, rest) where replies is a list of complete replies (each
+        including its terminator) and rest is any unterminated tail
+    """
+    replies = []
+    start = 0
+    for match in _REPLY_END.finditer(data):
+        replies.append(bytes(data[start:match.end()]))
+        start = match.end()
+    return replies, bytes(data[start:])
+
+
+def read_responses(ser, count, deadline=RESPONSE_DEADLINE, inter_byte_timeout=INTER_BYTE_TIMEOUT):
+    """
+    Read the replies to several pipelined commands
+
+    Replies may arrive back-to-back in a single read, so the buffer is split
+    on terminators rather than relying on one read per reply.
+
+    Args:
+        ser: Open serial.Serial instance
+        count: Number of replies expected
+        deadline: Maximum seconds to wait for all replies
+        inter_byte_timeout: Maximum seconds of silence once data has started
+
+    Returns:
+        List of replies in arrival order; may be shorter than count, and an
+        unterminated tail is returned as a final partial reply
+    """
+    original_timeout = ser.timeout
+    buffer = bytearray()
+    end = time.monotonic() + deadline
+
+    try:
+        while True:
+            replies, rest = split_replies(buffer)
+            if len(replies) >= count:
+                break
+
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+
+            # Keep waiting for the next reply until the deadline while the
+            # tail is terminated, only the inter-byte gap mid-reply
+            ser.timeout = min(remaining, inter_byte_timeout) if rest else remaining
+            chunk = ser.read(max(1, ser.in_waiting))
+            if not chunk:
+                if rest:
+                    break
+                continue
+
+            buffer += chunk
+    finally:
+        ser.timeout = original_timeout
+
+    replies, rest = split_replies(buffer)
+    if rest:
+        replies.append(rest)
+    return replies
@@ -0,0 +1,264 @@
+"""
+DF555 device simulator and TCP load generator
+
+Emulates a fleet of virtual sensors producing realistic trigger/heartbeat
+reports (see df555.protocol) and plays them against a TCP gateway at a
+configurable rate and concurrency, recording ack latency and failures.
+
+Usage:
+    python3 -m df555.simulator --port 8888 --sensors 1000 --rate 200 --duration 60
+    python3 -m df555.simulator --host chenesa-shy-grass-3201.fly.dev --rate 50 --json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+
+from df555 import protocol
+
+# Bounds for a virtual tank's fill fraction
+REFILL_BELOW = 0.2
+REFILL_TO = 0.95
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list (p in 0-100)"""
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+class VirtualSensor:
+    """A DF555 mounted on a tank that drains during the day and gets refilled"""
+
+    def __init__(self, index, rng=None, start_time=None):
+        """
+        Initialize sensor
+
+        Args:
+            index: Fleet index, used to derive a stable device id
+            rng: random.Random instance (seeded for reproducible runs)
+            start_time: Unix time of the first report, defaults to now
+        """
+        self.rng = rng or random.Random(index)
+        # 1 + 15-digit IMEI, as 16 hex digits
+        self.device_id = f"1{860000000000000 + index:015d}"
+        self.tank_height_mm = self.rng.choice((1500, 2000, 2500, 3000))
+        self.level = self.rng.uniform(0.3, 0.95)
+        self.drain_per_hour = self.rng.uniform(0.01, 0.04)
+        self.refill_per_hour = self.rng.uniform(0.3, 0.6)
+        self.refilling = False
+        self.gps = (
+            (self.rng.uniform(25.2, 33.0), self.rng.uniform(-22.4, -15.6))
+            if self.rng.random() < 0.3 else None
+        )
+        self.battery_mv = self.rng.randint(3400, 3650)
+        self.rsrp = self.rng.uniform(-110.0, -80.0)
+        self.frame_count = self.rng.randint(0, 0xFFFF)
+        self.timestamp = int(start_time or time.time())
+
+    def advance(self, seconds):
+        """Move the simulated tank forward in time"""
+        hours = seconds / 3600
+        hour_of_day = (self.timestamp % 86400) / 3600
+        # Most consumption happens during the day
+        demand = 0.3 + max(0.0, math.sin((hour_of_day - 6) / 12 * math.pi))
+
+        if self.refilling:
+            self.level = min(REFILL_TO, self.level + self.refill_per_hour * hours)
+            self.refilling = self.level < REFILL_TO
+        else:
+            self.level = max(0.0, self.level - self.drain_per_hour * demand * hours)
+            self.refilling = self.level < REFILL_BELOW
+
+        self.battery_mv = max(3000, self.battery_mv - seconds * 0.0002)
+        self.timestamp += int(seconds)
+
+    def next_frame(self, interval=3600):
+        """
+        Advance by interval seconds and return the next report frame
+
+        Heartbeats are sent on schedule; a trigger report is sent instead
+        when the tank is nearly full or a refill has just started.
+        """
+        was_refilling = self.refilling
+        self.advance(interval)
+        self.frame_count = (self.frame_count + 1) & 0xFFFF
+
+        full = self.level >= 0.9
+        report_type = (
+            protocol.REPORT_TRIGGER if full or (self.refilling and not was_refilling)
+            else protocol.REPORT_HEARTBEAT
+        )
+        distance = self.tank_height_mm * (1 - self.level) + self.rng.gauss(0, 3)
+
+        return protocol.build_report(
+            height_mm=max(0, min(0xFFFF, int(distance))),
+            device_id=self.device_id,
+            report_type=report_type,
+            gps=self.gps,
+            temperature=int(22 + 6 * math.sin(self.timestamp / 86400 * 2 * math.pi)),
+            status=protocol.STATUS_FULL if full else 0,
+            battery_mv=int(self.battery_mv),
+            rsrp=self.rsrp + self.rng.gauss(0, 2),
+            frame_count=self.frame_count,
+            timestamp=self.timestamp,
+        )
+
+
+class LoadGenerator:
+    """Open one TCP connection per report, like a DF555 does"""
+
+    def __init__(self, host, port, sensors, rate, concurrency, timeout=10.0, seed=0):
+        """
+        Initialize load generator
+
+        Args:
+            host: Gateway host
+            port: Gateway port
+            sensors: Number of virtual sensors
+            rate: Connections per second across the fleet
+            concurrency: Maximum simultaneous connections
+            timeout: Seconds to wait for the ack
+            seed: Seed for reproducible fleets
+        """
+        self.host = host
+        self.port = port
+        rng = random.Random(seed)
+        self.fleet = [VirtualSensor(i, random.Random(rng.random())) for i in range(sensors)]
+        self.rate = rate
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.latencies = []
+        self.failures = {}
+
+    async def send_one(self, frame):
+        """Send one report and wait for 'OK', recording latency or failure"""
+        start = time.perf_counter()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            writer.write(frame)
+            await writer.drain()
+            ack = await asyncio.wait_for(reader.readuntil(b'\n'), self.timeout)
+            if not ack.startswith(b'OK'):
+                self._fail('bad_ack')
+                return
+            self.latencies.append(time.perf_counter() - start)
+        except asyncio.TimeoutError:
+            self._fail('timeout')
+        except asyncio.IncompleteReadError:
+            self._fail('closed')
+        except OSError:
+            self._fail('connect')
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def _fail(self, reason):
+        self.failures[reason] = self.failures.get(reason, 0) + 1
+
+    async def run(self, duration=None, count=None, interval=3600):
+        """
+        Generate load for duration seconds or count connections
+
+        Returns:
+            Summary dict (see summary())
+        """
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        sent = 0
+        start = time.perf_counter()
+
+        async def guarded(frame):
+            try:
+                await self.send_one(frame)
+            finally:
+                slots.release()
+
+        while True:
+            elapsed = time.perf_counter() - start
+            if (duration is not None and elapsed >= duration) or (count is not None and sent >= count):
+                break
+
+            # Pace connections to the target rate
+            delay = sent / self.rate - elapsed
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            await slots.acquire()
+            frame = self.fleet[sent % len(self.fleet)].next_frame(interval)
+            task = asyncio.create_task(guarded(frame))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            sent += 1
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return self.summary(sent, time.perf_counter() - start)
+
+    def summary(self, sent, elapsed):
+        """Latency percentiles (ms), throughput and failure counts"""
+        latencies = sorted(self.latencies)
+
+        def ms(value):
+            return round(value * 1000, 3) if value is not None else None
+
+        return {
+            'sent': sent,
+            'acked': len(latencies),
+            'failed': sum(self.failures.values()),
+            'failures': dict(self.failures),
+            'elapsed': round(elapsed, 3),
+            'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': ms(percentile(latencies, 50)),
+                'p90': ms(percentile(latencies, 90)),
+                'p99': ms(percentile(latencies, 99)),
+                'max': ms(latencies[-1] if latencies else None),
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate DF555 sensors against a TCP gateway')
+    parser.add_argument('--host', default='127.0.0.1', help='Gateway host')
+    parser.add_argument('--port', type=int, default=8888, help='Gateway port')
+    parser.add_argument('--sensors', type=int, default=100, help='Number of virtual sensors')
+    parser.add_argument('--rate', type=float, default=50, help='Connections per second')
+    parser.add_argument('--concurrency', type=int, default=200, help='Maximum simultaneous connections')
+    parser.add_argument('--duration', type=float, help='Seconds to run (default: 10 unless --count)')
+    parser.add_argument('--count', type=int, help='Total connections to make')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for a reproducible fleet')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    args = parser.parse_args()
+
+    duration = args.duration if args.duration is not None or args.count is not None else 10
+
+    generator = LoadGenerator(args.host, args.port, args.sensors, args.rate, args.concurrency, seed=args.seed)
+    summary = asyncio.run(generator.run(duration=duration, count=args.count))
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        latency = summary['latency_ms']
+        print("=" * 60)
+        print("DF555 LOAD TEST SUMMARY")
+        print("=" * 60)
+        print(f"Target:      {args.host}:{args.port}")
+        print(f"Sensors:     {args.sensors}")
+        print(f"Sent:        {summary['sent']} in {summary['elapsed']}s")
+        print(f"Acked:       {summary['acked']} ({summary['throughput']}/s)")
+        print(f"Failed:      {summary['failed']} {summary['failures'] or ''}")
+        print(f"Latency ms:  p50={latency['p50']} p90={latency['p90']} p99={latency['p99']} max={latency['max']}")
+        print("=" * 60)
+
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,401 @@
+"""
+Bulk SMS provisioning of DF555 sensors
+
+Sends configuration, query or reset commands to many sensors by SMS and
+matches each reply to its command. A sensor handles one command at a
+time, so commands to one phone are sent in order, each after the reply
+to the previous one; different phones are provisioned concurrently, with
+a global rate limit on outgoing messages.
+
+Gateways are adapters with send(to, text) and receive() methods:
+
+    stub    in-process simulated sensors (df555.emulator replies), with
+            configurable latency and message loss, for testing; nothing
+            is sent to real sensors
+    http    a JSON SMS API: POST /messages {"to", "message"} and
+            GET /messages/inbox?cursor=... → {"messages": [{"from", "text"}],
+            "cursor"}; set SMS_GATEWAY_URL and SMS_GATEWAY_KEY
+    module:Class  any other adapter class, constructed without arguments
+
+Usage:
+    python3 update_sensor_config.py --bulk sims.csv --gateway stub
+    python3 update_sensor_config.py --bulk sims.csv --action query --gateway http --rate 2
+"""
+
+import csv
+import importlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode
+
+from df555 import protocol
+from df555.emulator import DEFAULT_PARAMS, apply_command
+from df555.forwarder import HttpPool
+
+logger = logging.getLogger('df555.sms')
+
+ACTIONS = ('config', 'query', 'reset')
+
+# Seconds to wait for a reply, attempts per command, messages per second
+REPLY_TIMEOUT = 120.0
+MAX_ATTEMPTS = 3
+RATE = 1.0
+POLL_INTERVAL = 2.0
+
+
+class SmsError(Exception):
+    """The SMS gateway rejected or failed to send a message"""
+
+
+def normalize_phone(number):
+    """Phone number in a comparable form: digits only, without '+' or '00'"""
+    digits = re.sub(r'\D', '', str(number or ''))
+    return digits[2:] if digits.startswith('00') else digits
+
+
+def commands_for(action, server=None, port=None, server2=None, server_mode=None):
+    """
+    Downlink commands for an action, in the order they are sent
+
+    Args:
+        action: 'config', 'query' or 'reset'
+        server, port: Server 1 address (config)
+        server2: Optional (host, port) of Server 2 (config)
+        server_mode: Optional server mode, e.g. '02' for both servers (config)
+
+    Raises:
+        ValueError: for an unknown action or a config without a server
+    """
+    if action == 'query':
+        return [protocol.build_command(protocol.CMD_SET_SERVER1, command_type=protocol.COMMAND_TYPE_QUERY)]
+    if action == 'reset':
+        return [protocol.build_command(protocol.CMD_SET_SERVER1, command_type=protocol.COMMAND_TYPE_RESET)]
+    if action != 'config':
+        raise ValueError(f"Unknown action: {action}")
+    if not server or not port:
+        raise ValueError("config needs a server and port")
+
+    commands = [protocol.build_server_command(1, server, port)]
+    if server2:
+        commands.append(protocol.build_server_command(2, *server2))
+    if server_mode:
+        commands.append(protocol.build_command(protocol.CMD_SWITCH_FUNCTION, server_mode))
+    return commands
+
+
+def parse_address(value):
+    """
+    (host, port) from 'host:port'
+
+    Raises:
+        ValueError: if the port is missing
+    """
+    host, _, port = str(value).rpartition(':')
+    if not host or not port:
+        raise ValueError(f"Expected host:port, got {value!r}")
+    return host, port
+
+
+def load_inventory(path):
+    """
+    Sensors to provision from a CSV or JSON export
+
+    Rows need a phone_number column (as in the sim_cards table) and may
+    carry imei, action, server, port and server2 (host:port) overriding
+    the command line.
+
+    Returns:
+        List of row dicts
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.json'):
+            data = json.load(f)
+            rows = data.get('data', []) if isinstance(data, dict) else data
+        else:
+            rows = list(csv.DictReader(f))
+    return [row for row in rows if row.get('phone_number')]
+
+
+class RateLimiter:
+    """Token bucket shared by the sending threads"""
+
+    def __init__(self, rate, burst=1):
+        """
+        Initialize limiter
+
+        Args:
+            rate: Messages per second (0 for unlimited)
+            burst: Messages that may be sent back to back
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a message may be sent"""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class StubSmsGateway:
+    """Simulated sensors answering SMS commands like the firmware"""
+
+    def __init__(self, latency=(1.0, 5.0), loss=0.0, params=None, seed=None):
+        """
+        Initialize stub
+
+        Args:
+            latency: (min, max) seconds before a sensor replies
+            loss: Probability that a command or its reply is lost
+            params: Initial parameters of every sensor (DEFAULT_PARAMS)
+            seed: Random seed for latency and loss
+        """
+        self.latency = latency
+        self.loss = loss
+        self.initial = dict(params or DEFAULT_PARAMS)
+        self.rng = random.Random(seed)
+        self.devices = {}
+        self.sent = []
+        self._inbox = queue.Queue()
+        self._lock = threading.Lock()
+
+    def send(self, to, text):
+        with self._lock:
+            self.sent.append((to, text))
+            params = self.devices.setdefault(normalize_phone(to), dict(self.initial))
+            lost = self.rng.random() < self.loss
+            delay = self.rng.uniform(*self.latency)
+        if not lost:
+            timer = threading.Timer(delay, self._reply, (to, params, text))
+            timer.daemon = True
+            timer.start()
+        return f'stub-{len(self.sent)}'
+
+    def _reply(self, to, params, text):
+        with self._lock:
+            reply = apply_command(params, text).decode('ascii')
+        self._inbox.put({'from': to, 'text': reply})
+
+    def receive(self, timeout=POLL_INTERVAL):
+        """Replies received since the last call (waits up to timeout for one)"""
+        messages = []
+        try:
+            messages.append(self._inbox.get(timeout=timeout))
+            while True:
+                messages.append(self._inbox.get_nowait())
+        except queue.Empty:
+            pass
+        return messages
+
+    def close(self):
+        pass
+
+
+class HttpSmsGateway:
+    """SMS API speaking the JSON contract in the module docstring"""
+
+    def __init__(self, base_url=None, api_key=None, pool_size=4):
+        base_url = base_url or os.environ.get('SMS_GATEWAY_URL')
+        if not base_url:
+            raise SmsError("Set SMS_GATEWAY_URL for the http gateway")
+        self.pool = HttpPool(base_url, size=pool_size,
+                             api_key=api_key if api_key is not None else os.environ.get('SMS_GATEWAY_KEY'))
+        self.cursor = None
+
+    def send(self, to, text):
+        status, data = self.pool.post_json('/messages', {'to': to, 'message': text})
+        if status >= 300:
+            raise SmsError(f"HTTP {status} sending to {to}: {data[:200]!r}")
+        try:
+            return json.loads(data or b'{}').get('id')
+        except ValueError:
+            return None
+
+    def receive(self, timeout=POLL_INTERVAL):
+        time.sleep(timeout)
+        query = f'?{urlencode({"cursor": self.cursor})}' if self.cursor else ''
+        status, data = self.pool.request('GET', f'/messages/inbox{query}')
+        if status >= 300:
+            raise SmsError(f"HTTP {status} polling the inbox")
+        body = json.loads(data or b'{}')
+        self.cursor = body.get('cursor', self.cursor)
+        return body.get('messages', [])
+
+    def close(self):
+        self.pool.close()
+
+
+def make_gateway(name, **options):
+    """Gateway adapter by name ('stub', 'http' or 'module:Class')"""
+    if name == 'stub':
+        return StubSmsGateway(**options)
+    if name == 'http':
+        return HttpSmsGateway()
+    module, _, attribute = name.partition(':')
+    if not attribute:
+        raise ValueError(f"Unknown SMS gateway: {name}")
+    return getattr(importlib.import_module(module), attribute)()
+
+
+class Provisioner:
+    """Send command sequences to many phones and correlate the replies"""
+
+    def __init__(self, gateway, concurrency=50, rate=RATE, reply_timeout=REPLY_TIMEOUT,
+                 max_attempts=MAX_ATTEMPTS):
+        """
+        Initialize provisioner
+
+        Args:
+            gateway: SMS gateway adapter
+            concurrency: Phones provisioned at the same time
+            rate: Outgoing messages per second across all phones
+            reply_timeout: Seconds to wait for each reply
+            max_attempts: Sends per command before the phone is given up
+        """
+        self.gateway = gateway
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate, burst=max(1, int(rate)))
+        self.reply_timeout = reply_timeout
+        self.max_attempts = max_attempts
+        self._mailboxes = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {
+            'sent': 0,
+            'replies': 0,
+            'unmatched': 0,
+            'retries': 0,
+        }
+
+    def _mailbox(self, phone):
+        with self._lock:
+            return self._mailboxes.setdefault(normalize_phone(phone), queue.Queue())
+
+    def _receive_loop(self):
+        """Route incoming messages to the mailbox of their sender"""
+        while not self._stop.is_set():
+            try:
+                messages = self.gateway.receive()
+            except (SmsError, OSError, ValueError) as e:
+                logger.warning("SMS inbox poll failed: %s", e)
+                time.sleep(POLL_INTERVAL)
+                continue
+            for message in messages:
+                sender = normalize_phone(message.get('from'))
+                with self._lock:
+                    mailbox = self._mailboxes.get(sender)
+                    self.stats['replies' if mailbox is not None else 'unmatched'] += 1
+                if mailbox is None:
+                    logger.info("SMS from unknown number %s: %r", message.get('from'), message.get('text'))
+                    continue
+                mailbox.put(message.get('text') or '')
+
+    def _await_reply(self, mailbox, command):
+        """Collect reply parts until they answer command or time out"""
+        text = ''
+        deadline = time.monotonic() + self.reply_timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None, text
+            try:
+                text += mailbox.get(timeout=remaining)
+            except queue.Empty:
+                return None, text
+            result = protocol.check_reply(command, text)
+            if result is not None:
+                return result, text
+
+    def provision(self, phone, commands):
+        """
+        Send commands to one phone, each after the previous one is confirmed
+
+        Returns:
+            Result dict: phone, status ('ok', 'rejected', 'timeout' or
+            'failed'), replies, attempts and elapsed seconds
+        """
+        mailbox = self._mailbox(phone)
+        started = time.monotonic()
+        result = {'phone': phone, 'status': 'ok', 'replies': [], 'attempts': 0}
+        for command in commands:
+            for attempt in range(self.max_attempts):
+                # Late replies to an earlier attempt would be mistaken for this one
+                while not mailbox.empty():
+                    mailbox.get_nowait()
+                self.limiter.acquire()
+                try:
+                    self.gateway.send(phone, command)
+                except (SmsError, OSError) as e:
+                    result.update(status='failed', error=str(e))
+                    break
+                with self._lock:
+                    self.stats['sent'] += 1
+                    self.stats['retries'] += 1 if attempt else 0
+                result['attempts'] += 1
+                confirmed, text = self._await_reply(mailbox, command)
+                if confirmed is not None:
+                    result['replies'].append(text.strip())
+                    if not confirmed:
+                        result['status'] = 'rejected'
+                    break
+            else:
+                result['status'] = 'timeout'
+            if result['status'] != 'ok':
+                break
+        result['elapsed'] = round(time.monotonic() - started, 1)
+        return result
+
+    def run(self, jobs, on_result=None):
+        """
+        Provision every (phone, commands) job
+
+        Args:
+            jobs: Iterable of (phone, [command, ...])
+            on_result: Called with each result dict as it completes
+
+        Returns:
+            List of result dicts, in completion order
+        """
+        receiver = threading.Thread(target=self._receive_loop, name='sms-inbox', daemon=True)
+        receiver.start()
+        results = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='sms') as executor:
+                futures = [executor.submit(self.provision, phone, commands) for phone, commands in jobs]
+                for future in as_completed(futures):
+                    result = future.result()
+                    results.append(result)
+                    if on_result:
+                        on_result(result)
+        finally:
+            self._stop.set()
+            receiver.join(POLL_INTERVAL + 1)
+        return results
+
+
+def write_results(path, results):
+    """Write provisioning results as CSV"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=('phone', 'status', 'attempts', 'elapsed', 'replies', 'error'))
+        writer.writeheader()
+        for result in results:
+            writer.writerow({**result, 'replies': ' | '.join(result['replies'])})
@@ -0,0 +1,260 @@
+"""
+Durable, segment-based write-ahead spool
+
+Records are appended to fixed-size, memory-mapped segment files
+(segment-<seq>.spool). A record is:
+
+    length (4, little-endian) | crc32 (4) | data (length bytes)
+
+The header is written after the data, so a torn write leaves a zero length
+and is ignored on recovery. Once a record is in the mapped page cache it
+survives a crash of the process; flush() forces it to disk.
+
+Consumers read from a committed cursor (the 'cursor' file) and commit after
+the records have been delivered, so a restart replays everything that was
+not confirmed. Fully consumed segments are deleted.
+"""
+
+import mmap
+import os
+import struct
+import zlib
+
+RECORD_HEADER = struct.Struct('<II')
+CURSOR = struct.Struct('<QQ')
+
+SEGMENT_SIZE = 16 * 1024 * 1024
+
+
+class SpoolError(Exception):
+    """Raised when a record cannot be spooled"""
+
+
+class Spool:
+    """Append-only record spool with a durable read cursor"""
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE):
+        """
+        Open (or create) a spool directory and recover its state
+
+        Args:
+            directory: Directory holding segment files and the cursor
+            segment_size: Bytes per segment file
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+
+        self._maps = {}
+        self._cursor_path = os.path.join(directory, 'cursor')
+        self._cursor = self._load_cursor()
+
+        segments = self._segments()
+        if segments:
+            self._write_seq = segments[-1]
+            if self._cursor[0] < segments[0]:
+                self._cursor = (segments[0], 0)
+        else:
+            self._write_seq = self._cursor[0]
+        self._write_map = self._map(self._write_seq)
+        self._write_offset = self._recover(self._write_seq)
+
+        # Count what is waiting to be consumed
+        self.pending = 0
+        position = self._cursor
+        while True:
+            records, position = self._read_from(position, 1 << 16)
+            if not records:
+                break
+            self.pending += len(records)
+
+    def _segments(self):
+        names = (n for n in os.listdir(self.directory) if n.startswith('segment-') and n.endswith('.spool'))
+        return sorted(int(n[8:-6]) for n in names)
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f'segment-{seq:012d}.spool')
+
+    def _map(self, seq):
+        """Map a segment, creating and preallocating it if needed"""
+        if seq not in self._maps:
+            with open(self._path(seq), 'a+b') as f:
+                if os.fstat(f.fileno()).st_size < self.segment_size:
+                    f.truncate(self.segment_size)
+                self._maps[seq] = mmap.mmap(f.fileno(), self.segment_size)
+        return self._maps[seq]
+
+    def _unmap(self, seq):
+        mm = self._maps.pop(seq, None)
+        if mm is not None:
+            mm.close()
+
+    def _load_cursor(self):
+        try:
+            with open(self._cursor_path, 'rb') as f:
+                return CURSOR.unpack(f.read(CURSOR.size))
+        except (FileNotFoundError, struct.error):
+            segments = self._segments()
+            return (segments[0] if segments else 0, 0)
+
+    def _record_at(self, mm, offset):
+        """Return the record data at offset, or None at the end of valid data"""
+        if offset + RECORD_HEADER.size > self.segment_size:
+            return None
+        length, crc = RECORD_HEADER.unpack_from(mm, offset)
+        start = offset + RECORD_HEADER.size
+        if length == 0 or start + length > self.segment_size:
+            return None
+        data = mm[start:start + length]
+        if zlib.crc32(data) != crc:
+            return None
+        return data
+
+    def _recover(self, seq):
+        """Find the write offset of a segment and clear any torn tail"""
+        mm = self._maps[seq]
+        offset = 0
+        while True:
+            data = self._record_at(mm, offset)
+            if data is None:
+                break
+            offset += RECORD_HEADER.size + len(data)
+        if offset < self.segment_size and any(mm[offset:offset + RECORD_HEADER.size]):
+            mm[offset:] = bytes(self.segment_size - offset)
+        return offset
+
+    def append(self, data):
+        """
+        Append one record
+
+        Raises:
+            SpoolError: if the record is larger than a segment or the disk
+                is full
+        """
+        size = RECORD_HEADER.size + len(data)
+        if size > self.segment_size or not data:
+            raise SpoolError(f"Invalid record size {len(data)}")
+
+        try:
+            if self._write_offset + size > self.segment_size:
+                self._roll()
+            mm = self._write_map
+            offset = self._write_offset
+            mm[offset + RECORD_HEADER.size:offset + size] = data
+            RECORD_HEADER.pack_into(mm, offset, len(data), zlib.crc32(data))
+        except OSError as e:
+            raise SpoolError(str(e)) from e
+
+        self._write_offset += size
+        self.pending += 1
+
+    def _roll(self):
+        """Start a new segment"""
+        self._write_map.flush()
+        if self._write_seq != self._cursor[0]:
+            self._unmap(self._write_seq)
+        self._write_seq += 1
+        self._write_map = self._map(self._write_seq)
+        self._write_offset = 0
+
+    def _read_from(self, position, max_records):
+        seq, offset = position
+        records = []
+        while len(records) < max_records:
+            data = self._record_at(self._map(seq), offset)
+            if data is None:
+                if seq >= self._write_seq:
+                    break
+                seq, offset = seq + 1, 0
+                continue
+            records.append(data)
+            offset += RECORD_HEADER.size + len(data)
+        return records, (seq, offset)
+
+    def read(self, max_records):
+        """
+        Read up to max_records from the committed cursor
+
+        Returns:
+            (records, position) where position is passed to commit() once
+            the records have been delivered
+        """
+        return self._read_from(self._cursor, max_records)
+
+    def commit(self, position, count):
+        """
+        Persist the read cursor and delete fully consumed segments
+
+        Args:
+            position: Position returned by read()
+            count: Number of records consumed up to position
+        """
+        old_seq = self._cursor[0]
+
+        tmp = self._cursor_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(CURSOR.pack(*position))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._cursor_path)
+        self._cursor = tuple(position)
+        self.pending -= count
+
+        for seq in range(old_seq, position[0]):
+            self._unmap(seq)
+            try:
+                os.remove(self._path(seq))
+            except FileNotFoundError:
+                pass
+
+    def flush(self):
+        """Force the current segment to disk"""
+        self._write_map.flush()
+
+    def close(self):
+        """Flush and unmap all segments"""
+        self.flush()
+        for seq in list(self._maps):
+            self._unmap(seq)
+
+
+def transfer(source_dir, target, max_records=1024):
+    """
+    Move the records a spool directory has not delivered to another spool
+
+    Records are appended to target and flushed before the source cursor is
+    committed, so a crash in between replays them rather than losing them.
+    The source's segment and cursor files are removed afterwards; other
+    files (e.g., a dead-letter file) are left alone.
+
+    Args:
+        source_dir: Spool directory to empty
+        target: Open Spool to append to
+        max_records: Records moved per commit
+
+    Returns:
+        Number of records moved (0 if source_dir holds no spool)
+    """
+    if not os.path.isdir(source_dir) or not any(
+            n.startswith('segment-') and n.endswith('.spool') for n in os.listdir(source_dir)):
+        return 0
+
+    source = Spool(source_dir)
+    moved = 0
+    try:
+        while True:
+            records, position = source.read(max_records)
+            if not records:
+                break
+            for data in records:
+                target.append(data)
+            target.flush()
+            source.commit(position, len(records))
+            moved += len(records)
+    finally:
+        source.close()
+
+    for name in os.listdir(source_dir):
+        if name in ('cursor', 'cursor.tmp') or (name.startswith('segment-') and name.endswith('.spool')):
+            os.remove(os.path.join(source_dir, name))
+    return moved
@@ -0,0 +1,333 @@
+"""
+Multi-process supervisor for the DF555 gateway
+
+Starts N df555.gateway worker processes that all listen on the same port
+through SO_REUSEPORT, so the kernel spreads sensor connections across CPU
+cores. Crashed workers are restarted with backoff, SIGTERM/SIGINT drains
+every worker (accepted connections are acknowledged, queued readings are
+forwarded) before exiting, and the workers' counters are aggregated and
+logged periodically. With a metrics port the supervisor serves the merged
+Prometheus metrics of all workers (see df555.metrics).
+
+With a spool directory each worker gets its own sub-directory
+(worker-<n>), so a restarted worker replays exactly what it spooled.
+Spools left by workers that no longer exist (--processes was lowered, or
+a single-process gateway spooled directly in the directory) are moved to
+the current workers' spools before they start (see adopt_spools()).
+With alert rules, Firebase publishing or a tanks file configured, SIGHUP
+is passed on to every worker so they reload the rules and tanks files.
+
+Usage:
+    python3 -m df555.gateway --processes=4 --spool-dir=/var/spool/df555
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import signal
+import socket
+import time
+
+from df555.gateway import SNAPSHOT_GAUGES, SensorGateway
+from df555.metrics import Registry, merge_states, render, start_http_server
+from df555.spool import Spool, transfer
+
+logger = logging.getLogger('df555.supervisor')
+
+# Seconds between worker stats reports and supervisor summaries
+STATS_INTERVAL = 1.0
+LOG_INTERVAL = 60.0
+
+# Restart backoff for crashing workers (seconds)
+RESTART_MIN = 1.0
+RESTART_MAX = 30.0
+# A worker that ran this long is considered healthy again
+STABLE_AFTER = 60.0
+
+# Seconds a worker gets to drain after SIGTERM before it is killed
+DRAIN_TIMEOUT = 30.0
+
+# Gauges are summed like counters, but are not cumulative across restarts
+GAUGES = SNAPSHOT_GAUGES
+
+WORKER_DIR = re.compile(r'worker-(\d+)$')
+
+
+def worker_options(options, index):
+    """Gateway options for worker index (separate spool directory and analytics file per worker)"""
+    options = dict(options)
+    if options.get('spool_dir'):
+        options['spool_dir'] = os.path.join(options['spool_dir'], f'worker-{index}')
+    if options.get('analytics_state'):
+        root, ext = os.path.splitext(options['analytics_state'])
+        options['analytics_state'] = f'{root}.worker-{index}{ext}'
+    return options
+
+
+def adopt_spools(spool_dir, processes):
+    """
+    Move the spools of workers that no longer exist to the current ones
+
+    Each worker-<n> directory with n >= processes is moved into the spool
+    of worker n % processes, and with a single process (which spools in
+    spool_dir itself) every worker-<n> directory is moved into spool_dir.
+    With several processes a spool left in spool_dir by a single-process
+    gateway is moved into worker-0. Must run before the workers start.
+
+    Args:
+        spool_dir: The gateway's --spool-dir
+        processes: Number of worker processes about to start
+
+    Returns:
+        Number of records moved
+    """
+    def target_dir(index):
+        return spool_dir if processes == 1 else os.path.join(spool_dir, f'worker-{index % processes}')
+
+    moves = [(spool_dir, target_dir(0))] if processes > 1 else []
+    for name in sorted(os.listdir(spool_dir)) if os.path.isdir(spool_dir) else []:
+        match = WORKER_DIR.match(name)
+        if match and (processes == 1 or int(match.group(1)) >= processes):
+            moves.append((os.path.join(spool_dir, name), target_dir(int(match.group(1)))))
+
+    targets = {}
+    total = 0
+    try:
+        for source, destination in moves:
+            if destination not in targets:
+                targets[destination] = Spool(destination)
+            moved = transfer(source, targets[destination])
+            if moved:
+                logger.info("Moved %d spooled reports from %s to %s", moved, source, destination)
+            total += moved
+            if source != spool_dir:
+                try:
+                    os.rmdir(source)
+                except OSError:
+                    pass  # Keeps its dead-letter file
+    finally:
+        for spool in targets.values():
+            spool.close()
+    return total
+
+
+def run_worker(index, options, stats_queue, log_level=logging.INFO):
+    """
+    Worker process entry point
+
+    Serves with SO_REUSEPORT until SIGTERM and reports a stats snapshot to
+    the supervisor every STATS_INTERVAL seconds.
+    """
+    # Ctrl-C reaches the whole process group; only the supervisor reacts to it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=log_level, format='%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s')
+
+    async def serve():
+        gateway = SensorGateway(**worker_options(options, index), reuse_port=True)
+
+        async def report():
+            while True:
+                await asyncio.sleep(STATS_INTERVAL)
+                stats_queue.put((index, os.getpid(), gateway.snapshot(), gateway.metrics.state()))
+
+        reporter = None
+        try:
+            run = asyncio.create_task(gateway.run(signals=(signal.SIGTERM,)))
+            reporter = asyncio.create_task(report())
+            await run
+        finally:
+            if reporter:
+                reporter.cancel()
+            stats_queue.put((index, os.getpid(), gateway.snapshot(), gateway.metrics.state()))
+
+    asyncio.run(serve())
+
+
+class Supervisor:
+    """Run, restart and drain gateway worker processes"""
+
+    def __init__(self, processes, options, drain_timeout=DRAIN_TIMEOUT):
+        """
+        Initialize supervisor
+
+        Args:
+            processes: Number of worker processes
+            options: Keyword arguments for SensorGateway; metrics_port and
+                metrics_host are served by the supervisor for all workers
+            drain_timeout: Seconds a worker gets to drain on shutdown
+        """
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise RuntimeError("SO_REUSEPORT is not supported on this platform")
+
+        self.processes = processes
+        self.options = dict(options)
+        self.metrics_port = self.options.pop('metrics_port', None)
+        self.metrics_host = self.options.pop('metrics_host', '127.0.0.1')
+        self.drain_timeout = drain_timeout
+        self.context = multiprocessing.get_context('spawn')
+        self.stats_queue = self.context.Queue()
+        self.workers = {}
+        self.restarts = 0
+        self.failures = {index: 0 for index in range(processes)}
+        self.started_at = {}
+        self.restart_at = {}
+        # Latest snapshot per running process, and totals of exited ones
+        self.snapshots = {}
+        self.retired = {}
+        self.metric_states = {}
+        self.retired_metrics = {}
+        self.metrics = Registry()
+        self.metrics.gauge('df555_workers', 'Gateway worker processes running',
+                           function=lambda: sum(1 for p in list(self.workers.values()) if p is not None))
+        self.metrics.counter('df555_worker_restarts_total', 'Gateway worker processes restarted',
+                             function=lambda: self.restarts)
+        self._stopping = False
+
+    def spawn(self, index):
+        """Start worker index"""
+        process = self.context.Process(
+            target=run_worker, args=(index, self.options, self.stats_queue, logging.getLogger().level),
+            name=f'df555-gateway-{index}'
+        )
+        process.start()
+        self.workers[index] = process
+        self.started_at[index] = time.monotonic()
+        logger.info("Started worker %d pid=%s", index, process.pid)
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def _reload(self, signum, frame):
+        for process in list(self.workers.values()):
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signal.SIGHUP)
+
+    def run(self):
+        """
+        Supervise until SIGTERM/SIGINT, then drain the workers
+
+        Returns:
+            Exit code (0 when every worker drained cleanly)
+        """
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        if self.options.get('rules') or self.options.get('firebase') or self.options.get('tanks'):
+            signal.signal(signal.SIGHUP, self._reload)
+
+        metrics_server = None
+        if self.metrics_port is not None:
+            metrics_server = start_http_server(lambda: render(self.merged_metrics()),
+                                               self.metrics_host, self.metrics_port)
+
+        if self.options.get('spool_dir'):
+            adopt_spools(self.options['spool_dir'], self.processes)
+        for index in range(self.processes):
+            self.spawn(index)
+
+        last_log = time.monotonic()
+        while not self._stopping:
+            self._collect(timeout=0.5)
+            self._reap()
+            if time.monotonic() - last_log >= LOG_INTERVAL:
+                self.log_totals()
+                last_log = time.monotonic()
+
+        try:
+            return self.shutdown()
+        finally:
+            if metrics_server:
+                metrics_server.shutdown()
+                metrics_server.server_close()
+
+    def _reap(self):
+        """Restart workers that exited, backing off if they keep crashing"""
+        now = time.monotonic()
+        for index, process in list(self.workers.items()):
+            if process is None:
+                if now >= self.restart_at.get(index, 0):
+                    self.spawn(index)
+                continue
+            if process.is_alive():
+                continue
+
+            self._retire(process.pid)
+            uptime = now - self.started_at[index]
+            if uptime >= STABLE_AFTER:
+                self.failures[index] = 0
+            delay = min(RESTART_MIN * 2 ** self.failures[index], RESTART_MAX)
+            self.failures[index] += 1
+            self.restarts += 1
+            logger.error("Worker %d pid=%s exited with code %s after %.1fs, restarting in %.1fs",
+                         index, process.pid, process.exitcode, uptime, delay)
+            self.workers[index] = None
+            self.restart_at[index] = now + delay
+
+    def _collect(self, timeout=0.0):
+        """Take the latest stats snapshots reported by the workers"""
+        try:
+            while True:
+                index, pid, snapshot, metrics = self.stats_queue.get(timeout=timeout)
+                self.snapshots[pid] = snapshot
+                self.metric_states[pid] = metrics
+                timeout = 0.0
+        except queue.Empty:
+            pass
+
+    def _retire(self, pid):
+        """Fold the counters of an exited worker into the retired totals"""
+        snapshot = self.snapshots.pop(pid, None)
+        for key, value in (snapshot or {}).items():
+            if key not in GAUGES:
+                self.retired[key] = self.retired.get(key, 0) + value
+        metrics = self.metric_states.pop(pid, None)
+        if metrics:
+            self.retired_metrics = merge_states([self.retired_metrics, metrics], gauges=False)
+
+    def merged_metrics(self):
+        """Metrics of all workers since start plus the supervisor's own"""
+        states = [self.retired_metrics, *list(self.metric_states.values()), self.metrics.state()]
+        return merge_states(states)
+
+    def totals(self):
+        """Counters summed over all workers since start, gauges over running workers"""
+        totals = dict(self.retired)
+        for snapshot in self.snapshots.values():
+            for key, value in snapshot.items():
+                totals[key] = totals.get(key, 0) + value
+        totals['workers'] = sum(1 for p in self.workers.values() if p is not None and p.is_alive())
+        totals['restarts'] = self.restarts
+        return totals
+
+    def log_totals(self):
+        totals = self.totals()
+        logger.info("Gateway totals: %s", ' '.join(f'{key}={value}' for key, value in sorted(totals.items())))
+
+    def shutdown(self):
+        """SIGTERM every worker, wait for them to drain and kill stragglers"""
+        running = [p for p in self.workers.values() if p is not None and p.is_alive()]
+        logger.info("Draining %d workers", len(running))
+        for process in running:
+            process.terminate()
+
+        deadline = time.monotonic() + self.drain_timeout
+        clean = True
+        for process in running:
+            while process.is_alive() and time.monotonic() < deadline:
+                self._collect(timeout=0.1)
+                process.join(0.1)
+            if process.is_alive():
+                logger.error("Worker pid=%s did not drain in %.0fs, killing it", process.pid, self.drain_timeout)
+                process.kill()
+                process.join()
+                clean = False
+            elif process.exitcode != 0:
+                clean = False
+
+        self._collect()
+        for process in running:
+            self._retire(process.pid)
+        self.log_totals()
+        return 0 if clean else 1
@@ -0,0 +1,286 @@
+"""
+Vectorized water level to volume conversion
+Requires: pip install numpy
+
+Mirrors SensorController::calculateVolume (and its copy in
+DingtekThingsBoardService) for whole arrays of readings. Each tank
+geometry gets a height → litres lookup table with one entry per
+millimetre, built once and cached by its dimensions, so converting a
+reading is a table lookup (np.interp) instead of per-row trigonometry.
+
+Shapes:
+    cylindrical   vertical cylinder, π r² h (the Laravel default)
+    horizontal    horizontal cylinder of length_mm (circular segment × length)
+    rectangular   diameter_mm² × h, as calculateVolume assumes a square base
+    spherical     spherical cap, π h² (3r - h) / 3
+    custom        strapping table of (height_mm, litres) points; without
+                  one, cylindrical like the Laravel default branch
+
+Usage:
+    python3 -m df555.volume /data/archive --tanks tanks.json --start 2025-01-01
+    python3 -m df555.volume /data/archive --tanks tanks.json --verify
+"""
+
+import argparse
+import functools
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+SHAPES = ('cylindrical', 'horizontal', 'rectangular', 'spherical', 'custom')
+
+# Table resolution; readings are whole millimetres, so lookups are exact
+STEP_MM = 1
+
+
+def _horizontal_length(height_mm, diameter_mm, length_mm, capacity_liters):
+    """Length of a horizontal tank, derived from its capacity if not given"""
+    if length_mm:
+        return float(length_mm)
+    radius_m = diameter_mm / 2000
+    if capacity_liters and radius_m:
+        return capacity_liters / 1000 / (math.pi * radius_m ** 2) * 1000
+    return float(height_mm)
+
+
+def tank_geometry(tank):
+    """
+    Geometry of a tank row (dict with the tanks table columns)
+
+    Recognised keys: shape, height_mm, diameter_mm, capacity_liters and,
+    beyond the Laravel schema, length_mm and strapping.
+
+    Returns:
+        (shape, height_mm, diameter_mm, length_mm, strapping), hashable
+    """
+    shape = tank.get('shape') or 'cylindrical'
+    height_mm = int(tank.get('height_mm') or 0)
+    diameter_mm = int(tank.get('diameter_mm') or 0)
+    length_mm = None
+    strapping = None
+
+    if shape == 'horizontal':
+        length_mm = _horizontal_length(height_mm, diameter_mm, tank.get('length_mm'), tank.get('capacity_liters'))
+    elif shape == 'custom' and tank.get('strapping'):
+        strapping = tuple(sorted((float(h), float(v)) for h, v in tank['strapping']))
+
+    return shape, height_mm, diameter_mm, length_mm, strapping
+
+
+def calculate_volume(tank, level_mm):
+    """
+    Volume of one reading, computed directly (reference implementation)
+
+    Args:
+        tank: Tank row dict
+        level_mm: Water level in mm
+
+    Returns:
+        Litres, rounded to 2 decimals like calculateVolume
+    """
+    shape, _, diameter_mm, length_mm, strapping = tank_geometry(tank)
+    level = level_mm / 1000
+    diameter = diameter_mm / 1000
+    radius = diameter / 2
+
+    if shape == 'rectangular':
+        volume = diameter * diameter * level
+    elif shape == 'spherical':
+        volume = math.pi * level ** 2 / 3 * (3 * radius - level)
+    elif shape == 'horizontal':
+        h = min(max(level, 0.0), diameter)
+        if radius:
+            area = radius ** 2 * math.acos((radius - h) / radius) - (radius - h) * math.sqrt(2 * radius * h - h * h)
+        else:
+            area = 0.0
+        volume = area * length_mm / 1000
+    elif strapping:
+        heights, litres = zip(*strapping)
+        return round(float(np.interp(level_mm, heights, litres)), 2)
+    else:
+        volume = math.pi * radius ** 2 * level
+
+    return round(volume * 1000, 2)
+
+
+@functools.lru_cache(maxsize=1024)
+def volume_table(shape, height_mm, diameter_mm=None, length_mm=None, strapping=None):
+    """
+    Height → litres lookup table of a tank geometry (cached)
+
+    Args:
+        shape: One of SHAPES
+        height_mm: Tank height in mm (the table covers 0..height_mm)
+        diameter_mm: Tank diameter (or square base side) in mm
+        length_mm: Length of a horizontal tank in mm
+        strapping: Tuple of (height_mm, litres) pairs for custom tanks
+
+    Returns:
+        (heights_mm, litres) read-only float64 arrays
+
+    Raises:
+        ValueError: for an unknown shape
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown tank shape: {shape}")
+
+    if shape == 'custom' and strapping:
+        points = np.array(sorted(strapping), dtype=np.float64)
+        heights, litres = points[:, 0].copy(), points[:, 1].copy()
+    else:
+        top = max(int(height_mm or 0), 0)
+        heights = np.arange(0, top + STEP_MM, STEP_MM, dtype=np.float64)
+        level = heights / 1000
+        diameter = (diameter_mm or 0) / 1000
+        radius = diameter / 2
+
+        if shape == 'rectangular':
+            volume = diameter * diameter * level
+        elif shape == 'spherical':
+            volume = np.pi * level ** 2 / 3 * (3 * radius - level)
+        elif shape == 'horizontal':
+            h = np.clip(level, 0.0, diameter)
+            if radius:
+                area = radius ** 2 * np.arccos((radius - h) / radius) - (radius - h) * np.sqrt(2 * radius * h - h * h)
+            else:
+                area = np.zeros_like(h)
+            volume = area * (length_mm or 0) / 1000
+        else:
+            volume = np.pi * radius ** 2 * level
+        litres = volume * 1000
+
+    heights.flags.writeable = False
+    litres.flags.writeable = False
+    return heights, litres
+
+
+def tank_table(tank):
+    """Lookup table of a tank row, see tank_geometry()"""
+    return volume_table(*tank_geometry(tank))
+
+
+def water_levels(distance_mm, height_mm):
+    """Water level from sensor distance, clamped to the tank like the Laravel services"""
+    return np.clip(height_mm - np.asarray(distance_mm, dtype=np.float64), 0, height_mm)
+
+
+def volumes(level_mm, table):
+    """
+    Convert an array of water levels with a lookup table
+
+    Args:
+        level_mm: Array of levels in mm
+        table: (heights_mm, litres) from volume_table() or tank_table()
+
+    Returns:
+        Litres (float64), rounded to 2 decimals like calculateVolume
+    """
+    heights, litres = table
+    return np.round(np.interp(level_mm, heights, litres), 2)
+
+
+def convert(distance_mm, tank):
+    """
+    Level, percentage and volume of readings from one tank
+
+    Args:
+        distance_mm: Array of sensor distances (archive height_mm)
+        tank: Tank row dict
+
+    Returns:
+        Dict of water_level_mm, water_level_percentage and volume_liters arrays
+    """
+    height_mm = int(tank.get('height_mm') or 0)
+    level = water_levels(distance_mm, height_mm)
+    percentage = np.round(level / height_mm * 100, 2) if height_mm > 0 else np.zeros_like(level)
+    return {
+        'water_level_mm': level,
+        'water_level_percentage': percentage,
+        'volume_liters': volumes(level, tank_table(tank)),
+    }
+
+
+def load_tanks(path):
+    """
+    Tanks keyed by sensor IMEI from a JSON export
+
+    The file is a list of tank rows, each with the sensor's 'imei' (or
+    'device_id') alongside the tank columns.
+    """
+    with open(path) as f:
+        rows = json.load(f)
+    return {str(row.get('imei') or row.get('device_id')): row for row in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute water level and volume for archived readings')
+    parser.add_argument('archive', help='Archive directory (df555.archive)')
+    parser.add_argument('--tanks', required=True, help='JSON list of tank rows with the sensor imei')
+    parser.add_argument('--start', help="First day ('YYYY-MM-DD') or unix time")
+    parser.add_argument('--end', help='Last day or unix time')
+    parser.add_argument('--output', help='Save results per device to this .npz file')
+    parser.add_argument('--verify', action='store_true', help='Check against the direct per-reading formulas')
+    args = parser.parse_args()
+
+    from df555.archive import Archive, _parse_time
+
+    archive = Archive(args.archive)
+    tanks = load_tanks(args.tanks)
+    start = _parse_time(args.start)
+    end = _parse_time(args.end)
+    if args.end and not args.end.isdigit():
+        end += 86399
+
+    print("=" * 60)
+    print("DF555 VOLUME RECOMPUTE")
+    print("=" * 60)
+
+    results = {}
+    rows = 0
+    mismatches = 0
+    elapsed = 0.0
+    for device, tank in sorted(tanks.items()):
+        data = archive.load(device, start, end, columns=('height_mm',))
+        distance = data['height_mm']
+        distance = distance[~np.isnan(distance)]
+        if not len(distance):
+            continue
+
+        began = time.perf_counter()
+        result = convert(distance, tank)
+        elapsed += time.perf_counter() - began
+        rows += len(distance)
+        results[device] = result
+
+        if args.verify:
+            sample = result['water_level_mm'][:1000]
+            expected = [calculate_volume(tank, level) for level in sample]
+            mismatches += int((np.abs(result['volume_liters'][:1000] - expected) > 0.011).sum())
+
+        print(f"{device}  {tank.get('shape') or 'cylindrical':12} {len(distance):>9} readings  "
+              f"mean {result['volume_liters'].mean():.1f} L")
+
+    if not results:
+        print("✗ No archived readings for the given tanks")
+        return 1
+
+    print("-" * 60)
+    print(f"Readings:    {rows}")
+    print(f"Converted:   {rows / max(elapsed, 1e-9):,.0f} readings/s ({elapsed:.3f}s)")
+    print(f"Tables:      {volume_table.cache_info().currsize} cached")
+    if args.verify:
+        print(f"{'✓' if not mismatches else '✗'} Verification: {mismatches} mismatches")
+
+    if args.output:
+        np.savez(args.output, **{f'{device}_{name}': values
+                                 for device, result in results.items() for name, values in result.items()})
+        print(f"Saved to {args.output}")
+    print("=" * 60)
+    return 0 if not mismatches else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Shared fixtures for the df555 tests
+
+Run from scripts/:
+
+    python -m pytest
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from df555 import protocol
+
+IMEI = '868000000000001'
+DEVICE_ID = '1' + IMEI
+
+
+class FakeApi:
+    """
+    Local stand-in for the Laravel API
+
+    Every request is recorded as (method, path, body). respond(method, body)
+    returns the status to answer with, or None to close the connection
+    without answering (a request the server may or may not have processed).
+    Accepted readings get increasing ids, returned like the bulk endpoint's.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.respond = lambda method, body: 200
+        self.last_id = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    @property
+    def readings(self):
+        """Readings of the bulk requests answered with 2xx"""
+        return [reading for method, _, body, status in self.requests
+                if method == 'POST' and status is not None and status < 300
+                for reading in body.get('readings', [])]
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _answer(self, method):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length)) if length else {}
+                status = api.respond(method, body)
+                readings = body.get('readings', [])
+                with api._lock:
+                    api.requests.append((method, self.path, body, status))
+                    ids = list(range(api.last_id + 1, api.last_id + 1 + len(readings)))
+                    if status is not None and status < 300:
+                        api.last_id += len(readings)
+                if status is None:
+                    self.close_connection = True
+                    return
+                payload = json.dumps({'accepted': len(readings), 'rejected': 0, 'ids': ids}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                self._answer('POST')
+
+            def do_GET(self):
+                self._answer('GET')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def api():
+    fake = FakeApi()
+    thread = threading.Thread(target=fake.server.serve_forever, daemon=True)
+    thread.start()
+    yield fake
+    fake.server.shutdown()
+    fake.server.server_close()
+
+
+@pytest.fixture
+def report():
+    """Build binary report frames: report(height_mm, device_id=DEVICE_ID, **fields)"""
+    def build(height_mm=1500, device_id=DEVICE_ID, **fields):
+        fields.setdefault('timestamp', 1700000000)
+        return protocol.build_report(height_mm, device_id, **fields)
+    return build
@@ -0,0 +1,47 @@
+import json
+
+from df555 import protocol
+from df555.analytics import REFILL_MM, StreamAnalytics, tank_heights
+
+from conftest import DEVICE_ID, IMEI
+
+
+def test_keyed_by_imei_with_tank_heights(report):
+    analytics = StreamAnalytics(tank_heights([{'imei': IMEI, 'height_mm': 3000}]))
+    analytics.observe(protocol.parse_frame(report(1000, timestamp=1700000000)))
+
+    assert list(analytics.tanks) == [IMEI]
+    summary = analytics.summary(IMEI)
+    assert summary['distance_mm'] == 1000
+    assert summary['level_mm'] == 2000
+
+
+def test_refill_and_consumption():
+    analytics = StreamAnalytics()
+    start = 1699963200  # 2023-11-14 12:00 UTC, all readings on one day
+    assert analytics.update(IMEI, start, 1000) == []
+    assert analytics.update(IMEI, start + 3600, 1100) == []
+    events = analytics.update(IMEI, start + 7200, 1100 - REFILL_MM - 50)
+
+    assert [(e['type'], e['imei']) for e in events] == [('refill', IMEI)]
+    assert analytics.summary(IMEI)['consumed_today_mm'] == 100
+    # Out of order readings are ignored
+    assert analytics.update(IMEI, start, 500) == []
+    assert analytics.stats['ignored'] == 1
+
+
+def test_state_keyed_by_device_id_is_migrated(tmp_path):
+    analytics = StreamAnalytics()
+    analytics.update(IMEI, 1700000000, 1000)
+    path = str(tmp_path / 'tanks.json')
+    analytics.save(path)
+
+    with open(path) as f:
+        state = json.load(f)
+    state['state'] = {DEVICE_ID: state['state'][IMEI]}
+    with open(path, 'w') as f:
+        json.dump(state, f)
+
+    restored = StreamAnalytics()
+    assert restored.load(path) == 1
+    assert list(restored.tanks) == [IMEI]
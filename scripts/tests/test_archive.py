@@ -0,0 +1,124 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from df555.archive import (  # noqa: E402
+    SOURCE_CAPTURE, SOURCE_CLOUD, Archive, backfill_captures, backfill_cloud, day_of, empty_columns,
+    history_columns, open_partition, read_header, write_partition,
+)
+from df555.dingtek_cloud import DingtekCloudClient, StubDingtekCloud  # noqa: E402
+
+from conftest import IMEI  # noqa: E402
+
+DAY = 1700006400  # 2023-11-15 00:00 UTC
+
+
+def readings(timestamps, height_mm=1000.0, source=SOURCE_CAPTURE):
+    columns = empty_columns(len(timestamps))
+    columns['timestamp'][:] = timestamps
+    columns['height_mm'][:] = height_mm
+    columns['source'][:] = source
+    return columns
+
+
+def test_partition_round_trip(tmp_path):
+    path = str(tmp_path / 'device=1' / '2023-11-15.df5a')
+    columns = readings([DAY, DAY + 60, DAY + 120])
+    columns['height_mm'][1] = np.nan
+    columns['frame_count'][:] = [1, -1, 3]
+
+    write_partition(path, columns, '1', '2023-11-15')
+
+    header = read_header(path)
+    assert header['rows'] == 3
+    assert header['stats']['height_mm'] == (1000.0, 1000.0)
+    assert header['stats']['frame_count'] == (1, 3)
+    assert header['stats']['temperature'] == (None, None)
+    assert {column['name']: column['missing'] for column in header['columns']}['height_mm'] == 1
+    assert all(column['offset'] % 64 == 0 for column in header['columns'])
+
+    mapped = open_partition(path, ['timestamp', 'frame_count'], header)
+    assert set(mapped) == {'timestamp', 'frame_count'}
+    assert mapped['frame_count'].tolist() == [1, -1, 3]
+
+
+def test_read_header_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.df5a'
+    path.write_bytes(b'PK\x03\x04' + bytes(60))
+    with pytest.raises(ValueError):
+        read_header(str(path))
+
+
+def test_rows_are_split_by_day_and_merged_on_flush(tmp_path):
+    archive = Archive(str(tmp_path))
+    archive.add(IMEI, readings([DAY - 60, DAY, DAY + 60]))
+    assert archive.flush() == 2
+    assert [day for _, day, _ in archive.partitions(IMEI)] == ['2023-11-14', '2023-11-15']
+
+    # A second backfill of the same readings overwrites, a cloud reading at the same time is kept
+    archive.add(IMEI, readings([DAY], height_mm=1200.0))
+    archive.add(IMEI, readings([DAY], height_mm=1300.0, source=SOURCE_CLOUD))
+    archive.flush()
+
+    loaded = archive.load(IMEI, start=DAY)
+    assert loaded['timestamp'].tolist() == [DAY, DAY, DAY + 60]
+    assert loaded['height_mm'].tolist() == [1200.0, 1300.0, 1000.0]
+    assert loaded['source'].tolist() == [SOURCE_CAPTURE, SOURCE_CLOUD, SOURCE_CAPTURE]
+    assert set(loaded['device']) == {IMEI}
+
+
+def test_scan_skips_partitions_by_statistics(tmp_path):
+    archive = Archive(str(tmp_path))
+    archive.add('868000000000001', readings([DAY], height_mm=500.0))
+    archive.add('868000000000002', readings([DAY], height_mm=2500.0))
+    archive.flush()
+
+    assert [device for device, *_ in archive.scan(ranges={'height_mm': (2000, None)})] == ['868000000000002']
+    assert list(archive.scan(start=DAY + 86400)) == []
+    assert len(archive.load(start=DAY + 86400)['timestamp']) == 0
+
+
+def test_backfill_captures(tmp_path, report):
+    lines = [report(1000 + i, f'1868000000000{i % 2:03d}', frame_count=i, timestamp=DAY + i).hex() + '\n'
+             for i in range(6)]
+    lines.insert(2, 'not a frame\n')
+    archive = Archive(str(tmp_path))
+
+    assert backfill_captures(archive, lines) == 6
+
+    loaded = archive.load('868000000000001')
+    assert loaded['height_mm'].tolist() == [1001.0, 1003.0, 1005.0]
+    assert loaded['frame_count'].tolist() == [1, 3, 5]
+    assert day_of(loaded['timestamp'][0]) == '2023-11-15'
+
+
+def test_history_columns_convert_units():
+    pages = [{
+        'distance': [{'ts': DAY * 1000, 'value': '12.5'}],
+        'level': [{'ts': DAY * 1000, 'value': '80'}],
+        'volt': [{'ts': DAY * 1000, 'value': '360'}],
+        'rsrp': [{'ts': DAY * 1000, 'value': '-905'}, {'ts': (DAY + 3600) * 1000, 'value': 'n/a'}],
+    }]
+    columns = history_columns(pages)
+    assert columns['timestamp'].tolist() == [DAY, DAY + 3600]
+    assert columns['height_mm'][0] == 1250.0
+    assert columns['level_mm'][0] == 800.0
+    assert columns['battery_mv'][0] == 3600.0
+    assert columns['rsrp'][0] == pytest.approx(-90.5)
+    assert np.isnan(columns['rsrp'][1])
+    assert set(columns['source']) == {SOURCE_CLOUD}
+
+
+def test_backfill_cloud(tmp_path):
+    archive = Archive(str(tmp_path))
+    with StubDingtekCloud(devices=3) as cloud:
+        client = DingtekCloudClient(cloud.url, 'user', 'secret', pool_size=2)
+        try:
+            results = backfill_cloud(archive, client, DAY, DAY + 86399, concurrency=2)
+        finally:
+            client.close()
+
+    assert results == {'devices': 3, 'readings': 72, 'failed': 0}
+    loaded = archive.load(cloud.devices[0]['name'])
+    assert len(loaded['timestamp']) == 24
+    assert not np.isnan(loaded['height_mm']).any()
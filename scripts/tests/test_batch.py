@@ -0,0 +1,53 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from df555 import batch, protocol  # noqa: E402
+
+
+def frames(report):
+    return [
+        report(1000 + i, f'1868000000000{i:03d}', frame_count=i, battery_mv=3500 + i * 10,
+               rsrp=-80.5 - i, status=i % 8, gps=(36.8 + i, -1.2) if i % 3 == 0 else None)
+        for i in range(12)
+    ]
+
+
+def assert_matches(readings, frames):
+    assert len(readings) == len(frames)
+    for reading, frame in zip(readings, frames):
+        parsed = protocol.parse_frame(frame)
+        assert reading['height_mm'] == parsed['height_mm']
+        assert reading['device_id'] == parsed['device_id']
+        assert reading['frame_count'] == parsed['frame_count']
+        assert reading['timestamp'] == parsed['timestamp']
+        assert reading['battery_mv'] == parsed['battery_voltage_mv']
+        assert reading['rsrp'] == pytest.approx(parsed['rsrp'])
+        assert reading['has_gps'] == parsed['has_gps']
+        assert bool(reading['status_full']) == bool(parsed['status_full'])
+        assert bool(reading['status_power']) == bool(parsed['status_power'])
+        if parsed['has_gps']:
+            assert reading['longitude'] == pytest.approx(parsed['longitude'])
+
+
+def test_decode_frames_matches_parse_frame(report):
+    sample = frames(report)
+    assert_matches(batch.decode_frames(sample), sample)
+
+
+def test_decode_frames_drops_invalid(report):
+    sample = frames(report)
+    mangled = sample[:3] + [sample[3][:-1] + b'\x00', b'SENSOR1,1500'] + sample[4:]
+    assert_matches(batch.decode_frames(mangled), sample[:3] + sample[4:])
+
+
+def test_decode_buffer(report):
+    sample = frames(report)
+    assert_matches(batch.decode_buffer(b''.join(sample)), sample)
+
+
+def test_hex_frame(report):
+    frame = report()
+    line = f'[2025-01-15 06:00:01] production.INFO: TCP: Received data {{"hex_data":"{frame.hex()}"}}'
+    assert batch.hex_frame(line) == frame
+    assert batch.hex_frame('[2025-01-15 06:00:01] production.INFO: nothing here') is None
@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+pytest.importorskip('serial')
+
+import configure_both_servers  # noqa: E402
+from configure_both_servers import SERVER_IP, SERVER_PORT, configure_port  # noqa: E402
+from df555.emulator import SerialEmulator  # noqa: E402
+from df555.inventory import Inventory  # noqa: E402
+
+from conftest import IMEI  # noqa: E402
+
+SERVER = f'{SERVER_IP};{SERVER_PORT};'
+
+
+def run_port(emulator, **options):
+    """configure_port() against the emulator, reset with the magnet once the port is open"""
+    reset = threading.Timer(0.3, emulator.wake)
+    reset.start()
+    try:
+        return configure_port(emulator.port, wake_timeout=5, **options)
+    finally:
+        reset.cancel()
+
+
+def test_without_inventory():
+    with SerialEmulator() as emulator:
+        result = run_port(emulator)
+
+    assert result['woke'] and result['server1'] and result['server2']
+    assert result['imei'] is None
+    assert result['error'] is None
+    assert emulator.params['server1'] == emulator.params['server2'] == SERVER
+
+
+def test_with_inventory_records_and_skips_confirmed():
+    with Inventory(':memory:') as inventory:
+        with SerialEmulator() as emulator:
+            result = run_port(emulator, inventory=inventory)
+        assert result['imei'] == IMEI
+        assert result['server1'] and result['server2'] and result['skipped'] == 0
+        assert [entry['ok'] for entry in inventory.history(IMEI)] == [1, 1, 1]
+        assert inventory.pending(IMEI) == {}
+
+        # The next session reads the servers back and sends nothing
+        with SerialEmulator(params=dict(emulator.params)) as emulator:
+            result = run_port(emulator, inventory=inventory)
+        assert result['skipped'] == 2
+        assert result['server1'] and result['server2']
+        assert len(emulator.commands) == 1
+
+
+def test_dump_without_imei_is_sent_unrecorded():
+    with Inventory(':memory:') as inventory:
+        with SerialEmulator(imei=None) as emulator:
+            result = run_port(emulator, inventory=inventory)
+        assert result['imei'] is None
+        assert result['server1'] and result['server2']
+        assert result['error'] is None
+        assert inventory.devices() == []
+
+
+def test_port_errors_are_reported_per_port(monkeypatch):
+    with Inventory(':memory:') as inventory:
+        def fail(*args, **kwargs):
+            raise RuntimeError('inventory is locked')
+        monkeypatch.setattr(inventory, 'record', fail)
+        with SerialEmulator() as emulator:
+            result = run_port(emulator, inventory=inventory)
+    assert result['error'] == 'inventory is locked'
+
+    result = configure_both_servers.configure_port('/dev/does-not-exist', wake_timeout=0.1)
+    assert not result['woke'] and result['error']
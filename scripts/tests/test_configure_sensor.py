@@ -0,0 +1,85 @@
+import pytest
+
+pytest.importorskip('serial')
+
+from configure_sensor import DF555Configurator  # noqa: E402
+from df555.emulator import SerialEmulator  # noqa: E402
+
+SERVER1 = ('66.241.124.67', 8888)
+SERVER2 = ('203.0.113.5', 10560)
+
+
+@pytest.fixture
+def emulator():
+    with SerialEmulator(always_awake=True) as emulator:
+        yield emulator
+
+
+@pytest.fixture
+def configurator(emulator):
+    configurator = DF555Configurator(emulator.port, verbose=False)
+    assert configurator.connect()
+    yield configurator
+    configurator.disconnect()
+
+
+def test_apply_sends_the_batch_in_one_session(configurator, emulator):
+    batch = configurator.build_batch(server1=SERVER1, server2=SERVER2, mode='02')
+
+    report = configurator.apply(batch)
+
+    assert [result['label'] for result in report['results']] == ['Server 1', 'Server 2', 'Server mode']
+    assert all(result['ok'] and result['confirmed'] for result in report['results'])
+    assert report['results'][1]['response'].startswith(b'Server2:203.0.113.5;10560;')
+    assert emulator.commands == [result['command'] for result in report['results']]
+    assert emulator.params['server1'] == '66.241.124.67;8888;'
+    assert emulator.params['server_mode'] == '02'
+    assert 'read_back' not in report
+
+
+def test_apply_reports_rejected_commands(configurator):
+    report = configurator.apply([('Unknown', '42', ''), ('Server 1', configurator.CMD_SET_SERVER1, '1.2.3.4;5;')])
+
+    unknown, server1 = report['results']
+    assert unknown['ok'] and not unknown['confirmed']
+    assert unknown['response'].startswith(b'Command error')
+    assert server1['confirmed']
+
+
+def test_apply_without_connection():
+    configurator = DF555Configurator('/dev/null', verbose=False)
+    report = configurator.apply(configurator.build_batch(server1=SERVER1))
+    assert report['results'] == []
+
+
+def test_read_back_parses_the_dump(configurator, emulator):
+    emulator.params['server2'] = '203.0.113.5;10560;'
+
+    result = configurator.read_back()
+
+    assert result['ok'] and result['confirmed']
+    assert result['params'].content('server2') == '203.0.113.5;10560;'
+    assert result['params'].content('server_mode') == emulator.params['server_mode']
+
+
+def test_apply_then_verify(configurator):
+    batch = configurator.build_batch(server1=SERVER1, mode='02')
+
+    report = configurator.apply(batch, verify=True)
+
+    assert report['read_back']['confirmed']
+    assert report['verified'] == [
+        {'label': 'Server 1', 'expected': '66.241.124.67;8888;', 'actual': '66.241.124.67;8888;', 'ok': True},
+        {'label': 'Server mode', 'expected': '02', 'actual': '02', 'ok': True},
+    ]
+
+
+def test_verify_reports_mismatches_and_unread_settings(configurator, emulator):
+    emulator.params['server1'] = '129.226.11.30;10560;'
+    params = configurator.read_back()['params']
+    batch = configurator.build_batch(server1=SERVER1)
+
+    assert [check['ok'] for check in configurator.verify(batch, params)] == [False]
+    assert configurator.verify(batch, None) == [
+        {'label': 'Server 1', 'expected': '66.241.124.67;8888;', 'actual': None, 'ok': None},
+    ]
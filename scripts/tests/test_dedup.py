@@ -0,0 +1,42 @@
+from df555 import protocol
+from df555.dedup import DedupCache, report_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_duplicates_within_the_window():
+    clock = Clock()
+    cache = DedupCache(max_size=100, window=60, clock=clock)
+
+    assert not cache.seen('a')
+    assert cache.seen('a')
+    clock.now = 59
+    assert cache.seen('b') is False
+    clock.now = 61
+    # 'a' was last seen at 0
+    assert not cache.seen('a')
+    assert cache.seen('b')
+    assert cache.stats['hits'] == 2
+
+
+def test_size_bound():
+    cache = DedupCache(max_size=3, window=60, clock=Clock())
+    for key in 'abcd':
+        cache.add(key)
+
+    assert len(cache) == 3
+    assert not cache.contains('a')
+    assert cache.contains('d')
+    assert cache.stats['evictions'] == 1
+
+
+def test_report_key(report):
+    parsed = protocol.parse_frame(report(frame_count=5))
+    assert report_key(parsed) == (parsed['device_id'], 5, 1700000000)
+    assert report_key(protocol.parse_ascii(b'SENSOR1,1500')) is None
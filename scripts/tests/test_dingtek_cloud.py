@@ -0,0 +1,134 @@
+import base64
+import json
+import time
+
+import pytest
+
+from df555 import dingtek_cloud
+from df555.dingtek_cloud import (
+    TELEMETRY_PATH, DingtekCloudClient, StubDingtekCloud, jwt_expiry, post_batch, retry_after, sync_devices,
+    telemetry_entry,
+)
+from df555.forwarder import HttpPool
+
+DEVICE = {'id': {'entityType': 'DEVICE', 'id': 'a1b2'}, 'name': '868000000000001', 'type': 'DF555', 'label': None}
+
+
+@pytest.fixture
+def cloud():
+    with StubDingtekCloud(devices=25) as stub:
+        yield stub
+
+
+def client_for(stub, **options):
+    return DingtekCloudClient(stub.url, 'user', 'secret', pool_size=4, **options)
+
+
+def test_jwt_expiry():
+    claims = base64.urlsafe_b64encode(json.dumps({'exp': 1700000000}).encode()).rstrip(b'=').decode()
+    assert jwt_expiry(f'header.{claims}.signature') == 1700000000
+    assert jwt_expiry('not-a-jwt') is None
+
+
+def test_retry_after():
+    assert retry_after({'Retry-After': '3'}) == 3.0
+    assert retry_after({'Retry-After': 'Wed, 21 Oct 2026 07:28:00 GMT'}) is None
+    assert retry_after(None) is None
+
+
+def test_telemetry_entry():
+    telemetry = {'distance': [{'ts': 1, 'value': '5.2'}]}
+    assert telemetry_entry(DEVICE, telemetry) == {
+        'device': {'id': DEVICE['id'], 'name': DEVICE['name'], 'type': 'DF555'},
+        'telemetry': telemetry,
+    }
+    assert telemetry_entry(DEVICE, {'distance': []}) is None
+    assert telemetry_entry(DEVICE, {}) is None
+    assert telemetry_entry({'name': 'no id'}, telemetry) is None
+
+
+def test_post_batch(api, monkeypatch):
+    monkeypatch.setattr(dingtek_cloud, 'BACKOFF_MIN', 0.01)
+    statuses = iter([503, 200])
+    api.respond = lambda method, body: next(statuses)
+    pool = HttpPool(api.url, size=1)
+    try:
+        assert post_batch(pool, [{'device': DEVICE}])['accepted'] == 0
+        assert [(path, status) for _, path, _, status in api.requests] == [(TELEMETRY_PATH, 503), (TELEMETRY_PATH, 200)]
+
+        # Validation errors are not retried
+        api.respond = lambda method, body: 422
+        assert post_batch(pool, [{'device': DEVICE}]) is None
+        assert len(api.requests) == 3
+    finally:
+        pool.close()
+
+
+def test_sync_posts_every_device_in_batches(api, cloud):
+    client = client_for(cloud)
+    pool = HttpPool(api.url, size=1)
+    try:
+        results = sync_devices(client, pool, concurrency=4, page_size=10, batch_size=10)
+    finally:
+        pool.close()
+        client.close()
+
+    assert results['devices'] == results['synced'] == results['posted'] == 25
+    assert results['batches'] == 3
+    assert results['failed'] == results['post_failed'] == 0
+    posted = [entry for _, _, body, _ in api.requests for entry in body['devices']]
+    assert sorted(entry['device']['name'] for entry in posted) == sorted(d['name'] for d in cloud.devices)
+    assert set(posted[0]['telemetry']) == {'distance', 'temperature', 'volt', 'rsrp'}
+    # One login for the whole run
+    assert client.stats['logins'] == cloud.stats['logins'] == 1
+
+
+def test_dry_run_posts_nothing(cloud):
+    client = client_for(cloud)
+    try:
+        results = sync_devices(client, None, concurrency=2, page_size=10)
+    finally:
+        client.close()
+    assert results['synced'] == 25
+    assert results['batches'] == 1
+
+
+def test_cached_token_is_reused_until_rejected(cloud, tmp_path):
+    cache = str(tmp_path / 'token.json')
+    with open(cache, 'w') as f:
+        json.dump({'base_url': cloud.url, 'username': 'user', 'token': 'revoked',
+                   'expires_at': time.time() + 3600}, f)
+
+    client = client_for(cloud, token_cache=cache)
+    try:
+        assert client.get_telemetry(cloud.devices[0]['id']['id'])['distance']
+    finally:
+        client.close()
+
+    assert cloud.stats['unauthorized'] == 1
+    assert client.stats['logins'] == 1
+    with open(cache) as f:
+        assert json.load(f)['token'] in cloud._tokens
+
+    # The next run starts with the refreshed token
+    client = client_for(cloud, token_cache=cache)
+    try:
+        client.get_telemetry(cloud.devices[1]['id']['id'])
+    finally:
+        client.close()
+    assert client.stats['logins'] == 0
+
+
+def test_history_is_paged_back_to_the_start(cloud):
+    client = client_for(cloud)
+    device_id = cloud.devices[0]['id']['id']
+    end = 1699999200000  # on the hour
+    try:
+        pages = list(client.iter_history(device_id, end - 5 * 3600000, end, keys='distance', limit=2))
+    finally:
+        client.close()
+
+    timestamps = [point['ts'] for page in pages for point in page['distance']]
+    assert len(pages) == 3
+    assert timestamps == sorted(set(timestamps), reverse=True)
+    assert len(timestamps) == 6
@@ -0,0 +1,80 @@
+import asyncio
+
+from df555.firebase import FirebasePublisher, StubDatabase, latest_reading
+
+TANKS = [
+    {'id': 1, 'name': 'North', 'imei': '868000000000001', 'height_mm': 2000},
+    {'id': 2, 'name': 'South', 'imei': '868000000000002', 'height_mm': 2000},
+]
+
+
+def reading(imei, distance, timestamp):
+    return {'imei': imei, 'distance': distance, 'timestamp': timestamp, 'temperature': 20}
+
+
+def test_latest_state_is_coalesced():
+    async def run():
+        database = StubDatabase(latency=(0, 0))
+        publisher = FirebasePublisher(database, TANKS, interval=0.01)
+        publisher.start()
+        for i in range(10):
+            publisher.publish(reading('868000000000001', 1.0 + i / 10, 1700000000 + i))
+        publisher.publish(reading('868000000000002', 0.5, 1700000000))
+        await publisher.stop()
+        return database, publisher
+
+    database, publisher = asyncio.run(run())
+    assert database.get('tanks/1/latest_reading/distance_mm') == 1900
+    assert database.get('tanks/1/latest_reading/water_level_percentage') == 5.0
+    assert database.get('tanks/1/name') == 'North'
+    assert database.get('tanks/2/latest_reading/water_level_mm') == 1500
+    assert publisher.stats['coalesced'] > 0
+    assert database.updates < 11
+
+
+def test_stale_and_unknown_readings_are_skipped():
+    publisher = FirebasePublisher(StubDatabase(latency=(0, 0)), TANKS)
+    assert publisher.publish(reading('868000000000001', 1.0, 1700000100))
+    assert not publisher.publish(reading('868000000000001', 1.2, 1700000000))
+    assert not publisher.publish(reading('868000000000009', 1.0, 1700000100))
+    assert publisher.stats['stale'] == 1
+
+
+def test_reload_republishes_changed_tanks():
+    publisher = FirebasePublisher(StubDatabase(latency=(0, 0)), TANKS)
+    publisher.publish(reading('868000000000001', 1.0, 1700000000))
+    publisher.publish(reading('868000000000002', 1.0, 1700000000))
+    publisher._pending.clear()
+
+    publisher.load_tanks([dict(TANKS[0], name='North (renamed)'), TANKS[1]])
+    publisher.publish(reading('868000000000001', 1.0, 1700000001))
+    publisher.publish(reading('868000000000002', 1.0, 1700000001))
+
+    assert publisher._pending['tanks/1/name'] == 'North (renamed)'
+    assert 'tanks/2/name' not in publisher._pending
+
+
+def test_nodes_match_sync_with_firebase():
+    tank = dict(TANKS[0], sensor_id=7, sensor_status='active')
+    parsed = {'imei': '868000000000001', 'device_id': '1868000000000001', 'distance': 0.5,
+              'temperature': 21, 'battery_voltage_mv': 3600, 'timestamp': 1700000000}
+
+    node = latest_reading(parsed, tank, 42)
+    # Same keys as SensorController::syncWithFirebase, battery as 3.7 V * battery %
+    assert sorted(node) == sorted(['id', 'distance_mm', 'water_level_mm', 'water_level_percentage',
+                                   'temperature', 'battery_voltage', 'timestamp'])
+    assert node['id'] == 42
+    assert node['battery_voltage'] == 1.85
+
+    publisher = FirebasePublisher(StubDatabase(latency=(0, 0)), [tank])
+    assert publisher.publish(parsed, 42)
+    assert publisher._pending['tanks/1/sensor'] == {'id': 7, 'device_id': '1868000000000001', 'status': 'active'}
+    assert publisher._pending['tanks/1/latest_reading']['id'] == 42
+
+
+def test_covers_only_published_readings():
+    publisher = FirebasePublisher(StubDatabase(latency=(0, 0)), TANKS)
+    assert publisher.covers(reading('868000000000001', 1.0, 1700000100))
+    assert not publisher.covers(reading('868000000000009', 1.0, 1700000100))
+    publisher.publish(reading('868000000000001', 1.0, 1700000100))
+    assert not publisher.covers(reading('868000000000001', 1.0, 1700000000))
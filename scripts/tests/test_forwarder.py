@@ -0,0 +1,91 @@
+import asyncio
+import http.client
+
+import pytest
+
+from df555.forwarder import BULK_PATH, BatchForwarder, ForwardError, HttpPool
+
+
+@pytest.mark.parametrize('status, permanent', [
+    (400, True), (404, True), (422, True),
+    (408, False), (429, False), (500, False), (503, False), (None, False),
+])
+def test_permanent_errors(status, permanent):
+    assert ForwardError('failed', status).permanent is permanent
+
+
+def test_post_is_not_resent(api):
+    """A POST the server may have received is never sent again"""
+    statuses = iter([200, None])
+    api.respond = lambda method, body: next(statuses, 200)
+    pool = HttpPool(api.url, size=1)
+    try:
+        assert pool.post_json(BULK_PATH, {'readings': [{'n': 1}]})[0] == 200
+        with pytest.raises((http.client.HTTPException, ConnectionError)):
+            pool.post_json(BULK_PATH, {'readings': [{'n': 2}]})
+        assert [body for _, _, body, _ in api.requests] == [{'readings': [{'n': 1}]}, {'readings': [{'n': 2}]}]
+
+        # The pool recovers with a new connection
+        assert pool.post_json(BULK_PATH, {'readings': [{'n': 3}]})[0] == 200
+    finally:
+        pool.close()
+
+
+def test_get_is_retried_on_a_new_connection(api):
+    statuses = iter([200, None])
+    api.respond = lambda method, body: next(statuses, 200)
+    pool = HttpPool(api.url, size=1)
+    try:
+        assert pool.request('GET', '/status')[0] == 200
+        assert pool.request('GET', '/status')[0] == 200
+        assert [status for _, _, _, status in api.requests] == [200, None, 200]
+    finally:
+        pool.close()
+
+
+def run_forwarder(api, readings, **options):
+    async def run():
+        forwarder = BatchForwarder(HttpPool(api.url), max_delay=0.01, **options)
+        forwarder.start()
+        for reading in readings:
+            forwarder.submit(reading)
+        await forwarder.stop()
+        forwarder.pool.close()
+        return forwarder
+    return asyncio.run(run())
+
+
+def test_batches_and_fields(api):
+    forwarder = run_forwarder(api, [{'n': i} for i in range(25)], max_batch=10,
+                              fields={'sync_firebase': False})
+
+    assert sorted(len(body['readings']) for _, _, body, _ in api.requests) == [5, 10, 10]
+    assert all(body['sync_firebase'] is False for _, _, body, _ in api.requests)
+    assert sorted(r['n'] for r in api.readings) == list(range(25))
+    assert forwarder.stats['forwarded'] == 25
+    assert forwarder.stats['batches'] == 3
+    assert forwarder.pending == 0
+
+
+def test_accepted_batches_are_reported_with_their_contexts(api):
+    delivered = []
+    async def run():
+        forwarder = BatchForwarder(HttpPool(api.url), max_delay=0.01,
+                                   on_delivered=lambda contexts, response: delivered.append((contexts, response['ids'])))
+        forwarder.start()
+        for i in range(3):
+            forwarder.submit({'n': i}, f'reading {i}')
+        await forwarder.stop()
+        forwarder.pool.close()
+    asyncio.run(run())
+
+    assert delivered == [(['reading 0', 'reading 1', 'reading 2'], [1, 2, 3])]
+
+
+def test_failed_batches_are_counted_as_dropped(api):
+    api.respond = lambda method, body: 500
+    forwarder = run_forwarder(api, [{'n': i} for i in range(3)])
+
+    assert forwarder.stats['failed'] == 3
+    assert forwarder.stats['dropped'] == 3
+    assert forwarder.stats['forwarded'] == 0
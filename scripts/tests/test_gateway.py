@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+from df555 import gateway, protocol
+from df555.gateway import REJECTED_FILE, SensorGateway, stored_readings, to_ingest_payload
+from df555.spool import Spool
+
+from conftest import DEVICE_ID
+
+
+def spool_reports(directory, frames):
+    """Spool frames like handle_connection does, then drop the spool without closing it"""
+    spool = Spool(directory)
+    for frame in frames:
+        spool.append(b'127.0.0.1\n' + frame)
+    spool.flush()
+
+
+def drain(sensor_gateway, timeout=10.0):
+    """Run the spool drain until everything spooled was delivered or rejected"""
+    async def run():
+        task = asyncio.create_task(sensor_gateway._drain())
+        deadline = time.monotonic() + timeout
+        while sensor_gateway.spool.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    try:
+        asyncio.run(run())
+    finally:
+        sensor_gateway.pool.close()
+        sensor_gateway.spool.close()
+
+
+def make_gateway(api, spool_dir, **options):
+    return SensorGateway(api_url=api.url, spool_dir=str(spool_dir), max_delay=0.01, **options)
+
+
+def test_spooled_reports_replayed_after_restart(api, report, tmp_path):
+    frames = [report(1000 + i, f'1868000000000{i:03d}', frame_count=i) for i in range(25)]
+    spool_reports(str(tmp_path), frames)
+
+    sensor_gateway = make_gateway(api, tmp_path, max_batch=10)
+    assert sensor_gateway.spool.pending == 25
+    drain(sensor_gateway)
+
+    assert sorted(r['height_mm'] for r in api.readings) == [1000 + i for i in range(25)]
+    assert all(len(body['readings']) <= 10 for _, _, body, _ in api.requests)
+    # The cursor was committed: nothing is replayed a second time
+    assert Spool(str(tmp_path)).pending == 0
+
+
+def test_server_errors_are_retried(api, report, tmp_path, monkeypatch):
+    monkeypatch.setattr(gateway, 'RETRY_MIN', 0.01)
+    statuses = iter([503, 500])
+    api.respond = lambda method, body: next(statuses, 200)
+    spool_reports(str(tmp_path), [report(frame_count=i) for i in range(3)])
+
+    sensor_gateway = make_gateway(api, tmp_path)
+    drain(sensor_gateway)
+
+    assert [status for _, _, _, status in api.requests] == [503, 500, 200]
+    assert len(api.readings) == 3
+    assert sensor_gateway.stats['rejected'] == 0
+    assert not os.path.exists(os.path.join(tmp_path, REJECTED_FILE))
+
+
+@pytest.mark.parametrize('status', [400, 422])
+def test_rejected_readings_are_dead_lettered(api, report, tmp_path, status):
+    bad = '1868000000000013'
+    api.respond = lambda method, body: status if any(r['device_id'] == bad for r in body['readings']) else 200
+    frames = [report(1000 + i, f'1868000000000{i:03d}', frame_count=i) for i in range(20)]
+    spool_reports(str(tmp_path), frames)
+
+    sensor_gateway = make_gateway(api, tmp_path)
+    drain(sensor_gateway)
+
+    assert sorted(r['device_id'] for r in api.readings) == sorted(
+        f'1868000000000{i:03d}' for i in range(20) if i != 13)
+    assert sensor_gateway.stats['rejected'] == 1
+    with open(os.path.join(tmp_path, REJECTED_FILE)) as f:
+        rejected = [json.loads(line) for line in f]
+    assert len(rejected) == 1
+    assert rejected[0]['status'] == status
+    assert rejected[0]['reading']['device_id'] == bad
+    assert bytes.fromhex(rejected[0]['hex']) == frames[13]
+    assert Spool(str(tmp_path)).pending == 0
+
+
+def test_duplicates_are_not_forwarded(api, report, tmp_path):
+    frame = report(frame_count=7)
+    spool_reports(str(tmp_path), [frame, frame, report(frame_count=8)])
+
+    sensor_gateway = make_gateway(api, tmp_path)
+    drain(sensor_gateway)
+
+    assert [r['frame_count'] for r in api.readings] == [7, 8]
+
+
+def test_shared_dedup_sends_report_keys(api, report, tmp_path):
+    spool_reports(str(tmp_path), [report(frame_count=7), b'SENSOR1,1500\r\n'])
+
+    sensor_gateway = make_gateway(api, tmp_path, shared_dedup=True)
+    drain(sensor_gateway)
+
+    assert [r.get('report_key') for r in api.readings] == [f'{DEVICE_ID}:7:1700000000', None]
+
+
+def test_readings_the_api_did_not_store_are_not_analyzed():
+    assert stored_readings(['a', 'b', 'c'], {'ids': ['id-1', None, 'id-3']}) == [('a', 'id-1'), ('c', 'id-3')]
+    assert stored_readings(['a', 'b'], {'accepted': 2}) == [('a', None), ('b', None)]
+
+
+def write_tanks(directory):
+    path = os.path.join(directory, 'tanks.json')
+    with open(path, 'w') as f:
+        json.dump([{'id': 1, 'name': 'North', 'imei': '868000000000001', 'height_mm': 2000}], f)
+    return path
+
+
+def test_firebase_publishes_accepted_readings_of_known_tanks(api, report, tmp_path):
+    spool_reports(str(tmp_path), [report(1000, '1868000000000001'), report(1000, '1868000000000002')])
+
+    sensor_gateway = make_gateway(api, tmp_path, tanks=write_tanks(str(tmp_path)), firebase='stub')
+    drain(sensor_gateway)
+
+    # Only the reading the gateway publishes skips the API's own sync
+    assert {r['device_id']: r.get('sync_firebase') for r in api.readings} == {
+        '1868000000000001': False, '1868000000000002': None,
+    }
+    pending = sensor_gateway.firebase._pending
+    assert pending['tanks/1/latest_reading']['id'] == 1
+    assert pending['tanks/1/latest_reading']['water_level_mm'] == 1000
+    assert not any(path.startswith('tanks/2/') for path in pending)
+
+
+def test_readings_are_analyzed_once_accepted(api, report, tmp_path):
+    async def run():
+        sensor_gateway = SensorGateway(api_url=api.url, max_delay=0.01, tanks=write_tanks(str(tmp_path)),
+                                       firebase='stub')
+        sensor_gateway.forwarder.start()
+        sensor_gateway.forward(protocol.parse_frame(report(1000, '1868000000000001')))
+        assert sensor_gateway.firebase.pending == 0
+        await sensor_gateway.forwarder.stop()
+        sensor_gateway.pool.close()
+        return sensor_gateway
+
+    sensor_gateway = asyncio.run(run())
+    assert api.readings[0]['sync_firebase'] is False
+    assert sensor_gateway.firebase._pending['tanks/1/latest_reading']['id'] == 1
+
+
+def test_firebase_needs_tanks(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['gateway', '--firebase', 'stub'])
+    with pytest.raises(SystemExit):
+        gateway.main()
+    assert '--firebase needs --tanks' in capsys.readouterr().err
+
+
+def test_ascii_report_sends_no_nulls(api, tmp_path):
+    spool_reports(str(tmp_path), [b'SENSOR1,1500\r\n'])
+
+    sensor_gateway = make_gateway(api, tmp_path)
+    drain(sensor_gateway)
+
+    assert api.readings == [{'device_id': 'SENSOR1', 'distance': 1.5}]
+
+
+class TestIngestPayload:
+    def test_binary_report(self, report):
+        payload = to_ingest_payload(protocol.parse_frame(report(battery_mv=3600)))
+        assert payload['device_id'] == DEVICE_ID
+        assert payload['battery'] == 50.0
+        assert payload['timestamp'] == '2023-11-14T22:13:20Z'
+        assert payload['unix_timestamp'] == 1700000000
+        assert None not in payload.values()
+
+    def test_rsrp_is_sent_as_rssi(self, report):
+        payload = to_ingest_payload(protocol.parse_frame(report()))
+        assert payload['rssi'] == -90
+        assert payload['rsrp'] == -90.0
+
+    @pytest.mark.parametrize('battery_mv, percent', [(2500, 0.0), (3000, 0.0), (4200, 100.0), (4500, 100.0)])
+    def test_battery_is_clamped(self, report, battery_mv, percent):
+        assert to_ingest_payload(protocol.parse_frame(report(battery_mv=battery_mv)))['battery'] == percent
+
+    def test_missing_ascii_fields_are_left_out(self):
+        payload = to_ingest_payload(protocol.parse_ascii(b'SENSOR1,1500'))
+        assert payload == {'device_id': 'SENSOR1', 'distance': 1.5}
+
+    def test_ascii_battery_level(self):
+        payload = to_ingest_payload(protocol.parse_ascii(b'device=X;distance=1200;battery=80'))
+        assert payload['battery'] == 80
@@ -0,0 +1,90 @@
+import pytest
+
+from df555 import protocol
+from df555.emulator import DEFAULT_PARAMS, dump_params
+from df555.inventory import Inventory, plan
+
+from conftest import IMEI
+
+SERVER1 = '66.241.124.67;8888;'
+BATCH = [
+    ('Server 1', protocol.CMD_SET_SERVER1, SERVER1),
+    ('Server mode', protocol.CMD_SWITCH_FUNCTION, '02'),
+]
+
+
+@pytest.fixture
+def inventory():
+    with Inventory(':memory:') as inventory:
+        yield inventory
+
+
+def test_desired_settings_are_pending_until_confirmed(inventory):
+    inventory.set_desired(IMEI, {'server1': SERVER1, 'server_mode': '02'})
+    assert inventory.pending(IMEI) == {'server1': SERVER1, 'server_mode': '02'}
+
+    inventory.record(IMEI, protocol.build_command(protocol.CMD_SET_SERVER1, SERVER1), b'Server1:OK\r\n', True)
+    assert inventory.pending(IMEI) == {'server_mode': '02'}
+    assert inventory.settings(IMEI)['server1']['confirmed'] == SERVER1
+
+    # A failed command is logged but confirms nothing
+    inventory.record(IMEI, protocol.build_command(protocol.CMD_SWITCH_FUNCTION, '02'), b'Command error\r\n', False)
+    assert inventory.pending(IMEI) == {'server_mode': '02'}
+    assert [entry['ok'] for entry in inventory.history(IMEI)] == [0, 1]
+
+
+def test_query_reply_confirms_every_reported_setting(inventory):
+    params = dict(DEFAULT_PARAMS, server1=SERVER1, server_mode='02')
+    query = protocol.build_command(protocol.CMD_SET_SERVER1, command_type=protocol.COMMAND_TYPE_QUERY)
+    inventory.set_desired(IMEI, {'server1': SERVER1})
+
+    inventory.record(IMEI, query, dump_params(params), True, session='/dev/ttyUSB0')
+
+    settings = inventory.settings(IMEI)
+    assert {key: setting['confirmed'] for key, setting in settings.items()} == {
+        'server1': SERVER1, 'server2': DEFAULT_PARAMS['server2'], 'server_mode': '02',
+    }
+    assert inventory.pending(IMEI) == {}
+    entry = inventory.history(IMEI)[0]
+    assert entry['session'] == '/dev/ttyUSB0'
+    assert entry['key'] is None
+
+
+def test_plan_sends_only_unconfirmed_settings(inventory):
+    to_send, skipped = plan(inventory, IMEI, BATCH)
+    assert (to_send, skipped) == (BATCH, [])
+
+    inventory.record(IMEI, protocol.build_command(protocol.CMD_SET_SERVER1, SERVER1), b'Server1:OK\r\n', True)
+    to_send, skipped = plan(inventory, IMEI, BATCH)
+    assert to_send == BATCH[1:]
+    assert skipped == BATCH[:1]
+
+    assert plan(inventory, IMEI, BATCH, force=True) == (BATCH, [])
+
+
+def test_devices_count_pending_settings(inventory):
+    inventory.set_desired(IMEI, {'server1': SERVER1, 'server_mode': '02'})
+    inventory.record('868000000000002', protocol.build_command(protocol.CMD_SWITCH_FUNCTION, '01'), b'OK\r\n', True)
+
+    devices = {device['imei']: device for device in inventory.devices()}
+    assert devices[IMEI]['pending'] == 2
+    assert devices[IMEI]['last_session'] is None
+    assert devices['868000000000002']['pending'] == 0
+    assert devices['868000000000002']['last_session'] is not None
+
+
+def test_history_is_newest_first_and_limited(inventory):
+    for mode in ('00', '01', '02'):
+        inventory.record(IMEI, protocol.build_command(protocol.CMD_SWITCH_FUNCTION, mode), 'OK', True)
+
+    history = inventory.history(IMEI, limit=2)
+    assert [entry['value'] for entry in history] == ['02', '01']
+    assert inventory.settings(IMEI)['server_mode']['confirmed'] == '02'
+
+
+def test_database_file_persists(tmp_path):
+    path = str(tmp_path / 'nested' / 'inventory.db')
+    with Inventory(path) as inventory:
+        inventory.set_desired(IMEI, {'server1': SERVER1})
+    with Inventory(path) as inventory:
+        assert inventory.pending(IMEI) == {'server1': SERVER1}
@@ -0,0 +1,67 @@
+import urllib.request
+
+import pytest
+
+from df555.gateway import SensorGateway
+from df555.metrics import Registry, merge_states, render, start_http_server
+
+
+def worker_state(reports, seconds):
+    registry = Registry()
+    registry.counter('df555_reports_total', 'Reports', function=lambda: reports)
+    registry.gauge('df555_open_connections', 'Connections').set(2)
+    stage = registry.histogram('df555_stage_seconds', 'Stages', labels=('stage',), buckets=(0.01, 0.1))
+    for value in seconds:
+        stage.observe(value, 'parse')
+    return registry.state()
+
+
+def test_render_histogram_is_cumulative():
+    text = render(worker_state(5, [0.005, 0.05, 0.5]))
+    assert 'df555_reports_total 5' in text
+    assert 'df555_stage_seconds_bucket{stage="parse",le="0.01"} 1' in text
+    assert 'df555_stage_seconds_bucket{stage="parse",le="0.1"} 2' in text
+    assert 'df555_stage_seconds_bucket{stage="parse",le="+Inf"} 3' in text
+    assert 'df555_stage_seconds_count{stage="parse"} 3' in text
+
+
+def test_merge_states():
+    merged = merge_states([worker_state(5, [0.005]), worker_state(3, [0.5])])
+    assert merged['df555_reports_total']['values'] == {(): 8}
+    assert merged['df555_open_connections']['values'] == {(): 4}
+    assert merged['df555_stage_seconds']['values'][('parse',)] == ([1, 0, 1], 0.505)
+
+    # Exited workers keep their counters but not their gauges
+    assert 'df555_open_connections' not in merge_states([worker_state(5, [])], gauges=False)
+
+
+def test_registry_rejects_a_name_of_another_type():
+    registry = Registry()
+    registry.counter('df555_x', 'x')
+    with pytest.raises(ValueError):
+        registry.gauge('df555_x', 'x')
+
+
+def test_endpoint_is_local_by_default():
+    server = start_http_server(lambda: 'df555_up 1\n', port=0)
+    try:
+        assert server.server_address[0] == '127.0.0.1'
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.server_port}/metrics') as response:
+            assert response.read() == b'df555_up 1\n'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize('data, reason', [
+    (b'\x00\x01\x02\x03', 'bad_head'),
+    (b'\xff\xfe\x81', 'bad_head'),
+    (b'hello\r\n', 'unrecognized'),
+])
+def test_parse_failures_by_reason(data, reason):
+    sensor_gateway = SensorGateway()
+    try:
+        assert sensor_gateway.process(data, '127.0.0.1') is None
+        assert sensor_gateway.parse_failures.state()['values'] == {(reason,): 1}
+    finally:
+        sensor_gateway.pool.close()
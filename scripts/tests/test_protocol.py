@@ -0,0 +1,169 @@
+import struct
+
+import pytest
+
+from df555 import protocol
+from df555.emulator import DEFAULT_PARAMS, apply_command
+
+from conftest import DEVICE_ID, IMEI
+
+
+def test_report_round_trip(report):
+    frame = report(1234, temperature=21, status=protocol.STATUS_FULL | protocol.STATUS_POWER,
+                   battery_mv=3650, rsrp=-95.5, frame_count=70000, report_type=protocol.REPORT_TRIGGER)
+    parsed = protocol.parse_frame(frame)
+
+    assert len(frame) == protocol.FRAME_SIZE
+    assert parsed['height_mm'] == 1234
+    assert parsed['distance'] == pytest.approx(1.234)
+    assert parsed['has_gps'] is False
+    assert parsed['temperature'] == 21
+    assert (parsed['status_full'], parsed['status_fire'], parsed['status_power']) == (1, 0, 1)
+    assert parsed['battery_voltage_mv'] == 3650
+    assert parsed['rsrp'] == pytest.approx(-95.5)
+    assert parsed['frame_count'] == 70000 & 0xFFFF
+    assert parsed['timestamp'] == 1700000000
+    assert parsed['device_id'] == DEVICE_ID
+    assert parsed['imei'] == IMEI
+    assert parsed['report_type_name'] == protocol.report_type_name(protocol.REPORT_TRIGGER)
+
+
+def test_floats_are_big_endian(report):
+    frame = report(1000, rsrp=-95.5)
+    # rsrp follows height, GPS selection, temperature, status and battery
+    offset = protocol.HEADER_SIZE + 2 + 1 + 1 + 2 + 2
+    assert frame[offset:offset + 4] == struct.pack('>f', -95.5)
+
+
+def test_report_round_trip_with_gps(report):
+    frame = report(800, gps=(36.8219, -1.2921))
+    parsed = protocol.parse_frame(frame)
+
+    assert len(frame) == protocol.FRAME_SIZE_GPS
+    assert parsed['has_gps'] is True
+    assert parsed['longitude'] == pytest.approx(36.8219, abs=1e-5)
+    assert parsed['latitude'] == pytest.approx(-1.2921, abs=1e-5)
+    assert parsed['height_mm'] == 800
+    assert parsed['device_id'] == DEVICE_ID
+
+
+@pytest.mark.parametrize('mangle, reason', [
+    (lambda frame: frame[:3], 'too_short'),
+    (lambda frame: b'\x00' + frame[1:], 'bad_head'),
+    (lambda frame: frame[:-1] + b'\x00', 'bad_tail'),
+    (lambda frame: frame[:12] + b'\x81', 'truncated'),
+])
+def test_parse_frame_errors(report, mangle, reason):
+    with pytest.raises(protocol.FrameError) as error:
+        protocol.parse_frame(mangle(report()))
+    assert error.value.reason == reason
+
+
+def test_parse_frame_rejects_command_replies(report):
+    with pytest.raises(protocol.FrameError) as error:
+        protocol.parse_frame(report(report_type=protocol.REPORT_COMMAND_REPLY))
+    assert error.value.reason == 'unsupported_report_type'
+
+
+def test_decode_report_ascii():
+    assert protocol.decode_report(b'SENSOR1,1500,22.5,80,-70\r\n') == {
+        'device_id': 'SENSOR1',
+        'distance': 1.5,
+        'temperature': 22.5,
+        'battery_level': 80,
+        'rssi': -70,
+    }
+    parsed = protocol.decode_report(b'device=ABC;distance=1200;temp=19')
+    assert parsed == {'device_id': 'ABC', 'distance': 1.2, 'temperature': 19.0}
+
+    with pytest.raises(protocol.FrameError) as error:
+        protocol.decode_report(b'hello')
+    assert error.value.reason == 'unrecognized'
+
+
+def test_build_commands():
+    assert protocol.build_server_command(1, 'example.com', 8888) == '8002999906example.com;8888;81'
+    assert protocol.build_server_command(2, '10.0.0.1', 443) == '800299990710.0.0.1;443;81'
+    assert protocol.build_command(protocol.CMD_SET_SERVER1, command_type=protocol.COMMAND_TYPE_QUERY) == \
+        '800199990681'
+
+
+@pytest.mark.parametrize('reply, expected', [
+    ('', None),
+    ('Server1:example.com;8888;OK', True),
+    ('Server1:example.com;8888;', True),
+    ('OK', True),
+    ('Password error', False),
+    ('Command error', False),
+    ('unrelated', None),
+])
+def test_check_reply_configure(reply, expected):
+    assert protocol.check_reply(protocol.build_server_command(1, 'example.com', 8888), reply) is expected
+
+
+def test_check_reply_query_and_reset():
+    query = protocol.build_command(protocol.CMD_SET_SERVER1, command_type=protocol.COMMAND_TYPE_QUERY)
+    reset = protocol.build_command(protocol.CMD_SET_SERVER1, command_type=protocol.COMMAND_TYPE_RESET)
+    assert protocol.check_reply(query, 'Server1:a;1;\r\n') is None
+    assert protocol.check_reply(query, 'Server1:a;1;\r\nOK\r\n') is True
+    assert protocol.check_reply(reset, 'Reset OK\r\n') is True
+
+
+def test_configure_then_query_round_trip():
+    params = dict(DEFAULT_PARAMS, imei=IMEI)
+    for command in (protocol.build_server_command(1, 'example.com', 8888),
+                    protocol.build_server_command(2, '10.0.0.1', 443),
+                    protocol.build_command(protocol.CMD_SWITCH_FUNCTION, '02')):
+        assert protocol.check_reply(command, apply_command(params, command).decode()) is True
+
+    query = protocol.build_command(protocol.CMD_SET_SERVER1, command_type=protocol.COMMAND_TYPE_QUERY)
+    reader = protocol.ParamReader()
+    dump = apply_command(params, query)
+    # Bytes arrive one at a time; the reader completes on the final line
+    done = [reader.feed(dump[i:i + 1]) for i in range(len(dump))]
+    assert done.index(True) >= len(dump) - 3
+
+    read_back = reader.params
+    assert read_back.server1 == ('example.com', 8888)
+    assert read_back.server2 == ('10.0.0.1', 443)
+    assert read_back.server_mode == '02'
+    assert read_back.imei == IMEI
+    assert read_back.content('server1') == 'example.com;8888;'
+
+
+def test_parse_params_error_reply():
+    assert protocol.parse_params(b'Password error\r\n') is None
+    assert protocol.parse_params(b'Server1:a;1;\r\n') is None
+
+
+class TestStreamFramer:
+    def test_any_split(self, report):
+        frames = [report(1000, frame_count=1), report(2000, frame_count=2, gps=(1.0, 2.0))]
+        stream = b''.join(frames)
+        for split in range(len(stream) + 1):
+            framer = protocol.StreamFramer()
+            received = framer.feed(stream[:split]) + framer.feed(stream[split:])
+            assert received == frames
+            assert framer.buffered == 0
+            assert not framer.raw
+
+    def test_tail_byte_inside_payload(self, report):
+        frame = report(0x8181, rsrp=-1.0)
+        assert frame.count(protocol.PACKET_TAIL) > 1
+        framer = protocol.StreamFramer()
+        assert framer.feed(frame[:7]) == []
+        assert framer.feed(frame[7:]) == [frame]
+
+    def test_ascii_goes_raw(self):
+        framer = protocol.StreamFramer()
+        assert framer.feed(b'SENSOR1,1500') == []
+        assert framer.feed(b',22\r\n') == []
+        assert framer.raw
+        assert framer.flush() == b'SENSOR1,1500,22\r\n'
+
+    def test_bad_tail_goes_raw(self, report):
+        frame = report()
+        framer = protocol.StreamFramer()
+        assert framer.feed(frame[:-1] + b'\x00') == []
+        assert framer.raw
+        assert len(framer.flush()) == len(frame)
@@ -0,0 +1,119 @@
+import asyncio
+import socket
+
+import pytest
+
+from df555.forwarder import BULK_PATH
+from df555.replay import (
+    HttpTarget, Replayer, TcpTarget, capture_info, extract, log_time, read_capture, write_capture,
+)
+
+from conftest import DEVICE_ID
+
+DEVICE_2 = '1868000000000002'
+
+
+def log_line(when, frame):
+    return f'[{when}] production.INFO: Sensor data received {{"hex_data":"{frame.hex()}"}}\n'
+
+
+def test_log_time():
+    assert log_time('[2023-11-14 22:13:20] production.INFO: ...') == 1700000000
+    assert log_time('2023-11-14 22:13:20,250 INFO df555.gateway ...') == 1700000000.25
+    assert log_time('no time here') is None
+
+
+def test_extract_merges_logs_by_arrival(tmp_path, report):
+    first = tmp_path / 'laravel-2023-11-14.log'
+    second = tmp_path / 'laravel-2023-11-15.log'
+    first.write_text(log_line('2023-11-14 23:59:59', report(frame_count=1))
+                     + 'unrelated line\n'
+                     + log_line('2023-11-15 00:00:00', report(device_id=DEVICE_2, frame_count=2)))
+    second.write_text(log_line('2023-11-15 00:00:00', report(frame_count=3)))
+    capture = str(tmp_path / 'traffic.df5r')
+
+    assert extract(capture, [str(second), str(first)]) == 3
+
+    records = list(read_capture(capture))
+    assert [arrival for arrival, _ in records] == [1700006399.0, 1700006400.0, 1700006400.0]
+    assert records[0][1] == report(frame_count=1)
+    assert {records[1][1], records[2][1]} == {report(device_id=DEVICE_2, frame_count=2), report(frame_count=3)}
+
+    info = capture_info(capture)
+    assert info['frames'] == 3
+    assert info['devices'] == 2
+    assert info['span'] == 1.0
+    assert info['peak_rate'] == 2
+
+
+def test_out_of_order_record_gets_a_zero_gap(tmp_path):
+    capture = str(tmp_path / 'traffic.df5r')
+    write_capture(capture, [(10.0, b'a'), (9.5, b'b'), (10.25, b'c')])
+    assert list(read_capture(capture)) == [(10.0, b'a'), (10.0, b'b'), (10.25, b'c')]
+
+
+def test_read_capture_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.df5r'
+    path.write_bytes(b'DF5A' + bytes(16))
+    with pytest.raises(ValueError):
+        list(read_capture(str(path)))
+
+
+def replay(target, records, **options):
+    try:
+        return asyncio.run(Replayer(target, **options).run(records))
+    finally:
+        target.close()
+
+
+def test_http_replay_keeps_per_device_order(api, report):
+    records = [(i * 0.001, report(device_id=DEVICE_ID if i % 2 else DEVICE_2, frame_count=i)) for i in range(20)]
+    records.append((0.02, b'\x80\x01\x02'))
+
+    summary = replay(HttpTarget(api.url, concurrency=4), records, speed=0, concurrency=4)
+
+    assert summary['sent'] == 21
+    assert summary['acked'] == 20
+    assert summary['failures'] == {'undecodable': 1}
+    assert summary['devices'] == 2
+    assert all(path == BULK_PATH for _, path, _, _ in api.requests)
+    for device_id in (DEVICE_ID, DEVICE_2):
+        counts = [r['frame_count'] for r in api.readings if r['device_id'] == device_id]
+        assert counts == sorted(counts) and len(counts) == 10
+
+
+def test_http_errors_are_counted_by_status(api, report):
+    api.respond = lambda method, body: 422
+    summary = replay(HttpTarget(api.url, concurrency=1), [(0.0, report())], speed=0)
+    assert summary['failures'] == {'http_422': 1}
+    assert summary['acked'] == 0
+
+
+def test_tcp_replay_waits_for_acks(report):
+    received = []
+
+    async def run():
+        async def handle(reader, writer):
+            received.append(await reader.read(1024))
+            writer.write(b'OK\r\n')
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            records = [(i * 0.01, report(frame_count=i)) for i in range(3)]
+            return await Replayer(TcpTarget('127.0.0.1', port), speed=10).run(records)
+
+    summary = asyncio.run(run())
+    assert summary['acked'] == 3
+    assert received == [report(frame_count=i) for i in range(3)]
+    assert summary['lag_ms']['max'] is not None
+
+
+def test_tcp_connect_failures():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    summary = replay(TcpTarget('127.0.0.1', port, timeout=1.0), [(0.0, b'SENSOR1,1500\x81')], speed=0)
+    assert summary['failures'] == {'connect': 1}
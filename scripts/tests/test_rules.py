@@ -0,0 +1,83 @@
+import pytest
+
+from df555.rules import RuleEngine, RuleError, CompiledRule
+
+TANKS = [
+    {'id': 1, 'organization_id': 1, 'imei': '868000000000001', 'height_mm': 2000},
+    {'id': 2, 'organization_id': 1, 'imei': '868000000000002', 'height_mm': 2000},
+    {'id': 3, 'organization_id': 2, 'imei': '868000000000003', 'height_mm': 2000},
+]
+
+
+def reading(imei, distance, **fields):
+    return dict(imei=imei, distance=distance, timestamp=1700000000, **fields)
+
+
+def test_rules_bind_to_organization_and_tank():
+    engine = RuleEngine([
+        {'id': 1, 'organization_id': 1, 'type': 'low_level'},
+        {'id': 2, 'organization_id': 2, 'tank_id': 3, 'type': 'critical_level'},
+        {'id': 3, 'organization_id': 1, 'type': 'low_level', 'is_active': False},
+    ], TANKS)
+
+    assert {imei: [rule.id for rule in rules] for imei, rules in engine.index.items()} == {
+        '868000000000001': [1], '868000000000002': [1], '868000000000003': [2],
+    }
+
+
+def test_trigger_hysteresis_and_resolve():
+    engine = RuleEngine([{'id': 1, 'organization_id': 1, 'type': 'low_level',
+                          'condition': {'below_percent': 20, 'for_readings': 2}}], TANKS)
+    imei = '868000000000001'
+
+    assert engine.evaluate(reading(imei, 1.9)) == []
+    events = engine.evaluate(reading(imei, 1.9))
+    assert [(e['state'], e['imei'], e['value']) for e in events] == [('triggered', imei, 5.0)]
+    assert engine.stats['active'] == 1
+    assert engine.active() == [(1, imei)]
+
+    # Between the threshold and threshold + hysteresis nothing changes
+    assert engine.evaluate(reading(imei, 1.55)) == []
+    assert engine.stats['active'] == 1
+
+    assert [e['state'] for e in engine.evaluate(reading(imei, 1.0))] == ['resolved']
+    assert engine.stats['active'] == 0
+    assert engine.active() == []
+
+
+def test_reload_keeps_raised_alerts():
+    rules = [{'id': 1, 'organization_id': 1, 'type': 'low_level'}]
+    engine = RuleEngine(rules, TANKS)
+    engine.evaluate(reading('868000000000001', 1.9))
+    engine.evaluate(reading('868000000000002', 1.9))
+    assert engine.stats['active'] == 2
+
+    engine.load(rules, TANKS)
+    assert engine.evaluate(reading('868000000000001', 1.9)) == []
+    assert engine.stats['active'] == 2
+
+    # Dropping a tank forgets its alert
+    engine.load(rules, TANKS[1:])
+    assert engine.stats['active'] == 1
+    assert engine.active() == [(1, '868000000000002')]
+
+
+def test_reading_without_value_is_ignored():
+    engine = RuleEngine([{'id': 1, 'organization_id': 1, 'type': 'low_level'}], TANKS)
+    assert engine.evaluate({'imei': '868000000000001'}) == []
+    assert engine.evaluate(reading('868000000000009', 1.9)) == []
+
+
+def test_invalid_rules():
+    with pytest.raises(RuleError):
+        CompiledRule({'id': 1, 'type': 'unknown'}, TANKS[0])
+    engine = RuleEngine([{'id': 1, 'organization_id': 1, 'type': 'low_level', 'condition': '{not json'}], TANKS)
+    assert engine.stats['invalid_rules'] == 1
+    assert engine.index == {}
+
+
+def test_invalid_binding_skips_only_its_tank():
+    tanks = [dict(TANKS[0], low_level_threshold='not a number'), TANKS[1]]
+    engine = RuleEngine([{'id': 1, 'organization_id': 1, 'type': 'low_level'}], tanks)
+    assert engine.stats['invalid_rules'] == 1
+    assert list(engine.index) == ['868000000000002']
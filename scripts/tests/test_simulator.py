@@ -0,0 +1,87 @@
+import asyncio
+import random
+
+from df555 import protocol
+from df555.simulator import LoadGenerator, VirtualSensor, percentile
+
+START = 1700000000
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 0) == 1
+    assert percentile([], 50) is None
+
+
+def test_virtual_sensor_reports_parse():
+    sensor = VirtualSensor(1, start_time=START)
+    sensor.frame_count = 0xFFFF
+
+    first = protocol.parse_frame(sensor.next_frame())
+    second = protocol.parse_frame(sensor.next_frame(interval=600))
+
+    # The device id is '1' + the 15-digit IMEI, like a real DF555
+    assert first['device_id'] == second['device_id'] == '1860000000000001'
+    assert (first['frame_count'], second['frame_count']) == (0, 1)
+    assert (first['timestamp'], second['timestamp']) == (START + 3600, START + 4200)
+    assert 0 <= first['height_mm'] <= sensor.tank_height_mm + 20
+
+
+def test_fleets_are_reproducible():
+    def frames(seed):
+        sensor = VirtualSensor(7, random.Random(seed), start_time=START)
+        return [sensor.next_frame() for _ in range(24)]
+
+    assert frames(1) == frames(1)
+    assert frames(1) != frames(2)
+
+
+def test_refill_sends_a_trigger_report():
+    sensor = VirtualSensor(3, start_time=START)
+    sensor.level = 0.3
+    sensor.drain_per_hour = 0.05
+
+    report_types = []
+    for _ in range(24):
+        report_types.append(protocol.parse_frame(sensor.next_frame())['report_type'])
+        if sensor.refilling:
+            break
+    assert report_types[-1] == protocol.REPORT_TRIGGER
+    assert len(report_types) > 1
+    assert set(report_types[:-1]) == {protocol.REPORT_HEARTBEAT}
+
+
+def run_against(ack, **options):
+    received = []
+
+    async def run():
+        async def handle(reader, writer):
+            received.append(await reader.read(1024))
+            writer.write(ack)
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            generator = LoadGenerator('127.0.0.1', port, sensors=3, rate=500, concurrency=4, timeout=2.0)
+            return await generator.run(**options)
+
+    return asyncio.run(run()), received
+
+
+def test_load_generator_counts_acks():
+    summary, received = run_against(b'OK\r\n', count=9)
+
+    assert summary['sent'] == summary['acked'] == 9
+    assert summary['failed'] == 0
+    assert summary['latency_ms']['max'] is not None
+    assert len({protocol.parse_frame(frame)['device_id'] for frame in received}) == 3
+
+
+def test_load_generator_counts_bad_acks():
+    summary, _ = run_against(b'ERROR\r\n', count=2)
+    assert summary['acked'] == 0
+    assert summary['failures'] == {'bad_ack': 2}
@@ -0,0 +1,100 @@
+import pytest
+
+from df555 import protocol
+from df555.sms import (
+    Provisioner, StubSmsGateway, commands_for, load_inventory, make_gateway, normalize_phone, parse_address,
+)
+
+FAST = dict(latency=(0.0, 0.05), seed=1)
+
+
+def provision(gateway, jobs, **options):
+    options = {'rate': 0, 'reply_timeout': 2.0, **options}
+    provisioner = Provisioner(gateway, **options)
+    results = provisioner.run(jobs)
+    return provisioner, {result['phone']: result for result in results}
+
+
+def test_parse_address():
+    assert parse_address('203.0.113.5:10560') == ('203.0.113.5', '10560')
+    assert parse_address('[2001:db8::1]:80') == ('[2001:db8::1]', '80')
+    for value in ('203.0.113.5', ':80', '203.0.113.5:'):
+        with pytest.raises(ValueError):
+            parse_address(value)
+
+
+def test_normalize_phone():
+    assert normalize_phone('+254 700-123 456') == normalize_phone('00254700123456') == '254700123456'
+    assert normalize_phone(None) == ''
+
+
+def test_commands_for():
+    commands = commands_for('config', '203.0.113.5', 10560, server2=('198.51.100.7', 10561), server_mode='02')
+    assert commands == [
+        protocol.build_server_command(1, '203.0.113.5', 10560),
+        protocol.build_server_command(2, '198.51.100.7', 10561),
+        protocol.build_command(protocol.CMD_SWITCH_FUNCTION, '02'),
+    ]
+    assert len(commands_for('query')) == len(commands_for('reset')) == 1
+    with pytest.raises(ValueError):
+        commands_for('config')
+    with pytest.raises(ValueError):
+        commands_for('reboot')
+
+
+def test_load_inventory_skips_rows_without_phone(tmp_path):
+    path = tmp_path / 'sims.csv'
+    path.write_text('phone_number,imei\n+254700000001,868000000000001\n,868000000000002\n')
+    assert [row['imei'] for row in load_inventory(str(path))] == ['868000000000001']
+
+
+def test_unknown_gateway():
+    assert isinstance(make_gateway('stub'), StubSmsGateway)
+    with pytest.raises(ValueError):
+        make_gateway('carrier-pigeon')
+
+
+def test_stub_sensors_are_provisioned():
+    gateway = StubSmsGateway(**FAST)
+    commands = commands_for('config', '203.0.113.5', 10560, server2=('198.51.100.7', 10561))
+    phones = ['+254700000001', '+254700000002', '+254700000003']
+
+    provisioner, results = provision(gateway, [(phone, commands) for phone in phones])
+
+    assert {result['status'] for result in results.values()} == {'ok'}
+    assert results[phones[0]]['replies'] == ['Server1:203.0.113.5;10560;OK', 'Server2:198.51.100.7;10561;OK']
+    assert gateway.devices[normalize_phone(phones[0])]['server2'] == '198.51.100.7;10561;'
+    assert provisioner.stats == {'sent': 6, 'replies': 6, 'unmatched': 0, 'retries': 0}
+
+
+def test_lost_messages_time_out_after_retries():
+    gateway = StubSmsGateway(loss=1.0, **FAST)
+
+    provisioner, results = provision(gateway, [('+254700000001', commands_for('query'))], reply_timeout=0.1)
+
+    assert results['+254700000001']['status'] == 'timeout'
+    assert results['+254700000001']['attempts'] == 3
+    assert provisioner.stats['retries'] == 2
+    assert provisioner.stats['replies'] == 0
+
+
+def test_rejected_command_stops_the_sequence():
+    gateway = StubSmsGateway(**FAST)
+    commands = [protocol.build_server_command(1, '203.0.113.5', 10560, password='1234')] + commands_for('query')
+
+    provisioner, results = provision(gateway, [('+254700000001', commands)])
+
+    assert results['+254700000001']['status'] == 'rejected'
+    assert results['+254700000001']['replies'] == ['Password error']
+    assert provisioner.stats['sent'] == 1
+
+
+def test_replies_from_unknown_numbers_are_counted():
+    gateway = StubSmsGateway(**FAST)
+    gateway._inbox.put({'from': '+254799999999', 'text': 'hello'})
+
+    provisioner, results = provision(gateway, [('+254700000001', commands_for('query'))])
+
+    assert results['+254700000001']['status'] == 'ok'
+    assert provisioner.stats['unmatched'] == 1
+    assert provisioner.stats['replies'] == 1
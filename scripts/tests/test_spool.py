@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from df555.spool import RECORD_HEADER, Spool, SpoolError
+
+SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_append_read_commit(tmp_path):
+    spool = Spool(str(tmp_path), segment_size=4096)
+    for i in range(10):
+        spool.append(b'record-%d' % i)
+    assert spool.pending == 10
+
+    records, position = spool.read(4)
+    assert records == [b'record-%d' % i for i in range(4)]
+    spool.commit(position, len(records))
+    assert spool.pending == 6
+    spool.close()
+
+    reopened = Spool(str(tmp_path), segment_size=4096)
+    assert reopened.pending == 6
+    assert reopened.read(100)[0] == [b'record-%d' % i for i in range(4, 10)]
+    reopened.close()
+
+
+def test_segments_roll_and_are_deleted(tmp_path):
+    spool = Spool(str(tmp_path), segment_size=256)
+    for i in range(40):
+        spool.append(b'x' * 50)
+    assert len([n for n in os.listdir(tmp_path) if n.endswith('.spool')]) > 1
+
+    records, position = spool.read(40)
+    assert len(records) == 40
+    spool.commit(position, len(records))
+    assert spool.pending == 0
+    assert len([n for n in os.listdir(tmp_path) if n.endswith('.spool')]) == 1
+    spool.close()
+
+
+def test_invalid_records(tmp_path):
+    spool = Spool(str(tmp_path), segment_size=256)
+    with pytest.raises(SpoolError):
+        spool.append(b'')
+    with pytest.raises(SpoolError):
+        spool.append(b'x' * 256)
+    spool.close()
+
+
+def test_replay_after_crash(tmp_path):
+    """Records survive a process killed without flush, close or commit"""
+    script = textwrap.dedent(f"""
+        import os
+        from df555.spool import Spool
+        spool = Spool({str(tmp_path)!r}, segment_size=4096)
+        for i in range(5):
+            spool.append(b'record-%d' % i)
+        records, position = spool.read(2)
+        spool.commit(position, len(records))
+        for i in range(5, 8):
+            spool.append(b'record-%d' % i)
+        os._exit(1)
+    """)
+    result = subprocess.run([sys.executable, '-c', script], cwd=SCRIPTS)
+    assert result.returncode == 1
+
+    spool = Spool(str(tmp_path), segment_size=4096)
+    assert spool.pending == 6
+    assert spool.read(100)[0] == [b'record-%d' % i for i in range(2, 8)]
+    spool.close()
+
+
+def test_torn_write_is_ignored(tmp_path):
+    spool = Spool(str(tmp_path), segment_size=4096)
+    spool.append(b'complete')
+    spool.close()
+
+    # Data of a second record landed but its header did not
+    path = os.path.join(tmp_path, sorted(n for n in os.listdir(tmp_path) if n.endswith('.spool'))[0])
+    with open(path, 'r+b') as f:
+        f.seek(RECORD_HEADER.size + len(b'complete') + RECORD_HEADER.size)
+        f.write(b'torn data')
+
+    spool = Spool(str(tmp_path), segment_size=4096)
+    assert spool.pending == 1
+    spool.append(b'next')
+    assert spool.read(10)[0] == [b'complete', b'next']
+    spool.close()
@@ -0,0 +1,103 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from df555.spool import Spool
+from df555.supervisor import GAUGES, Supervisor, adopt_spools, worker_options
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT'), reason='needs SO_REUSEPORT')
+
+
+def spool(directory, records):
+    spool = Spool(str(directory))
+    for record in records:
+        spool.append(record)
+    spool.close()
+
+
+def pending(directory):
+    spool = Spool(str(directory))
+    records, _ = spool.read(1000)
+    spool.close()
+    return records
+
+
+def test_worker_options():
+    options = worker_options({'spool_dir': '/var/spool/df555', 'analytics_state': '/var/lib/tanks.json'}, 2)
+    assert options == {'spool_dir': '/var/spool/df555/worker-2', 'analytics_state': '/var/lib/tanks.worker-2.json'}
+
+
+def test_spools_of_removed_workers_are_adopted(tmp_path):
+    for index in range(4):
+        spool(tmp_path / f'worker-{index}', [f'{index}-{i}'.encode() for i in range(3)])
+    (tmp_path / 'worker-3' / 'rejected.jsonl').write_text('{}\n')
+
+    assert adopt_spools(str(tmp_path), 2) == 6
+
+    assert pending(tmp_path / 'worker-0') == [b'0-0', b'0-1', b'0-2', b'2-0', b'2-1', b'2-2']
+    assert pending(tmp_path / 'worker-1') == [b'1-0', b'1-1', b'1-2', b'3-0', b'3-1', b'3-2']
+    assert not (tmp_path / 'worker-2').exists()
+    # The dead-letter file is kept
+    assert os.listdir(tmp_path / 'worker-3') == ['rejected.jsonl']
+
+    # Nothing is moved twice
+    assert adopt_spools(str(tmp_path), 2) == 0
+
+
+def test_switching_between_one_and_several_processes(tmp_path):
+    spool(tmp_path / 'worker-1', [b'a'])
+    assert adopt_spools(str(tmp_path), 1) == 1
+    assert pending(tmp_path) == [b'a']
+
+    assert adopt_spools(str(tmp_path), 2) == 1
+    assert pending(tmp_path / 'worker-0') == [b'a']
+    assert not any(name.startswith('segment-') for name in os.listdir(tmp_path))
+
+
+def test_totals_keep_counters_of_exited_workers():
+    supervisor = Supervisor(2, {})
+    supervisor.snapshots = {100: {'reports': 5, 'open_connections': 2}, 101: {'reports': 3, 'open_connections': 1}}
+    supervisor._retire(100)
+
+    totals = supervisor.totals()
+    assert totals['reports'] == 8
+    assert totals['open_connections'] == 1
+    assert 'open_connections' in GAUGES
+
+
+def test_workers_drain_on_sigterm(tmp_path):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    spool(tmp_path / 'worker-5', [b'127.0.0.1\nSENSOR1,1500'])
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'df555.gateway', '--host', '127.0.0.1', '--port', str(port), '--processes', '2',
+         '--spool-dir', str(tmp_path), '--api-url', 'http://127.0.0.1:9'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1) as conn:
+                    conn.sendall(b'SENSOR2,1200\x81')
+                    assert conn.recv(16) == b'OK\r\n'
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.1)
+        else:
+            pytest.fail('gateway did not start')
+    finally:
+        process.send_signal(signal.SIGTERM)
+        _, stderr = process.communicate(timeout=60)
+
+    assert b'Moved 1 spooled reports' in stderr
+    assert not (tmp_path / 'worker-5').exists()
+    # The API is unreachable: both reports stay spooled for the next start
+    assert sum(len(pending(tmp_path / f'worker-{index}')) for index in range(2)) == 2
@@ -0,0 +1,41 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from df555 import volume  # noqa: E402
+
+TANKS = [
+    {'shape': 'cylindrical', 'height_mm': 2000, 'diameter_mm': 1500},
+    {'shape': 'rectangular', 'height_mm': 1800, 'diameter_mm': 1200},
+    {'shape': 'spherical', 'height_mm': 2000, 'diameter_mm': 2000},
+    {'shape': 'horizontal', 'height_mm': 1600, 'diameter_mm': 1600, 'length_mm': 3000},
+    {'shape': 'horizontal', 'height_mm': 1600, 'diameter_mm': 1600, 'capacity_liters': 5000},
+    {'shape': 'custom', 'height_mm': 1000, 'strapping': [[0, 0], [500, 300], [1000, 1000]]},
+]
+
+
+@pytest.mark.parametrize('tank', TANKS, ids=lambda tank: tank['shape'])
+def test_table_matches_direct_calculation(tank):
+    levels = np.array([0, 1, 250, 499, 500, 777, tank['height_mm']])
+    expected = [volume.calculate_volume(tank, level) for level in levels]
+    assert volume.volumes(levels, volume.tank_table(tank)).tolist() == pytest.approx(expected, abs=0.01)
+
+
+def test_unknown_shape():
+    with pytest.raises(ValueError):
+        volume.volume_table('conical', 1000, 1000)
+
+
+def test_convert_clamps_levels():
+    tank = TANKS[0]
+    result = volume.convert(np.array([-100, 0, 500, 2000, 2500]), tank)
+    assert result['water_level_mm'].tolist() == [2000, 2000, 1500, 0, 0]
+    assert result['water_level_percentage'].tolist() == [100, 100, 75, 0, 0]
+    assert result['volume_liters'][0] == volume.calculate_volume(tank, 2000)
+
+
+def test_tables_are_cached_and_read_only():
+    first = volume.tank_table(TANKS[0])
+    assert volume.tank_table(dict(TANKS[0])) is first
+    with pytest.raises(ValueError):
+        first[1][0] = 1.0
@@ -2,36 +2,149 @@
 """
 Script to update Dingtek DF555 sensor configuration via SMS
 Sends command to configure sensor to send data to TCP server
+
+With --bulk, reads sensor phone numbers from a CSV/JSON inventory (e.g. a
+sim_cards export) and sends the commands through an SMS gateway adapter,
+waiting for and checking each sensor's reply (see df555.sms).
 """
 
+import argparse
 import sys
+import time
+
+from df555.protocol import (
+    CMD_SET_SERVER1, COMMAND_TYPE_QUERY, COMMAND_TYPE_RESET, build_command, build_server_command
+)
 
 def generate_config_command(phone_number, server, port):
     """
     Generate sensor configuration command
 
-    Format: 8002<password><server>;<port>;81
-    - 8002: Command prefix
-    - 999906: Default password (6 digits)
+    Format: 80029999<06><server>;<port>;81
+    - 8002: Command prefix (configure device parameters)
+    - 9999: Default Dingtek password
+    - 06: Command code (Server 1 address)
     - server: Domain/IP to send data to
     - port: TCP port number
     - 81: Command suffix
     """
-    password = "999906"  # Default Dingtek password
-    command = f"8002{password}{server};{port};81"
-    return command
+    return build_server_command(1, server, port)
+
+SERVER = "chenesa-shy-grass-3201.fly.dev"
+PORT = "8888"
+
+
+def bulk_provision(args):
+    """Send commands to every sensor in the inventory and report the replies"""
+    from df555 import sms
+
+    rows = sms.load_inventory(args.bulk)
+    if not rows:
+        print(f"✗ No rows with a phone_number in {args.bulk}")
+        return 1
+
+    jobs = []
+    for row in rows:
+        action = row.get('action') or args.action
+        try:
+            server2 = row.get('server2') or args.server2
+            commands = sms.commands_for(action, row.get('server') or args.server, row.get('port') or args.port,
+                                        server2=sms.parse_address(server2) if server2 else None,
+                                        server_mode=args.server_mode)
+        except ValueError as e:
+            print(f"✗ {row['phone_number']}: {e}")
+            return 1
+        jobs.append((row['phone_number'], commands))
+
+    if not args.gateway:
+        print("✗ Choose an SMS gateway: --gateway http (send real SMS), module:Class, "
+              "or stub (simulated sensors, nothing is sent)")
+        return 1
+
+    simulated = args.gateway == 'stub'
+    options = {}
+    if simulated:
+        options = {'latency': (args.stub_latency / 2, args.stub_latency * 1.5), 'loss': args.stub_loss, 'seed': 0}
+    try:
+        gateway = sms.make_gateway(args.gateway, **options)
+    except (sms.SmsError, ValueError, ImportError, AttributeError) as e:
+        print(f"✗ {e}")
+        return 1
+
+    print("\n" + "="*60)
+    print("BULK SENSOR PROVISIONING" + (" (SIMULATED - NO SMS SENT)" if simulated else ""))
+    print("="*60)
+    print(f"Sensors:     {len(jobs)}")
+    print(f"Action:      {args.action}")
+    print(f"Gateway:     {args.gateway} ({args.rate:g} SMS/s, {args.concurrency} concurrent)")
+    print("-"*60)
+
+    provisioner = sms.Provisioner(gateway, concurrency=args.concurrency, rate=args.rate,
+                                  reply_timeout=args.reply_timeout, max_attempts=args.attempts)
+    started = time.monotonic()
+
+    def report(result):
+        symbol = '✓' if result['status'] == 'ok' else '✗'
+        print(f"{symbol} {result['phone']:16} {result['status']:9} attempts={result['attempts']} "
+              f"{result['elapsed']}s")
+
+    try:
+        results = provisioner.run(jobs, on_result=None if args.quiet else report)
+    finally:
+        gateway.close()
+
+    if args.results:
+        sms.write_results(args.results, results)
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    print("-"*60)
+    print(f"Done in {time.monotonic() - started:.1f}s: " + ', '.join(f"{n} {status}" for status, n in sorted(counts.items())))
+    print(f"SMS {'simulated' if simulated else 'sent'}: {provisioner.stats['sent']} "
+          f"(retries {provisioner.stats['retries']}), replies: {provisioner.stats['replies']}")
+    if simulated:
+        print("⚠ Stub gateway: replies came from simulated sensors, no sensor was configured")
+    if args.results:
+        print(f"Results written to {args.results}")
+    print("="*60)
+    return 0 if counts.get('ok', 0) == len(results) else 1
+
 
 def main():
-    # Configuration
-    if len(sys.argv) > 1:
-        sensor_phone = sys.argv[1]
-    else:
+    parser = argparse.ArgumentParser(description='Generate or send DF555 configuration commands by SMS')
+    parser.add_argument('phone', nargs='?', help='Sensor phone number (prints the command to send by hand)')
+    parser.add_argument('--bulk', metavar='INVENTORY', help='CSV/JSON with a phone_number column to provision')
+    parser.add_argument('--action', choices=('config', 'query', 'reset'), default='config',
+                        help='Command to send in bulk mode (default: config)')
+    parser.add_argument('--server', default=SERVER, help=f'Server 1 host (default: {SERVER})')
+    parser.add_argument('--port', default=PORT, help=f'Server 1 port (default: {PORT})')
+    parser.add_argument('--server2', metavar='HOST:PORT', help='Also set the Server 2 address in bulk mode')
+    parser.add_argument('--server-mode', help="Also send a server mode, e.g. '02' for dual server")
+    parser.add_argument('--gateway', help="SMS gateway for --bulk: http, module:Class or stub "
+                                          "(simulated sensors, nothing is sent); required with --bulk")
+    parser.add_argument('--rate', type=float, default=1.0, help='SMS per second across all sensors')
+    parser.add_argument('--concurrency', type=int, default=50, help='Sensors provisioned at the same time')
+    parser.add_argument('--reply-timeout', type=float, default=120.0, help='Seconds to wait for each reply')
+    parser.add_argument('--attempts', type=int, default=3, help='Sends per command before giving up')
+    parser.add_argument('--results', help='Write per-sensor results to this CSV file')
+    parser.add_argument('--stub-latency', type=float, default=3.0, help='Mean reply latency of the stub gateway')
+    parser.add_argument('--stub-loss', type=float, default=0.0, help='Message loss rate of the stub gateway')
+    parser.add_argument('--quiet', action='store_true', help='Only print the summary')
+    args = parser.parse_args()
+
+    if args.bulk:
+        return bulk_provision(args)
+
+    if not args.phone:
         print("Usage: python3 update_sensor_config.py <sensor_phone_number>")
         print("Example: python3 update_sensor_config.py +254712345678")
+        print("        python3 update_sensor_config.py --bulk sim_cards.csv --gateway stub")
         sys.exit(1)
 
-    server = "chenesa-shy-grass-3201.fly.dev"
-    port = "8888"
+    sensor_phone = args.phone
+    server = args.server
+    port = args.port
 
     # Generate command
     command = generate_config_command(sensor_phone, server, port)
@@ -53,9 +166,10 @@ def main():
     print("4. Monitor logs: fly logs --app chenesa-shy-grass-3201 | grep 'TCP:'")
     print("\nAlternative Commands:")
     print("-"*60)
-    print(f"Query current config: 8001{999906}81")
-    print(f"Reset to defaults: 8000{999906}81")
+    print(f"Query current config: {build_command(CMD_SET_SERVER1, command_type=COMMAND_TYPE_QUERY)}")
+    print(f"Reset to defaults: {build_command(CMD_SET_SERVER1, command_type=COMMAND_TYPE_RESET)}")
     print("="*60)
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file